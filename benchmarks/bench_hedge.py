@@ -0,0 +1,84 @@
+"""Tail latency of `Measurement.retrieve` with and without request hedging.
+
+A local `MockServer` answers a fraction of REST requests late. With a
+`HedgePolicy`, a retrieve that has not been answered after the p95 latency
+is sent again on another connection and the first response wins. Runs
+fully offline:
+
+    python benchmarks/bench_hedge.py --calls 500 --slow-rate 0.03 --slow-latency 0.3
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from dfxapiclient.loadgen import percentile  # noqa: E402
+from dfxapiclient.measurements import Measurement  # noqa: E402
+from dfxapiclient.mockserver import MockServer  # noqa: E402
+from dfxapiclient.resilience import HedgePolicy, HttpClient, RetryPolicy  # noqa: E402
+from dfxapiclient.users import User  # noqa: E402
+from dfxapiclient.websocketHelper import WebsocketHandler  # noqa: E402
+
+
+def bench(server, token, measurement_id, name, http, calls):
+    measurement = Measurement("STUDY", server.rest_url, WebsocketHandler(token, server.websocket_url), 1, 1,
+                              token=token, http=http)
+    latencies = []
+    for _ in range(calls):
+        t0 = time.perf_counter()
+        measurement.retrieve(measurement_id)
+        latencies.append(time.perf_counter() - t0)
+    hedge = http.hedge.stats() if http.hedge else {"hedges": 0, "hedge_wins": 0}
+    return {
+        "policy": name,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "hedges": hedge["hedges"],
+        "hedge_wins": hedge["hedge_wins"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=500)
+    parser.add_argument("--slow-rate", type=float, default=0.03)
+    parser.add_argument("--slow-latency", type=float, default=0.3, help="seconds")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    asyncio.set_event_loop(asyncio.new_event_loop())  # `Measurement` creates an `asyncio.Queue`
+    rows = []
+    with MockServer(seed=args.seed) as server:
+        device_token = server.new_token()
+        user = User(server.rest_url, '', '', "bench@example.com", "password")
+        user.create(device_token)
+        token = user.login(device_token)
+        measurement_id = Measurement("STUDY", server.rest_url, None, 1, 1, token=token).create()
+
+        server.slow_rate = args.slow_rate
+        server.slow_latency = args.slow_latency
+        clients = {
+            "none": HttpClient(RetryPolicy()),
+            "hedged": HttpClient(RetryPolicy(), hedge=HedgePolicy()),
+        }
+        for name, http in clients.items():
+            rows.append(bench(server, token, measurement_id, name, http, args.calls))
+
+    print(f"{'policy':<8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'hedges':>7} {'wins':>6}")
+    for r in rows:
+        print(f"{r['policy']:<8} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['p99_ms']:>8.2f} "
+              f"{r['hedges']:>7} {r['hedge_wins']:>6}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""Guard the import cost of `dfxapiclient` with `python -X importtime`.
+
+`import dfxapiclient` must not load `requests`, `websockets` or the
+protobuf descriptors, and `from dfxapiclient import SimpleClient` must not
+load `websockets` or the protobuf descriptors. Exits non-zero if a heavy
+module is imported too early or the import takes longer than the budget:
+
+    python benchmarks/bench_import.py --budget-ms 50
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+
+CASES = [
+    ("import dfxapiclient", ("requests", "websockets", "google.protobuf", "dfxapiclient.measurements_pb2")),
+    ("from dfxapiclient import SimpleClient", ("websockets", "google.protobuf", "dfxapiclient.measurements_pb2")),
+]
+
+
+def importtime(statement: str):
+    """Run `statement` in a fresh interpreter and return the total time in
+    microseconds spent importing `dfxapiclient` modules, and the cumulative
+    import time of every module it imported."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", statement],
+                            cwd=ROOT,
+                            stderr=subprocess.PIPE,
+                            universal_newlines=True,
+                            check=True)
+    total = 0
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        modules[name.strip()] = int(cumulative)
+        # Top-level imports are indented by a single space
+        if name.startswith(" dfxapiclient"):
+            total += int(cumulative)
+    return total, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget-ms", type=float, default=50.0, help="maximum time for `import dfxapiclient`")
+    parser.add_argument("--runs", type=int, default=5, help="best of this many runs is reported")
+    args = parser.parse_args()
+
+    failed = False
+    for statement, forbidden in CASES:
+        runs = [importtime(statement) for _ in range(args.runs)]
+        best = min(total for total, _ in runs) / 1000
+        loaded = sorted(m for m in forbidden if m in runs[0][1])
+        print(f"{statement:<40} {best:8.2f} ms  heavy modules: {', '.join(loaded) or 'none'}")
+        if loaded:
+            failed = True
+        if statement == "import dfxapiclient" and best > args.budget_ms:
+            print(f"  over budget of {args.budget_ms} ms")
+            failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""Event loop lag while streaming chunks through a `SimpleClient`, and the
+stack captured for a call that blocks the loop.
+
+`--block` seconds of `time.sleep` are run on the loop every `--block-every`
+chunks, standing in for a blocking call in the client or in the caller's
+code. With `loop_debug` the client reports where it was blocked. Runs fully
+offline against a local `MockServer`:
+
+    python benchmarks/bench_looplag.py --chunks 40 --block 0.25
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from dfxapiclient.mockserver import MockServer, synthetic_chunks  # noqa: E402
+from dfxapiclient.simpleclient import SimpleClient  # noqa: E402
+
+
+def blocking_call(seconds):
+    time.sleep(seconds)
+
+
+async def run(server, config_file, args):
+    client = SimpleClient("LICENSE",
+                          "STUDY",
+                          "bench@example.com",
+                          "password",
+                          server="local",
+                          config_file=config_file,
+                          add_method="websocket",
+                          measurement_mode="BATCH",
+                          chunk_length=1,
+                          video_length=args.chunks,
+                          server_url=server.rest_url,
+                          websocket_url=server.websocket_url,
+                          loop_lag_threshold=args.threshold,
+                          loop_debug=True)
+    async def chunks():
+        for i, chunk in enumerate(synthetic_chunks(args.chunks, 16384, duration_s=0)):
+            if args.block and i % args.block_every == args.block_every - 1:
+                blocking_call(args.block)
+            yield chunk
+            await asyncio.sleep(0.02)
+
+    async for _ in client.stream(chunks(), shutdown=False):
+        pass
+    stats = client.stats()["loop"]
+    await client.shutdown()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=40)
+    parser.add_argument("--block", type=float, default=0.25, help="seconds, 0 to not block")
+    parser.add_argument("--block-every", type=int, default=10, help="chunks")
+    parser.add_argument("--threshold", type=float, default=0.1, help="seconds")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    with MockServer() as server, tempfile.TemporaryDirectory() as tmp:
+        stats = asyncio.run(run(server, os.path.join(tmp, "config.json"), args))
+
+    print(f"samples {stats['samples']}, lag p50 {stats['lag_p50_ms']:.1f}ms, p99 {stats['lag_p99_ms']:.1f}ms, "
+          f"max {stats['lag_max_ms']:.1f}ms, stalls {stats['stalls']} (> {stats['threshold_ms']:.0f}ms)")
+    for stall in stats["stacks"]:
+        print(f"\nblocked for {stall['lag_s'] * 1000:.0f}ms+ in:")
+        print(stall["stack"].rstrip().splitlines()[-2:][0].strip())
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(stats, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
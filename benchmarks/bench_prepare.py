@@ -0,0 +1,88 @@
+"""Throughput of add data request preparation (protobuf serialization for
+websocket, base64 and JSON for REST) on the event loop versus a
+`PayloadPreparer` process pool with an increasing number of workers:
+
+    python benchmarks/bench_prepare.py --payload-size 4194304 --chunks 64 --workers 0 1 2 4
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from dfxapiclient.measurements import data_frame_head  # noqa: E402
+from dfxapiclient.measurements_pb2 import DataRequest  # noqa: E402
+from dfxapiclient.payloadpool import PayloadPreparer  # noqa: E402
+
+
+def prepare_inline(method, i, payload, meta):
+    # As `Measurement.add_data_ws` and `add_data_rest` without a preparer
+    if method == "websocket":
+        data = DataRequest()
+        data.Params.ID = "bench"
+        data.ChunkOrder = i
+        data.Action = "CHUNK::PROCESS"
+        data.StartTime = i
+        data.EndTime = i + 1
+        data.Duration = 1.0
+        data.Meta = meta
+        return b''.join((data_frame_head("0000000001", data, len(payload)), payload))
+    data = {
+        "ChunkOrder": i,
+        "Action": "CHUNK::PROCESS",
+        "StartTime": i,
+        "EndTime": i + 1,
+        "Duration": 1.0,
+        "Meta": str(meta),
+        "Payload": base64.b64encode(payload).decode('utf-8')
+    }
+    return json.dumps(data)
+
+
+async def run(method, workers, chunks, payload, meta):
+    preparer = PayloadPreparer(workers) if workers else None
+    in_flight = asyncio.Semaphore(max(1, 2 * workers))
+
+    async def prepare(i):
+        async with in_flight:
+            if preparer is None:
+                return prepare_inline(method, i, payload, meta)
+            if method == "websocket":
+                return await preparer.prepare_ws("0000000001", "bench", i, "CHUNK::PROCESS", i, i + 1, 1.0, payload,
+                                                 meta)
+            return await preparer.prepare_rest(i, "CHUNK::PROCESS", i, i + 1, 1.0, payload, meta)
+
+    if preparer:
+        await prepare(0)  # Start the worker processes before timing
+    start = time.perf_counter()
+    await asyncio.gather(*(prepare(i) for i in range(chunks)))
+    elapsed = time.perf_counter() - start
+    if preparer:
+        preparer.shutdown()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--payload-size", type=int, default=4 * 2**20, help="bytes")
+    parser.add_argument("--chunks", type=int, default=64)
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 1, 2, 4])
+    args = parser.parse_args()
+
+    payload = os.urandom(args.payload_size)
+    meta = b'{"bench": true}'
+    total_mib = args.chunks * args.payload_size / 2**20
+
+    print(f"{'method':<10} {'workers':>7} {'MiB/s':>9} {'chunks/s':>9}")
+    for method in ("websocket", "REST"):
+        for workers in args.workers:
+            elapsed = asyncio.run(run(method, workers, args.chunks, payload, meta))
+            print(f"{method:<10} {workers or 'loop':>7} {total_mib / elapsed:>9.1f} {args.chunks / elapsed:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
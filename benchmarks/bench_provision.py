@@ -0,0 +1,85 @@
+"""Users created per second by `Provisioner` at different concurrencies, and a
+resumed run.
+
+A local `MockServer` answers every request after `--server-latency` seconds,
+standing in for the API's processing time and round trip. Runs fully offline:
+
+    python benchmarks/bench_provision.py --users 200 --server-latency 0.02
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from dfxapiclient.mockserver import MockServer  # noqa: E402
+from dfxapiclient.organizations import Organization  # noqa: E402
+from dfxapiclient.provision import Provisioner, read_users  # noqa: E402
+from dfxapiclient.resilience import HttpClient, RetryPolicy  # noqa: E402
+
+
+def write_users(path, number, prefix):
+    with open(path, 'w') as f:
+        f.write("FirstName,LastName,Email,Password,Gender,DateOfBirth,HeightCm,WeightKg\n")
+        for i in range(number):
+            f.write(f"User,{i},{prefix}{i}@example.com,password{i},female,1990-01-01,170,65\n")
+
+
+def provision(server, users, concurrency, rate=None, checkpoint=None):
+    organization = Organization('LICENSE', server.rest_url, http=HttpClient(RetryPolicy(), pool_size=concurrency))
+    token = organization.login(organization.registerLicense("bench")["Token"], "admin@example.com", "password",
+                               "ORG")["Token"]
+    provisioner = Provisioner(organization, token, concurrency=concurrency, rate=rate, checkpoint=checkpoint)
+    provisioner.run(users)
+    return provisioner.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--server-latency", type=float, default=0.02, help="seconds")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8, 16])
+    parser.add_argument("--rate", type=float, default=50, help="requests per second for the rate limited run")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    rows = []
+    with MockServer(slow_rate=1.0, slow_latency=args.server_latency) as server, \
+            tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "users.csv")
+        for concurrency in args.concurrency:
+            write_users(path, args.users, f"c{concurrency}-")
+            stats = provision(server, read_users(path), concurrency)
+            rows.append(dict(stats, run=f"concurrency {concurrency}"))
+
+        write_users(path, args.users, "rate-")
+        stats = provision(server, read_users(path), max(args.concurrency), rate=args.rate)
+        rows.append(dict(stats, run=f"rate {args.rate:g}/s"))
+
+        # Resume: the first half is done and checkpointed, the second run
+        # skips it; the checkpoint of one row is lost, so it is found existing
+        write_users(path, args.users, "resume-")
+        users = read_users(path)
+        checkpoint = os.path.join(tmp, "progress.json")
+        provision(server, users[:args.users // 2], max(args.concurrency), checkpoint=checkpoint)
+        with open(checkpoint) as f:
+            progress = json.load(f)
+        progress["done"].pop(users[0]["Email"])
+        with open(checkpoint, 'w') as f:
+            json.dump(progress, f)
+        stats = provision(server, users, max(args.concurrency), checkpoint=checkpoint)
+        rows.append(dict(stats, run="resumed"))
+
+    print(f"{'run':<16}{'created':>9}{'exists':>8}{'skipped':>9}{'failed':>8}{'users/s':>10}{'limited s':>11}")
+    for r in rows:
+        print(f"{r['run']:<16}{r['created']:>9}{r['exists']:>8}{r['skipped']:>9}{r['failed']:>8}"
+              f"{r['users_per_s']:>10.1f}{r['rate_limited_s']:>11.2f}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
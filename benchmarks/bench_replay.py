@@ -0,0 +1,109 @@
+"""Replay a websocket recording through `Measurement` to benchmark the
+parsing and dispatch paths of `add_data_ws` and `subscribeResults` without
+a network.
+
+Without `--recording`, a session is first recorded against a local
+`MockServer`:
+
+    python benchmarks/bench_replay.py --chunks 200 --rounds 5
+    python benchmarks/bench_replay.py --recording prod-session.wsrec --speed 1
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from dfxapiclient.measurements import Measurement  # noqa: E402
+from dfxapiclient.measurements_pb2 import SubscribeResultsRequest  # noqa: E402
+from dfxapiclient.mockserver import MockServer, synthetic_chunks  # noqa: E402
+from dfxapiclient.simpleclient import SimpleClient  # noqa: E402
+from dfxapiclient.wsrecord import RECEIVED, SENT, ReplayWebsocketHandler, read_frames  # noqa: E402
+
+
+async def record(path, chunks, payload_size, result_size):
+    with MockServer(result_size=result_size) as server, tempfile.TemporaryDirectory() as tmp:
+        client = SimpleClient("LICENSE",
+                              "STUDY",
+                              "bench@example.com",
+                              "password",
+                              server="local",
+                              config_file=os.path.join(tmp, "bench.config"),
+                              add_method="websocket",
+                              measurement_mode="BATCH",
+                              chunk_length=1,
+                              video_length=chunks,
+                              server_url=server.rest_url,
+                              websocket_url=server.websocket_url)
+        client.create_new_measurement()
+        client.ws_obj.start_recording(path)
+
+        async def drain():
+            for _ in range(chunks):
+                await client.received_data.get()
+
+        subscriber = asyncio.ensure_future(client.subscribe_to_results())
+        drainer = asyncio.ensure_future(drain())
+        for chunk in synthetic_chunks(chunks, payload_size, duration_s=0):
+            await client.add_chunk(chunk)
+        await asyncio.wait_for(asyncio.gather(drainer, subscriber), timeout=60)
+        await client.shutdown()
+        client.ws_obj.stop_recording()
+
+
+async def replay(path, speed, payload_size):
+    frames = read_frames(path)
+    sends = [f for d, _, f in frames if d == SENT]
+    uploads = sum(1 for f in sends if f[:4] == b'0506')
+    results = sum(1 for d, _, f in frames if d == RECEIVED and len(f) > 60)
+
+    ws_obj = ReplayWebsocketHandler(path, speed=speed)
+    measurement = Measurement("STUDY", "replay://", ws_obj, results, max(results, 1), mode="BATCH")
+    queue = asyncio.Queue()
+
+    request = SubscribeResultsRequest()
+    request.Params.ID = "replay"
+    request.RequestID = "0000000001"
+    data = b'05100000000001' + request.SerializeToString()
+
+    payload = bytes(payload_size)
+    start = time.perf_counter()
+    await ws_obj.connect_ws()
+    subscriber = asyncio.ensure_future(measurement.subscribeResults(data, chunk_num=0, result_queue=queue))
+    for i in range(uploads):
+        action = 'LAST::PROCESS' if i == uploads - 1 else 'CHUNK::PROCESS'
+        await measurement.add_data_ws("replay", i, action, 0, 0, 0.0, payload, b'')
+    await subscriber
+    elapsed = time.perf_counter() - start
+    await ws_obj.handle_close()
+    return elapsed, len(frames), queue.qsize()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--recording", help="existing recording to replay")
+    parser.add_argument("--chunks", type=int, default=200)
+    parser.add_argument("--payload-size", type=int, default=16384, help="bytes")
+    parser.add_argument("--result-size", type=int, default=8192, help="bytes")
+    parser.add_argument("--speed", type=float, default=0.0, help="replay speed factor, 0 for as fast as possible")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.recording
+        if not path:
+            path = os.path.join(tmp, "session.wsrec")
+            asyncio.run(record(path, args.chunks, args.payload_size, args.result_size))
+            print(f"recorded {len(read_frames(path))} frames ({os.path.getsize(path) / 1024:.0f} KiB)")
+
+        for n in range(args.rounds):
+            elapsed, frames, results = asyncio.run(replay(path, args.speed, args.payload_size))
+            print(f"round {n}: {frames} frames, {results} results in {elapsed * 1000:.1f} ms "
+                  f"({frames / elapsed:.0f} frames/s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+"""Success rate and latency of REST calls under injected faults, with and without retries.
+
+A local `MockServer` fails a fraction of REST requests with a JSON 503, an
+HTML 502 (as a proxy would) or a reset connection. Each policy creates
+measurements (not idempotent) and retrieves them (idempotent). Finally the
+server is stopped to show the circuit breaker failing calls fast. Runs fully
+offline:
+
+    python benchmarks/bench_resilience.py --calls 200 --fault-rate 0.2
+
+Before the benchmark, `check()` asserts the retry and circuit breaker
+behaviour against the same fault-injecting server (use `--check-only` to
+stop there): retry counts, a non-idempotent POST not repeated once its body
+may have been processed, and a circuit going open, half open and closed.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import requests  # noqa: E402
+
+from dfxapiclient.measurements import Measurement  # noqa: E402
+from dfxapiclient.mockserver import MockServer  # noqa: E402
+from dfxapiclient.resilience import CircuitBreaker, CircuitOpenError, HttpClient, RetryPolicy  # noqa: E402
+from dfxapiclient.users import User  # noqa: E402
+from dfxapiclient.websocketHelper import WebsocketHandler  # noqa: E402
+
+
+def login(server):
+    http = HttpClient(RetryPolicy(max_attempts=1))
+    device_token = server.new_token()
+    user = User(server.rest_url, '', '', "bench@example.com", "password", http=http)
+    user.create(device_token)
+    return user.login(device_token)
+
+
+def bench(server, token, name, policy, calls):
+    http = HttpClient(policy, failure_threshold=calls)  # Keep the breaker out of the success rate
+    measurement = Measurement("STUDY", server.rest_url, WebsocketHandler(token, server.websocket_url), 1, 1,
+                              token=token, http=http)
+    row = {"policy": name}
+    for call in ("create", "retrieve"):
+        ok, latencies = 0, []
+        for _ in range(calls):
+            t0 = time.perf_counter()
+            try:
+                if call == "create":
+                    measurement.create()
+                    ok += 1
+                elif 'ID' in measurement.retrieve():
+                    ok += 1
+            except (ValueError, ConnectionError, OSError):
+                pass
+            latencies.append(time.perf_counter() - t0)
+        latencies.sort()
+        row[f"{call}_ok"] = ok / calls
+        row[f"{call}_p99_ms"] = latencies[int(0.99 * (len(latencies) - 1))] * 1000
+    row["retries"] = http.policy.retries
+    row["budget_exhausted"] = http.policy.budget_exhausted
+    return row
+
+
+class _UndecodableAdapter(requests.adapters.HTTPAdapter):
+    """Fails every request with an error other than a connection error or timeout"""
+    def send(self, request, **kwargs):
+        raise requests.exceptions.ContentDecodingError("undecodable body")
+
+
+def check(server, token):
+    """Assert the retry and circuit breaker behaviour against `server`"""
+    url = server.rest_url
+    header = {'Authorization': 'Bearer ' + token}
+
+    def faulty(faults, rate=1.0):
+        server.faults, server.fault_rate, server.faults_injected = faults, rate, 0
+
+    # An idempotent GET is retried on 503 until `max_attempts`
+    faulty(("503", ))
+    http = HttpClient(RetryPolicy(max_attempts=3, base_delay=0.001), failure_threshold=100)
+    response = http.request('GET', url + '/users', headers=header)
+    assert response.status_code == 503, response.status_code
+    assert http.policy.retries == 2 and server.faults_injected == 3, (http.policy.retries, server.faults_injected)
+
+    # A POST is retried on 503 (not processed), but not on a 502 from a
+    # proxy or a connection reset after the body was sent
+    faulty(("503", ))
+    http = HttpClient(RetryPolicy(max_attempts=3, base_delay=0.001), failure_threshold=100)
+    http.request('POST', url + '/measurements', idempotent=False, headers=header, json={})
+    assert server.faults_injected == 3, server.faults_injected
+    for fault in ("502_html", "reset"):
+        faulty((fault, ))
+        http = HttpClient(RetryPolicy(max_attempts=3, base_delay=0.001), failure_threshold=100)
+        try:
+            response = http.request('POST', url + '/measurements', idempotent=False, headers=header, json={})
+            assert response.status_code == 502, response.status_code
+        except requests.exceptions.ConnectionError:
+            assert fault == "reset"
+        assert http.policy.retries == 0 and server.faults_injected == 1, (fault, server.faults_injected)
+
+    # Open after `failure_threshold` failures, half open after
+    # `reset_timeout`, open again when the trial fails, closed when it passes
+    faulty(("503", ))
+    http = HttpClient(RetryPolicy(max_attempts=1), failure_threshold=2, reset_timeout=0.1)
+    breaker = http.breaker(url)
+    for _ in range(2):
+        http.request('GET', url + '/users', headers=header)
+    assert breaker.state == breaker.OPEN, breaker.state
+    try:
+        http.request('GET', url + '/users', headers=header)
+        raise AssertionError("open circuit let a request through")
+    except CircuitOpenError:
+        pass
+    time.sleep(0.15)
+    assert breaker.allow() and breaker.state == breaker.HALF_OPEN, breaker.state
+    breaker.record_failure()
+    assert breaker.state == breaker.OPEN, breaker.state
+    time.sleep(0.15)
+    faulty(("503", ), rate=0.0)
+    assert http.request('GET', url + '/users', headers=header).status_code == 200
+    assert breaker.state == breaker.CLOSED, breaker.state
+
+    # A trial request failing with any other error reopens the circuit
+    # instead of leaving it half open
+    http = HttpClient(RetryPolicy(max_attempts=1), failure_threshold=1, reset_timeout=0.1)
+    http.session.mount(url, _UndecodableAdapter())
+    for _ in range(2):
+        try:
+            http.request('GET', url + '/users', headers=header)
+        except requests.exceptions.ContentDecodingError:
+            pass
+        assert http.breaker(url).state == CircuitBreaker.OPEN, http.breaker(url).state
+        time.sleep(0.15)
+    http.session.mount(url, requests.adapters.HTTPAdapter())
+    assert http.request('GET', url + '/users', headers=header).status_code == 200
+    assert http.breaker(url).state == CircuitBreaker.CLOSED
+
+
+def bench_outage(calls):
+    server = MockServer()
+    server.start()
+    url = server.rest_url
+    server.stop()  # Every connection is now refused
+
+    http = HttpClient(RetryPolicy(base_delay=0.01), failure_threshold=5, reset_timeout=60)
+    rejected = 0
+    start = time.perf_counter()
+    for _ in range(calls):
+        try:
+            http.request('GET', url + '/status')
+        except CircuitOpenError:
+            rejected += 1
+        except OSError:
+            pass
+    return {"calls": calls, "rejected": rejected, "elapsed_s": time.perf_counter() - start}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200, help="calls per endpoint and policy")
+    parser.add_argument("--fault-rate", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--check-only", action="store_true", help="only run the checks")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    with MockServer(seed=args.seed) as server:
+        check(server, login(server))
+    print("checks passed")
+    if args.check_only:
+        return
+
+    asyncio.set_event_loop(asyncio.new_event_loop())  # `Measurement` creates an `asyncio.Queue`
+    rows = []
+    with MockServer(seed=args.seed) as server:
+        token = login(server)
+        server.fault_rate = args.fault_rate
+        policies = {
+            "none": RetryPolicy(max_attempts=1),
+            "default": RetryPolicy(base_delay=0.01, budget_max=args.calls),
+        }
+        for name, policy in policies.items():
+            rows.append(bench(server, token, name, policy, args.calls))
+        injected = server.faults_injected
+
+    print(f"{injected} faults injected at rate {args.fault_rate}")
+    print(f"{'policy':<8} {'create ok':>10} {'create p99':>11} {'retrieve ok':>12} {'retrieve p99':>13} "
+          f"{'retries':>8} {'no budget':>10}")
+    for r in rows:
+        print(f"{r['policy']:<8} {r['create_ok']:>10.1%} {r['create_p99_ms']:>9.1f}ms {r['retrieve_ok']:>12.1%} "
+              f"{r['retrieve_p99_ms']:>11.1f}ms {r['retries']:>8} {r['budget_exhausted']:>10}")
+
+    outage = bench_outage(args.calls)
+    print(f"server down: {outage['rejected']} of {outage['calls']} calls rejected by the open circuit, "
+          f"{outage['elapsed_s'] * 1000:.0f}ms total")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({"fault_rate": args.fault_rate, "policies": rows, "outage": outage}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
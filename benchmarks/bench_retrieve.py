@@ -0,0 +1,90 @@
+"""Peak memory and time to the first result of `Measurement.retrieve` (the
+whole response decoded at once) and `Measurement.retrieve_stream` (parsed
+while it is downloaded), for a long measurement.
+
+The `MockServer` runs in a separate process, so that only the client's
+allocations are traced. Runs fully offline:
+
+    python benchmarks/bench_retrieve.py --chunks 1200 --result-size 16384
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from dfxapiclient.measurements import Measurement  # noqa: E402
+from dfxapiclient.mockserver import MockServer, _MockMeasurement  # noqa: E402
+
+
+def serve(conn, chunks, result_size):
+    with MockServer(result_size=result_size) as server:
+        token = server.new_token("bench@example.com")
+        measurement = _MockMeasurement("BENCH", "STUDY", "VIDEO", token)
+        measurement.status = "COMPLETE"
+        for i in range(chunks):  # As if `chunks` chunks had been added
+            measurement.results.append(server.make_result("BENCH", i, i * 5.0, i * 5.0 + 5))
+        server.measurements["BENCH"] = measurement
+        conn.send((server.rest_url, token))
+        conn.recv()  # Until the benchmark is done
+
+
+def run(measurement, stream):
+    tracemalloc.start()
+    start = time.perf_counter()
+    first = None
+    records = 0
+    if stream:
+        for _ in measurement.retrieve_stream("BENCH"):
+            first = first or time.perf_counter() - start
+            records += 1
+    else:
+        response = measurement.retrieve("BENCH")
+        for signal, entries in response["Results"].items():
+            for _ in entries:
+                first = first or time.perf_counter() - start
+                records += 1
+        del response
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        "method": "retrieve_stream" if stream else "retrieve",
+        "records": records,
+        "first_ms": first * 1000,
+        "total_ms": elapsed * 1000,
+        "peak_kib": peak // 1024
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=1200)
+    parser.add_argument("--result-size", type=int, default=16384, help="bytes per result chunk")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    conn, child = multiprocessing.Pipe()
+    server = multiprocessing.Process(target=serve, args=(child, args.chunks, args.result_size), daemon=True)
+    server.start()
+    rest_url, token = conn.recv()
+
+    measurement = Measurement("STUDY", rest_url, None, 0, 0, mode="VIDEO", token=token)
+    rows = [run(measurement, stream) for stream in (False, True, False, True)][2:]
+    conn.send(None)
+    server.join()
+
+    print(f"{'method':<18}{'records':>9}{'first ms':>10}{'total ms':>10}{'peak KiB':>10}")
+    for r in rows:
+        print(f"{r['method']:<18}{r['records']:>9}{r['first_ms']:>10.1f}{r['total_ms']:>10.1f}{r['peak_kib']:>10}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
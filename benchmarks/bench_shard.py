@@ -0,0 +1,104 @@
+"""Upload throughput of `ShardedUploader` with 1, 2, 4, ... worker processes.
+
+The `MockServer` runs in its own process. Each run uploads `--sessions`
+measurements of `--chunks` chunks; with enough cores for the workers and
+the server, throughput should grow close to linearly with the workers.
+Runs fully offline:
+
+    python benchmarks/bench_shard.py --sessions 32 --chunks 20 --workers 1 2 4
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from dfxapiclient.mockserver import MockServer, synthetic_chunks  # noqa: E402
+from dfxapiclient.shard import ShardedUploader  # noqa: E402
+
+
+def serve(conn, result_size):
+    with MockServer(result_size=result_size) as server:
+        conn.send((server.rest_url, server.websocket_url))
+        conn.recv()  # Until the benchmark is done
+
+
+def run(options, workers, sessions, chunks, payload_size):
+    data = [list(synthetic_chunks(chunks, payload_size, duration_s=0)) for _ in range(sessions)]
+    received = 0
+
+    def on_result(measurement_id, result):
+        nonlocal received
+        received += 1
+
+    with ShardedUploader(options, workers=workers, concurrency=4) as uploader:
+        start = time.perf_counter()
+        reports = asyncio.run(uploader.upload(data, on_result=on_result))
+        elapsed = time.perf_counter() - start
+        stats = uploader.stats()
+    return {
+        "workers": workers,
+        "chunks": sum(r["chunks"] for r in reports),
+        "results": received,
+        "errors": sum(len(r["errors"]) for r in reports),
+        "elapsed_s": elapsed,
+        "chunks_per_s": sum(r["chunks"] for r in reports) / elapsed,
+        "sessions_per_worker": [s["sessions"] for s in stats.values()],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=32)
+    parser.add_argument("--chunks", type=int, default=20, help="chunks per session")
+    parser.add_argument("--payload-size", type=int, default=65536, help="bytes")
+    parser.add_argument("--result-size", type=int, default=2048, help="bytes")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    conn, child = multiprocessing.Pipe()
+    server = multiprocessing.Process(target=serve, args=(child, args.result_size), daemon=True)
+    server.start()
+    rest_url, websocket_url = conn.recv()
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        options = {
+            "license_key": "BENCH",
+            "study_id": "BENCH",
+            "email": "bench@example.com",
+            "password": "password",
+            "server": "local",
+            "config_file": os.path.join(tmp, "bench.config"),
+            "add_method": "websocket",
+            "measurement_mode": "BATCH",
+            "chunk_length": 1,
+            "video_length": args.chunks,
+            "server_url": rest_url,
+            "websocket_url": websocket_url,
+        }
+        for workers in args.workers:
+            rows.append(run(options, workers, args.sessions, args.chunks, args.payload_size))
+    conn.send(None)
+    server.join()
+
+    base = rows[0]["chunks_per_s"] / rows[0]["workers"]
+    print(f"{os.cpu_count()} core(s)")
+    print(f"{'workers':>8}{'chunks/s':>10}{'speedup':>9}{'efficiency':>12}{'errors':>8}  sessions per worker")
+    for r in rows:
+        speedup = r["chunks_per_s"] / rows[0]["chunks_per_s"]
+        print(f"{r['workers']:>8}{r['chunks_per_s']:>10.1f}{speedup:>9.2f}"
+              f"{r['chunks_per_s'] / r['workers'] / base:>12.0%}{r['errors']:>8}  {r['sessions_per_worker']}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Add data acknowledgement latency under heavy result traffic, with one shared
+websocket vs split upload and subscription websockets.
+
+A local `MockServer` sends every result chunk of `--result-size` bytes and
+sends each connection's frames one after the other at `--bandwidth` bytes/s,
+so on a shared connection an acknowledgement queues behind the result frames
+ahead of it. Runs fully offline:
+
+    python benchmarks/bench_topology.py --chunks 60 --result-size 300000 --bandwidth 20000000
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from dfxapiclient.loadgen import percentile  # noqa: E402
+from dfxapiclient.mockserver import MockServer, synthetic_chunks  # noqa: E402
+from dfxapiclient.simpleclient import SimpleClient  # noqa: E402
+
+
+async def run_session(server, config_file, topology, chunks, payload_size, interval):
+    client = SimpleClient("LICENSE",
+                          "STUDY",
+                          "bench@example.com",
+                          "password",
+                          server="local",
+                          config_file=config_file,
+                          add_method="websocket",
+                          measurement_mode="BATCH",
+                          chunk_length=1,
+                          video_length=chunks,
+                          server_url=server.rest_url,
+                          websocket_url=server.websocket_url,
+                          ws_topology=topology)
+    client.create_new_measurement()
+    await client.warmup()
+
+    async def drain():
+        for _ in range(chunks):
+            await client.received_data.get()
+
+    subscriber = asyncio.ensure_future(client.subscribe_to_results())
+    drainer = asyncio.ensure_future(drain())
+
+    latencies = []
+    for chunk in synthetic_chunks(chunks, payload_size, duration_s=0):
+        t0 = time.perf_counter()
+        await client.add_chunk(chunk)
+        latencies.append(time.perf_counter() - t0)
+        await asyncio.sleep(interval)
+
+    await asyncio.wait_for(drainer, timeout=120)
+    await asyncio.wait_for(subscriber, timeout=120)
+    await client.shutdown()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=60)
+    parser.add_argument("--payload-size", type=int, default=16384, help="bytes")
+    parser.add_argument("--result-size", type=int, default=300000, help="bytes")
+    parser.add_argument("--bandwidth", type=float, default=20e6, help="bytes/s per websocket connection")
+    parser.add_argument("--interval", type=float, default=0.005, help="seconds between chunks")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    rows = []
+    with MockServer(result_size=args.result_size, ws_bandwidth=args.bandwidth) as server:
+        with tempfile.TemporaryDirectory() as tmp:
+            for topology in ("shared", "split"):
+                latencies = asyncio.run(
+                    run_session(server, os.path.join(tmp, "bench.config"), topology, args.chunks, args.payload_size,
+                                args.interval))
+                rows.append({
+                    "topology": topology,
+                    "ack_p50_ms": percentile(latencies, 50) * 1000,
+                    "ack_p99_ms": percentile(latencies, 99) * 1000,
+                    "ack_max_ms": max(latencies) * 1000,
+                })
+
+    print(f"{'topology':<10} {'ack p50 ms':>11} {'ack p99 ms':>11} {'ack max ms':>11}")
+    for r in rows:
+        print(f"{r['topology']:<10} {r['ack_p50_ms']:>11.2f} {r['ack_p99_ms']:>11.2f} {r['ack_max_ms']:>11.2f}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""Throughput and latency of REST vs websocket add data, against a local `MockServer`.
+
+Reports chunks/s, p50/p99 ack latency and peak traced memory per session.
+Runs fully offline:
+
+    python benchmarks/bench_transport.py --chunks 100 --payload-size 65536
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from dfxapiclient.loadgen import percentile  # noqa: E402
+from dfxapiclient.mockserver import MockServer, synthetic_chunks  # noqa: E402
+from dfxapiclient.simpleclient import SimpleClient  # noqa: E402
+
+
+async def run_session(server, config_file, add_method, chunks, payload_size):
+    client = SimpleClient("LICENSE",
+                          "STUDY",
+                          "bench@example.com",
+                          "password",
+                          server="local",
+                          config_file=config_file,
+                          add_method=add_method,
+                          measurement_mode="BATCH",
+                          chunk_length=1,
+                          video_length=chunks,
+                          server_url=server.rest_url,
+                          websocket_url=server.websocket_url)
+    client.create_new_measurement()
+
+    async def drain():
+        for _ in range(chunks):
+            await client.received_data.get()
+
+    subscriber = asyncio.ensure_future(client.subscribe_to_results())
+    drainer = asyncio.ensure_future(drain())
+
+    latencies = []
+    start = time.perf_counter()
+    for chunk in synthetic_chunks(chunks, payload_size, duration_s=0):
+        t0 = time.perf_counter()
+        await client.add_chunk(chunk)
+        latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - start
+
+    await asyncio.wait_for(drainer, timeout=30)
+    await asyncio.wait_for(subscriber, timeout=30)
+    await client.shutdown()
+    return elapsed, latencies
+
+
+def bench(server, add_method, chunks, payload_size):
+    with tempfile.TemporaryDirectory() as tmp:
+        tracemalloc.start()
+        elapsed, latencies = asyncio.run(
+            run_session(server, os.path.join(tmp, "bench.config"), add_method, chunks, payload_size))
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return {
+        "method": add_method,
+        "chunks_per_s": chunks / elapsed,
+        "ack_p50_ms": percentile(latencies, 50) * 1000,
+        "ack_p99_ms": percentile(latencies, 99) * 1000,
+        "peak_mem_kib": peak / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=100)
+    parser.add_argument("--payload-size", type=int, default=65536, help="bytes")
+    parser.add_argument("--result-size", type=int, default=2048, help="bytes")
+    parser.add_argument("--ack-latency", type=float, default=0.0, help="seconds")
+    parser.add_argument("--result-latency", type=float, default=0.0, help="seconds")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    rows = []
+    with MockServer(ack_latency=args.ack_latency, result_latency=args.result_latency,
+                    result_size=args.result_size) as server:
+        for method in ("REST", "websocket"):
+            rows.append(bench(server, method, args.chunks, args.payload_size))
+
+    print(f"{'method':<10} {'chunks/s':>10} {'ack p50 ms':>11} {'ack p99 ms':>11} {'peak KiB':>10}")
+    for r in rows:
+        print(f"{r['method']:<10} {r['chunks_per_s']:>10.1f} {r['ack_p50_ms']:>11.2f} "
+              f"{r['ack_p99_ms']:>11.2f} {r['peak_mem_kib']:>10.0f}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,25 @@
-from .simpleclient import SimpleClient
-from .measurements import Measurement
-from .users import User
-from .organizations import Organization
+import importlib
+
+__all__ = ['SimpleClient', 'Measurement', 'User', 'Organization']
+
+# The public classes are imported on first access, so that `import
+# dfxapiclient` does not pull in `requests`, `websockets` or the protobuf
+# descriptors for short-lived processes that only need part of the package.
+_lazy_attributes = {
+    'SimpleClient': '.simpleclient',
+    'Measurement': '.measurements',
+    'User': '.users',
+    'Organization': '.organizations',
+}
+
+
+def __getattr__(name):
+    if name in _lazy_attributes:
+        value = getattr(importlib.import_module(_lazy_attributes[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,393 @@
+import argparse
+import mmap
+import os
+import re
+import struct
+import sys
+import time
+
+# An archive is a directory of segment files holding the raw result bytes
+# back to back, and two index files of fixed size entries pointing into them:
+#
+#   index.idx    entries sorted by (measurement ID, chunk order), written by `compact`
+#   journal.idx  entries in the order they were appended since the last compaction
+#
+# Entry: [ measurement ID:40 ][ chunk order:uint32 ][ segment:uint32 ][ offset:uint64 ][ length:uint32 ]
+#        [ received at (ns since epoch):uint64 ]
+# All fields are big-endian, so the first 44 bytes of an entry compare
+# bytewise in (measurement ID, chunk order) order.
+_ENTRY = struct.Struct('>40sIIQIQ')
+_KEY_SIZE = 44
+MAX_ID_LENGTH = 40
+
+INDEX_FILE = "index.idx"
+JOURNAL_FILE = "journal.idx"
+_SEGMENT = re.compile(r'^seg-(\d{6})\.dat$')
+
+
+def _segment_name(number: int) -> str:
+    return f"seg-{number:06d}.dat"
+
+
+def _key(measurement_id: str, chunk_order: int = 0) -> bytes:
+    encoded = measurement_id.encode('utf-8')
+    if len(encoded) > MAX_ID_LENGTH:
+        raise ValueError(f"Measurement ID {measurement_id!r} is longer than {MAX_ID_LENGTH} bytes")
+    return encoded.ljust(MAX_ID_LENGTH, b'\0') + struct.pack('>I', chunk_order)
+
+
+def _segments(path: str) -> list:
+    """Segment numbers in the archive, ascending"""
+    numbers = [int(m.group(1)) for m in (_SEGMENT.match(f) for f in os.listdir(path)) if m]
+    return sorted(numbers)
+
+
+def _read_journal(path: str) -> list:
+    """All complete entries of the journal, in the order they were written"""
+    journal = os.path.join(path, JOURNAL_FILE)
+    if not os.path.isfile(journal):
+        return []
+    with open(journal, 'rb') as f:
+        data = f.read()
+    # A crash may leave a partial entry at the end, which is ignored
+    usable = len(data) - len(data) % _ENTRY.size
+    return [data[i:i + _ENTRY.size] for i in range(0, usable, _ENTRY.size)]
+
+
+class ArchiveWriter():
+    """`ArchiveWriter` appends result chunks to an archive.
+
+    Results are written to a new segment file (rolling over every
+    `segment_size` bytes) and indexed in the journal. Until the archive is
+    compacted, readers look journal entries up in memory; `compact()` merges
+    them into the sorted index. Only one writer may use an archive at a time.
+    """
+    def __init__(self, path: str, segment_size: int = 256 * 2**20, journal: bool = True):
+        """Create an `ArchiveWriter` object
+
+        Arguments:
+            path {str} -- Archive directory, created if missing
+
+        Keyword Arguments:
+            segment_size {int} -- Bytes after which a new segment is started (default: {256 MiB})
+            journal {bool} -- Record the appended results in the journal; only `compact` turns this off,
+                as it writes the index itself (default: {True})
+        """
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.segment_size = segment_size
+        self.journal = None
+        if journal:
+            self.journal = open(os.path.join(path, JOURNAL_FILE), 'ab')
+            # Drop a partial entry left by a crash, or every entry appended
+            # after it would be read misaligned
+            torn = self.journal.tell() % _ENTRY.size
+            if torn:
+                self.journal.truncate(self.journal.tell() - torn)
+                self.journal.seek(0, os.SEEK_END)
+        existing = _segments(path)
+        self.segment_number = existing[-1] if existing else 0
+        self.segment = None
+        self.offset = 0
+
+    def __roll(self):
+        if self.segment:
+            self.segment.close()
+        self.segment_number += 1
+        self.segment = open(os.path.join(self.path, _segment_name(self.segment_number)), 'ab')
+        self.offset = 0
+
+    def append(self, measurement_id: str, chunk_order: int, data: bytes, received_ns: int = None) -> bytes:
+        """Append one result chunk. A later chunk with the same measurement ID
+        and chunk order replaces an earlier one.
+
+        Arguments:
+            measurement_id {str} -- Measurement ID (at most 40 bytes)
+            chunk_order {int} -- Chunk number
+            data {bytes} -- Result
+
+        Keyword Arguments:
+            received_ns {int} -- When the result was received, in ns since the epoch (default: {None}, now)
+
+        Returns:
+            bytes -- The index entry of the result
+        """
+        key = _key(measurement_id, chunk_order)
+        if self.segment is None or self.offset >= self.segment_size:
+            self.__roll()
+        if received_ns is None:
+            received_ns = time.time_ns()
+
+        self.segment.write(data)
+        entry = _ENTRY.pack(key[:MAX_ID_LENGTH], chunk_order, self.segment_number, self.offset, len(data), received_ns)
+        if self.journal:
+            self.journal.write(entry)
+        self.offset += len(data)
+        return entry
+
+    def flush(self, fsync: bool = False):
+        """Flush buffered writes, the segment first so that the journal never
+        points at data that is not on disk.
+
+        Keyword Arguments:
+            fsync {bool} -- Also fsync the files (default: {False})
+        """
+        for f in (self.segment, self.journal):
+            if f:
+                f.flush()
+                if fsync:
+                    os.fsync(f.fileno())
+
+    def close(self):
+        """Flush and close the archive files"""
+        self.flush()
+        if self.segment:
+            self.segment.close()
+        if self.journal:
+            self.journal.close()
+
+
+class Archive():
+    """`Archive` gives random access to the results in an archive.
+
+    Lookups binary search the memory-mapped sorted index, so finding chunk
+    N of a measurement is O(log n), and a range scan is one search followed
+    by a sequential read. Results are returned as `memoryview` slices of the
+    memory-mapped segments, without copying; release them before calling
+    `close()`.
+    """
+    def __init__(self, path: str):
+        """Open an archive for reading
+
+        Arguments:
+            path {str} -- Archive directory
+        """
+        self.path = path
+        self.__maps = {}
+        self.__files = []
+
+        self.index = self.__map(os.path.join(path, INDEX_FILE))
+        self.count = len(self.index) // _ENTRY.size
+
+        # Entries appended since the last compaction; later ones win
+        self.journal = {}
+        for entry in _read_journal(path):
+            self.journal[entry[:_KEY_SIZE]] = entry
+
+    def __map(self, path: str):
+        if not os.path.isfile(path) or os.path.getsize(path) == 0:
+            return b''
+        f = open(path, 'rb')
+        self.__files.append(f)
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __entry(self, i: int) -> bytes:
+        return self.index[i * _ENTRY.size:(i + 1) * _ENTRY.size]
+
+    def __search(self, key: bytes) -> int:
+        """Index of the first sorted entry whose key is not less than `key`"""
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.index[mid * _ENTRY.size:mid * _ENTRY.size + _KEY_SIZE] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def __data(self, entry: bytes) -> memoryview:
+        _, _, segment, offset, length, _ = _ENTRY.unpack(entry)
+        if segment not in self.__maps:
+            self.__maps[segment] = self.__map(os.path.join(self.path, _segment_name(segment)))
+        return memoryview(self.__maps[segment])[offset:offset + length]
+
+    def get(self, measurement_id: str, chunk_order: int) -> memoryview:
+        """Look up one result
+
+        Arguments:
+            measurement_id {str} -- Measurement ID
+            chunk_order {int} -- Chunk number
+
+        Raises:
+            KeyError: If the result is not in the archive
+
+        Returns:
+            memoryview -- The result
+        """
+        key = _key(measurement_id, chunk_order)
+        entry = self.journal.get(key)
+        if entry is None:
+            i = self.__search(key)
+            if i < self.count and self.index[i * _ENTRY.size:i * _ENTRY.size + _KEY_SIZE] == key:
+                entry = self.__entry(i)
+        if entry is None:
+            raise KeyError((measurement_id, chunk_order))
+        return self.__data(entry)
+
+    def scan(self, measurement_id: str, start: int = 0, stop: int = None):
+        """Iterate over the results of a measurement in chunk order
+
+        Arguments:
+            measurement_id {str} -- Measurement ID
+
+        Keyword Arguments:
+            start {int} -- First chunk number (default: {0})
+            stop {int} -- Chunk number to stop before (default: {None}, the last chunk)
+
+        Yields:
+            tuple -- (chunk order, received at in ns since the epoch, result as a memoryview)
+        """
+        first = _key(measurement_id, start)
+        last = _key(measurement_id, stop) if stop is not None else _key(measurement_id, 2**32 - 1) + b'\xff'
+
+        entries = {}
+        i = self.__search(first)
+        while i < self.count:
+            entry = self.__entry(i)
+            if entry[:_KEY_SIZE] >= last:
+                break
+            entries[entry[:_KEY_SIZE]] = entry
+            i += 1
+        for key, entry in self.journal.items():
+            if first <= key < last:
+                entries[key] = entry
+
+        for key in sorted(entries):
+            _, chunk_order, _, _, _, received_ns = _ENTRY.unpack(entries[key])
+            yield chunk_order, received_ns, self.__data(entries[key])
+
+    def measurements(self) -> list:
+        """IDs of all measurements in the archive, sorted"""
+        ids = set(entry[:MAX_ID_LENGTH] for entry in self.journal.values())
+        i = 0
+        while i < self.count:
+            measurement = self.index[i * _ENTRY.size:i * _ENTRY.size + MAX_ID_LENGTH]
+            ids.add(measurement)
+            i = self.__search(measurement + b'\xff' * 5)  # Skip to the next measurement
+        return sorted(m.rstrip(b'\0').decode('utf-8') for m in ids)
+
+    def __len__(self):
+        return self.count + sum(1 for key in self.journal if not self.__indexed(key))
+
+    def __indexed(self, key: bytes) -> bool:
+        i = self.__search(key)
+        return i < self.count and self.index[i * _ENTRY.size:i * _ENTRY.size + _KEY_SIZE] == key
+
+    def close(self):
+        """Unmap and close the archive files"""
+        for m in self.__maps.values():
+            if isinstance(m, mmap.mmap):
+                m.close()
+        if isinstance(self.index, mmap.mmap):
+            self.index.close()
+        for f in self.__files:
+            f.close()
+        self.__maps = {}
+        self.__files = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def compact(path: str, segment_size: int = 256 * 2**20) -> int:
+    """Merge the journal into the sorted index and rewrite the segments in
+    index order, dropping replaced results. No writer may be using the
+    archive while it is compacted.
+
+    Arguments:
+        path {str} -- Archive directory
+
+    Keyword Arguments:
+        segment_size {int} -- Bytes after which a new segment is started (default: {256 MiB})
+
+    Returns:
+        int -- Number of results in the compacted archive
+    """
+    old_segments = _segments(path)
+    reader = Archive(path)
+    writer = ArchiveWriter(path, segment_size=segment_size, journal=False)
+    entries = []
+    try:
+        # The new segments are numbered after all existing ones, so the old
+        # index stays valid until it is replaced below.
+        for measurement_id in reader.measurements():
+            for chunk_order, received_ns, data in reader.scan(measurement_id):
+                entries.append(writer.append(measurement_id, chunk_order, data, received_ns))
+                data.release()
+        writer.flush(fsync=True)
+    finally:
+        writer.close()
+        reader.close()
+
+    # Replace the index atomically, then drop the journal and old segments
+    tmp = os.path.join(path, INDEX_FILE + ".tmp")
+    with open(tmp, 'wb') as f:
+        f.write(b''.join(entries))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, os.path.join(path, INDEX_FILE))
+    if os.path.isfile(os.path.join(path, JOURNAL_FILE)):
+        os.remove(os.path.join(path, JOURNAL_FILE))
+    for number in old_segments:
+        os.remove(os.path.join(path, _segment_name(number)))
+    return len(entries)
+
+
+def main():
+    """Entry point for the `dfx-archive` console script."""
+    from .resultsink import read_results
+
+    parser = argparse.ArgumentParser(description="Inspect, import into and compact DFX results archives")
+    commands = parser.add_subparsers(dest="command", required=True)
+    command = commands.add_parser("compact", help="merge the journal into the sorted index")
+    command.add_argument("archive")
+    command = commands.add_parser("import", help="add ResultSink .results files (named <measurement_id>.results)")
+    command.add_argument("archive")
+    command.add_argument("files", nargs="+")
+    command = commands.add_parser("ls", help="list measurements, or the chunks of one measurement")
+    command.add_argument("archive")
+    command.add_argument("measurement_id", nargs="?")
+    command = commands.add_parser("get", help="write one result to stdout")
+    command.add_argument("archive")
+    command.add_argument("measurement_id")
+    command.add_argument("chunk_order", type=int)
+    args = parser.parse_args()
+
+    if args.command == "compact":
+        start = time.perf_counter()
+        count = compact(args.archive)
+        print(f"{count} results compacted in {time.perf_counter() - start:.2f}s")
+    elif args.command == "import":
+        writer = ArchiveWriter(args.archive)
+        count = 0
+        for path in args.files:
+            measurement_id = os.path.splitext(os.path.basename(path))[0]
+            for chunk_order, received_ns, data in read_results(path):
+                writer.append(measurement_id, chunk_order, data, received_ns)
+                count += 1
+        writer.close()
+        print(f"{count} results imported")
+    elif args.command == "ls":
+        with Archive(args.archive) as archive:
+            if args.measurement_id:
+                for chunk_order, received_ns, data in archive.scan(args.measurement_id):
+                    print(f"{chunk_order}\t{received_ns}\t{len(data)}")
+                    data.release()
+            else:
+                for measurement_id in archive.measurements():
+                    print(measurement_id)
+    elif args.command == "get":
+        with Archive(args.archive) as archive:
+            try:
+                data = archive.get(args.measurement_id, args.chunk_order)
+            except KeyError:
+                raise SystemExit(f"{args.measurement_id} chunk {args.chunk_order} not found")
+            sys.stdout.buffer.write(data)
+            data.release()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+import asyncio
+import itertools
+import uuid
+
+from .measurements import Measurement
+from .websocketHelper import WebsocketHandler
+
+
+class BulkUploader():
+    """`BulkUploader` uploads pre-recorded chunks (e.g. `BATCH` or `VIDEO`
+    archives) as fast as possible instead of at the live chunk cadence.
+
+    The chunks are split into measurements of at most `max_chunks` chunks.
+    Each split gets its own measurement, `Measurement` object and websocket
+    connection, so that several splits can be uploaded and subscribed to
+    concurrently without their acknowledgements and results interleaving.
+    Chunks are read from the iterable one split at a time, only once the
+    split can be uploaded, so a recording never has to fit in memory.
+    """
+    def __init__(self, client, concurrency: int = 4, result_timeout: float = 60):
+        """Create a `BulkUploader` object
+
+        Arguments:
+            client {SimpleClient} -- Client providing the credentials, URLs and measurement settings
+
+        Keyword Arguments:
+            concurrency {int} -- Number of splits uploaded at the same time (default: {4})
+            result_timeout {float} -- Seconds to wait for the results after the last chunk (default: {60})
+        """
+        self.client = client
+        self.concurrency = concurrency
+        self.result_timeout = result_timeout
+
+    def split(self, chunks: list) -> list:
+        """Split `chunks` into lists of at most `max_chunks` chunks"""
+        size = max(1, self.client.max_chunks)
+        return [chunks[i:i + size] for i in range(0, len(chunks), size)]
+
+    async def upload(self, chunks, on_result=None) -> list:
+        """Upload all `chunks`, rolling over to a new measurement at every
+        `max_chunks` boundary, and collect all results.
+
+        Arguments:
+            chunks {Iterable[libdfx.Payload]} -- Prepared payload chunks, in order
+
+        Keyword Arguments:
+            on_result {callable} -- Called with the measurement ID and each result (bytes) as it arrives, instead
+                of collecting the results in the reports (default: {None})
+
+        Returns:
+            list -- One dict per measurement, in order (see `upload_split`)
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        size = max(1, self.client.max_chunks)
+        chunks = iter(chunks)
+
+        async def bounded(split):
+            try:
+                return await self.upload_split(split, on_result=on_result)
+            finally:
+                semaphore.release()
+
+        tasks = []
+        try:
+            while True:
+                await semaphore.acquire()  # The next split is read once it can be uploaded
+                split = list(itertools.islice(chunks, size))
+                if not split:
+                    semaphore.release()
+                    break
+                tasks.append(asyncio.ensure_future(bounded(split)))
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+        # A split that fails becomes a report with the error, instead of
+        # failing the whole upload and leaving the other splits running
+        reports = await asyncio.gather(*tasks, return_exceptions=True)
+        return [{
+            "measurement_id": '',
+            "chunks": 0,
+            "results": [],
+            "errors": [str(report) or repr(report)]
+        } if isinstance(report, Exception) else report for report in reports]
+
+    async def upload_split(self,
+                           chunks: list,
+                           measurement_id: str = '',
+                           results: asyncio.Queue = None,
+                           on_result=None) -> dict:
+        """Upload `chunks` into one measurement and collect its results.
+
+        Arguments:
+            chunks {list} -- At most `max_chunks` payload chunks
+
+        Keyword Arguments:
+            measurement_id {str} -- Existing measurement to use; a new one is created if empty (default: {''})
+            results {asyncio.Queue} -- Put the results into this queue as they arrive, instead of collecting them
+                in the report (default: {None})
+            on_result {callable} -- Called with the measurement ID and each result (bytes) as it arrives, instead
+                of collecting them in the report (default: {None})
+
+        Returns:
+            dict -- `measurement_id`, number of `chunks` acknowledged, `results` (list of bytes) and `errors`
+        """
+        from .measurements_pb2 import SubscribeResultsRequest
+
+        client = self.client
+        loop = asyncio.get_event_loop()
+        ws_obj = WebsocketHandler(client.user_token, client.websocket_url, budget=client.memory)
+        measurement = Measurement(client.study_id,
+                                  client.server_url,
+                                  ws_obj,
+                                  len(chunks),
+                                  len(chunks),
+                                  mode=client.measurement_mode,
+                                  token=client.user_token,
+                                  preparer=client.preparer,
+                                  http=client.http)
+        report = {"measurement_id": measurement_id, "chunks": 0, "results": [], "errors": []}
+
+        collect = results is None and on_result is None
+        if results is None:
+            results = asyncio.Queue()
+        subscriber = None
+        forwarder = None
+        try:
+            if not measurement_id:
+                measurement_id = await loop.run_in_executor(None, measurement.create)
+                report["measurement_id"] = measurement_id
+
+            if on_result:
+                async def forward():
+                    while True:
+                        on_result(measurement_id, await results.get())
+
+                forwarder = asyncio.ensure_future(forward())
+
+            # Subscribe before uploading so that no results are missed
+            request = SubscribeResultsRequest()
+            request.Params.ID = measurement_id
+            request.RequestID = uuid.uuid4().hex[:10]
+            data = f'{"0510":4}{request.RequestID:10}'.encode() + request.SerializeToString()
+
+            await ws_obj.connect_ws()
+            subscriber = asyncio.ensure_future(
+                measurement.subscribeResults(data,
+                                             chunk_num=0,
+                                             result_queue=results,
+                                             sink=client.sink,
+                                             measurement_id=measurement_id))
+
+            for i, chunk in enumerate(chunks):
+                if len(chunks) > 1 and i == 0:
+                    action = 'FIRST::PROCESS'
+                elif i == len(chunks) - 1:
+                    action = 'LAST::PROCESS'
+                else:
+                    action = 'CHUNK::PROCESS'
+
+                args = (measurement_id, i, action, chunk.start_time_s, chunk.end_time_s, chunk.duration_s,
+                        chunk.payload_data, chunk.metadata)
+                held = len(chunk.payload_data) + len(chunk.metadata or b'')
+                await client.memory.acquire("in_flight", held)  # Backpressure when the client's buffers are full
+                try:
+                    if client.conn_method == "websocket" or client.conn_method == "ws":
+                        response = await measurement.add_data_ws(*args)
+                        status = int(response[10:13].decode('utf-8')) if response else 0
+                        body = response.decode('utf-8', errors='replace') if response else ''
+                    else:
+                        response = await measurement.add_data_rest(*args)
+                        status = int(response.status_code)
+                        body = response.text
+                finally:
+                    client.memory.release("in_flight", held)
+
+                if status != 200:
+                    report["errors"].append(f"chunk {i}: status {status} {body}".strip())
+                    break
+                report["chunks"] += 1
+
+            if not report["errors"]:
+                await asyncio.wait_for(subscriber, timeout=self.result_timeout)
+        except asyncio.TimeoutError:
+            report["errors"].append(f"timed out waiting for results ({results.qsize()}/{len(chunks)})")
+        except Exception as e:
+            # Creating the measurement, connecting, uploading or subscribing
+            report["errors"].append(str(e) or repr(e))
+        finally:
+            # Runs on cancellation too, so that no subscriber or connection
+            # outlives the split
+            measurement.end = True
+            if subscriber is not None and not subscriber.done():
+                subscriber.cancel()
+                await asyncio.gather(subscriber, return_exceptions=True)
+            if forwarder is not None:
+                forwarder.cancel()
+                await asyncio.gather(forwarder, return_exceptions=True)
+                while not results.empty():
+                    on_result(measurement_id, results.get_nowait())
+            await ws_obj.handle_close()
+
+        while collect and not results.empty():
+            report["results"].append(results.get_nowait())
+        return report
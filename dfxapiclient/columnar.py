@@ -0,0 +1,172 @@
+import json
+from array import array
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("Columnar export needs NumPy, install it with `pip install dfxapiclient[columnar]`") from None
+    return numpy
+
+
+class ColumnarResults():
+    """`ColumnarResults` collects decoded results into contiguous columns,
+    one row per result chunk, so that analytics can be vectorized instead
+    of looping over records.
+
+    The row columns are `measurement_id`, `chunk_order`, `start_time` and
+    `end_time`. Each signal gets two columns: `<signal>.values`, all of its
+    values (`Data` divided by `Multiplier`) back to back, and
+    `<signal>.offsets`, where the values of row `i` are
+    `values[offsets[i]:offsets[i + 1]]`. Rows without a signal have an empty
+    slice.
+
+    Columns are accumulated in `array.array`s while adding results; NumPy is
+    only needed by `arrays()` and `save()`.
+    """
+    def __init__(self):
+        """Create an empty `ColumnarResults` object"""
+        self.measurement_id = []
+        self.chunk_order = array('q')
+        self.start_time = array('d')
+        self.end_time = array('d')
+        self.values = {}  # Signal -> array('d')
+        self.offsets = {}  # Signal -> array('q'), one entry per row plus one
+        self.rows = 0
+
+    def __add_row(self, measurement_id: str, chunk_order: int, start_time: float, end_time: float, signals: dict):
+        for signal in signals:
+            if signal not in self.values:
+                # A signal first seen now is empty in all earlier rows
+                self.values[signal] = array('d')
+                self.offsets[signal] = array('q', [0] * (self.rows + 1))
+
+        self.measurement_id.append(measurement_id)
+        self.chunk_order.append(chunk_order)
+        self.start_time.append(start_time)
+        self.end_time.append(end_time)
+        for signal, values in self.values.items():
+            for entry in signals.get(signal, ()):
+                multiplier = entry.get("Multiplier") or 1
+                if multiplier == 1:
+                    values.extend(entry.get("Data", ()))
+                else:
+                    values.extend(x / multiplier for x in entry.get("Data", ()))
+            self.offsets[signal].append(len(values))
+        self.rows += 1
+
+    def add_result(self, result, measurement_id: str = ''):
+        """Add one result chunk, as put into `received_data` by
+        `subscribe_to_results` or stored in a results archive.
+
+        Arguments:
+            result {Union[bytes, memoryview, str, dict]} -- JSON encoded or decoded result chunk
+
+        Keyword Arguments:
+            measurement_id {str} -- Measurement ID, if the result does not carry one (default: {''})
+        """
+        if isinstance(result, memoryview):
+            result = bytes(result)
+        if not isinstance(result, dict):
+            result = json.loads(result)
+        self.__add_row(result.get("ID", measurement_id),
+                       int(result.get("ChunkOrder", self.rows)),
+                       float(result.get("StartTime", 0)),
+                       float(result.get("EndTime", 0)),
+                       result.get("Results", {}))
+
+    def add_retrieved(self, response: dict):
+        """Add all results of a measurement as returned by `Measurement.retrieve`
+        (or `SimpleClient.retrieve_results`), one row per chunk order.
+
+        Arguments:
+            response {dict} -- Decoded retrieve response
+        """
+        chunks = {}
+        for signal, entries in response.get("Results", {}).items():
+            for entry in entries:
+                chunks.setdefault(int(entry.get("ChunkOrder", 0)), {}).setdefault(signal, []).append(entry)
+        for chunk_order in sorted(chunks):
+            self.__add_row(response.get("ID", ''), chunk_order, 0.0, 0.0, chunks[chunk_order])
+
+    def add_archive(self, archive, measurement_ids: list = None):
+        """Add the results of measurements from a results archive
+
+        Arguments:
+            archive {Archive} -- Open results archive
+
+        Keyword Arguments:
+            measurement_ids {list} -- Measurements to add (default: {None}, all of them)
+        """
+        for measurement_id in measurement_ids or archive.measurements():
+            for _, _, data in archive.scan(measurement_id):
+                self.add_result(data, measurement_id)
+                data.release()
+
+    def arrays(self) -> dict:
+        """The columns as NumPy arrays. The numeric arrays share memory with
+        this object's buffers instead of copying them, so no more results can
+        be added while they are in use (`BufferError`).
+
+        Returns:
+            dict -- Column name to `numpy.ndarray`
+        """
+        np = _numpy()
+        columns = {
+            "measurement_id": np.array(self.measurement_id, dtype=str),
+            "chunk_order": np.frombuffer(self.chunk_order, dtype=np.int64),
+            "start_time": np.frombuffer(self.start_time, dtype=np.float64),
+            "end_time": np.frombuffer(self.end_time, dtype=np.float64),
+        }
+        for signal in self.values:
+            columns[f"{signal}.values"] = np.frombuffer(self.values[signal], dtype=np.float64)
+            columns[f"{signal}.offsets"] = np.frombuffer(self.offsets[signal], dtype=np.int64)
+        return columns
+
+    def save(self, path: str, compressed: bool = False):
+        """Write the columns to a NumPy `.npz` file, which `load` reads back
+
+        Arguments:
+            path {str} -- Output path
+
+        Keyword Arguments:
+            compressed {bool} -- Compress the columns (default: {False})
+        """
+        np = _numpy()
+        (np.savez_compressed if compressed else np.savez)(path, **self.arrays())
+
+
+def load(path: str) -> dict:
+    """Read the columns saved by `ColumnarResults.save`
+
+    Arguments:
+        path {str} -- `.npz` file
+
+    Returns:
+        dict -- Column name to `numpy.ndarray`
+    """
+    np = _numpy()
+    with np.load(path) as data:
+        return {name: data[name] for name in data.files}
+
+
+def export_results(results, measurement_id: str = '', path: str = None) -> dict:
+    """Convert result chunks into columns (see `ColumnarResults`)
+
+    Arguments:
+        results {Iterable} -- Result chunks, e.g. drained from `received_data`
+
+    Keyword Arguments:
+        measurement_id {str} -- Measurement ID for results that do not carry one (default: {''})
+        path {str} -- Also save the columns to this `.npz` file (default: {None})
+
+    Returns:
+        dict -- Column name to `numpy.ndarray`
+    """
+    columns = ColumnarResults()
+    for result in results:
+        columns.add_result(result, measurement_id)
+    if path:
+        columns.save(path)
+    return columns.arrays()
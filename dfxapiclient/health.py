@@ -0,0 +1,189 @@
+import asyncio
+import time
+
+
+class RttEstimator():
+    """Smoothed round trip time and its variance, and the retransmission
+    style timeout derived from them, as specified for TCP in RFC 6298.
+    """
+    def __init__(self, initial_timeout: float = 5, min_timeout: float = 1, max_timeout: float = 60,
+                 alpha: float = 1 / 8, beta: float = 1 / 4, k: float = 4, granularity: float = 0.001):
+        """Create an `RttEstimator` object
+
+        Keyword Arguments:
+            initial_timeout {float} -- Timeout in seconds before the first sample (default: {5})
+            min_timeout {float} -- Lower bound of the timeout in seconds (default: {1})
+            max_timeout {float} -- Upper bound of the timeout in seconds (default: {60})
+            alpha {float} -- Gain of the smoothed RTT (default: {1/8})
+            beta {float} -- Gain of the RTT variance (default: {1/4})
+            k {float} -- Variance multiplier of the timeout (default: {4})
+            granularity {float} -- Clock granularity in seconds (default: {0.001})
+        """
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.alpha = alpha
+        self.beta = beta
+        self.k = k
+        self.granularity = granularity
+
+        self.srtt = None
+        self.rttvar = None
+        self.last = None
+        self.samples = 0
+        self.timeout = initial_timeout
+
+    def sample(self, rtt: float):
+        """Add one RTT measurement, in seconds"""
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - self.beta) * self.rttvar + self.beta * abs(self.srtt - rtt)
+            self.srtt = (1 - self.alpha) * self.srtt + self.alpha * rtt
+        self.last = rtt
+        self.samples += 1
+        timeout = self.srtt + max(self.granularity, self.k * self.rttvar)
+        self.timeout = min(self.max_timeout, max(self.min_timeout, timeout))
+
+    def backoff(self):
+        """Double the timeout after it expired without a response"""
+        self.timeout = min(self.max_timeout, self.timeout * 2)
+
+
+class ConnectionHealth():
+    """`ConnectionHealth` monitors one websocket connection.
+
+    While connected it sends a ping every `ping_interval` seconds and feeds
+    the pong RTTs into an `RttEstimator`, whose timeout becomes the adaptive
+    receive timeout. Acknowledgement latencies of add data requests (network
+    plus server processing) are tracked by a second estimator, giving the
+    adaptive ack timeout. An ack that is later than that triggers an
+    immediate ping instead of waiting for the next interval.
+
+    After `dead_after` consecutive unanswered pings the peer is considered
+    dead: `dead` is set and the connection is closed, so that pending
+    receives fail instead of waiting forever.
+    """
+    def __init__(self, ping_interval: float = 10, dead_after: int = 3, initial_timeout: float = 5,
+                 min_timeout: float = 1, max_timeout: float = 60):
+        """Create a `ConnectionHealth` object
+
+        Keyword Arguments:
+            ping_interval {float} -- Seconds between pings (default: {10})
+            dead_after {int} -- Consecutive unanswered pings before the peer is considered dead (default: {3})
+            initial_timeout {float} -- Timeouts in seconds before any RTT was measured (default: {5})
+            min_timeout {float} -- Lower bound of the adaptive timeouts in seconds (default: {1})
+            max_timeout {float} -- Upper bound of the adaptive timeouts in seconds (default: {60})
+        """
+        self.ping_interval = ping_interval
+        self.dead_after = dead_after
+        self.rtt = RttEstimator(initial_timeout, min_timeout, max_timeout)
+        self.ack = RttEstimator(initial_timeout, min_timeout, max_timeout)
+
+        self.dead = False
+        self.pings_sent = 0
+        self.pongs_received = 0
+        self.missed_pings = 0  # Consecutive
+        self.late_acks = 0
+        self.connected_at = None
+        self.last_pong_at = None
+
+        self.task = None
+        self.probe_now = None
+
+    @property
+    def recv_timeout(self) -> float:
+        """Adaptive receive timeout in seconds"""
+        return self.rtt.timeout
+
+    @property
+    def ack_timeout(self) -> float:
+        """Adaptive add data acknowledgement timeout in seconds"""
+        return self.ack.timeout
+
+    def ack_sample(self, latency: float):
+        """Record the acknowledgement latency of one add data request, in seconds"""
+        if latency > self.ack.timeout:
+            self.late_acks += 1
+        self.ack.sample(latency)
+
+    def probe(self):
+        """Ping now, e.g. because a response is overdue"""
+        if self.probe_now:
+            self.probe_now.set()
+
+    def start(self, ws):
+        """Start monitoring a newly connected websocket
+
+        Arguments:
+            ws {websockets.WebSocketClientProtocol} -- Connected websocket
+        """
+        self.stop()
+        self.dead = False
+        self.missed_pings = 0
+        self.connected_at = time.monotonic()
+        self.probe_now = asyncio.Event()
+        if self.ping_interval:
+            self.task = asyncio.ensure_future(self.__monitor(ws))
+
+    def stop(self):
+        """Stop monitoring"""
+        if self.task:
+            self.task.cancel()
+            self.task = None
+
+    async def __monitor(self, ws):
+        while not ws.closed:
+            try:
+                await asyncio.wait_for(self.probe_now.wait(), timeout=self.ping_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.probe_now.clear()
+
+            start = time.perf_counter()
+            try:
+                pong = await ws.ping()
+                self.pings_sent += 1
+                await asyncio.wait_for(pong, timeout=self.rtt.timeout)
+            except asyncio.TimeoutError:
+                self.missed_pings += 1
+                self.rtt.backoff()
+                if self.missed_pings >= self.dead_after:
+                    self.dead = True
+                    await ws.close()
+                    return
+                continue
+            except Exception:  # Connection closed
+                return
+
+            self.pongs_received += 1
+            self.missed_pings = 0
+            self.last_pong_at = time.monotonic()
+            self.rtt.sample(time.perf_counter() - start)
+
+    def stats(self) -> dict:
+        """Connection health statistics, for alerting on degraded links
+
+        Returns:
+            dict -- RTT and ack latency estimates in ms, timeouts in seconds, and ping counters
+        """
+        def ms(value):
+            return None if value is None else value * 1000
+
+        now = time.monotonic()
+        return {
+            "srtt_ms": ms(self.rtt.srtt),
+            "rttvar_ms": ms(self.rtt.rttvar),
+            "last_rtt_ms": ms(self.rtt.last),
+            "recv_timeout_s": self.recv_timeout,
+            "ack_srtt_ms": ms(self.ack.srtt),
+            "ack_rttvar_ms": ms(self.ack.rttvar),
+            "ack_timeout_s": self.ack_timeout,
+            "pings_sent": self.pings_sent,
+            "pongs_received": self.pongs_received,
+            "missed_pings": self.missed_pings,
+            "late_acks": self.late_acks,
+            "dead": self.dead,
+            "connected_s": None if self.connected_at is None else now - self.connected_at,
+            "since_last_pong_s": None if self.last_pong_at is None else now - self.last_pong_at,
+        }
@@ -0,0 +1,247 @@
+import argparse
+import asyncio
+import json
+import mmap
+import os
+import re
+
+from .bulkupload import BulkUploader
+
+CHECKPOINT_FILE = ".dfx-ingest.json"
+
+
+class ChunkFile():
+    """One archived payload chunk, read from a directory.
+
+    A chunk is stored as `<name>.payload` (raw SDK payload data), with
+    optional `<name>.meta` (payload metadata) and `<name>.json` (payload
+    properties: `chunk_number`, `number_chunks`, `valid`, `start_frame`,
+    `end_frame`, `first_chunk_start_time_s`, `start_time_s`, `end_time_s`
+    and `duration_s`). It has the attributes `SimpleClient.add_chunk` reads
+    from a `libdfx.Payload`; the payload itself is memory-mapped, not read
+    into RAM, and copied straight from the mapping into the request.
+    """
+    def __init__(self, directory: str, name: str, chunk_number: int = 0, number_chunks: int = 1):
+        """Create a `ChunkFile` object
+
+        Arguments:
+            directory {str} -- Directory holding the chunk files
+            name {str} -- Chunk name, i.e. the file name without extension
+
+        Keyword Arguments:
+            chunk_number {int} -- Chunk number if the properties have none, e.g. its position in the directory
+                (default: {0})
+            number_chunks {int} -- Number of chunks in the recording if the properties have none (default: {1})
+        """
+        self.name = name
+        self.path = os.path.join(directory, name + ".payload")
+
+        properties = {}
+        if os.path.isfile(os.path.join(directory, name + ".json")):
+            with open(os.path.join(directory, name + ".json")) as f:
+                properties = json.load(f)
+        self.metadata = b''
+        if os.path.isfile(os.path.join(directory, name + ".meta")):
+            with open(os.path.join(directory, name + ".meta"), 'rb') as f:
+                self.metadata = f.read()
+
+        self.chunk_number = int(properties.get("chunk_number", chunk_number))
+        self.number_chunks = int(properties.get("number_chunks", number_chunks))
+        self.valid = bool(properties.get("valid", True))
+        self.start_frame = int(properties.get("start_frame", 0))
+        self.end_frame = int(properties.get("end_frame", 0))
+        self.duration_s = float(properties.get("duration_s", 5))
+        self.first_chunk_start_time_s = float(properties.get("first_chunk_start_time_s", 0))
+        self.start_time_s = int(properties.get("start_time_s", 0))
+        self.end_time_s = int(properties.get("end_time_s", self.start_time_s + self.duration_s))
+
+        self._file = None
+        self._map = None
+
+    @property
+    def payload_data(self):
+        """The payload, memory-mapped on first access"""
+        if self._map is None:
+            self._file = open(self.path, 'rb')
+            if os.fstat(self._file.fileno()).st_size == 0:
+                self._map = b''
+            else:
+                self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map
+
+    def close(self):
+        """Unmap the payload"""
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        if self._file:
+            self._file.close()
+        self._map = None
+        self._file = None
+
+
+def scan(directory: str) -> list:
+    """Return the chunk names in `directory`, in natural order (so that
+    `chunk_2` sorts before `chunk_10`)."""
+    def natural(name):
+        return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', name)]
+
+    names = [f[:-len(".payload")] for f in os.listdir(directory) if f.endswith(".payload")]
+    return sorted(names, key=natural)
+
+
+class Ingest():
+    """`Ingest` re-uploads a directory of archived chunk files.
+
+    Chunks are grouped into measurements of at most `max_chunks` chunks and
+    fed to `BulkUploader.upload_split` with bounded concurrency. Progress is
+    checkpointed in the directory after every completed measurement, so a
+    restarted ingest skips the chunks that were already uploaded. A
+    measurement that was interrupted part way is uploaded again from the
+    start into a new measurement.
+
+    Results are not kept: they are written to the client's `receive_folder`
+    if it has one, and passed to the `on_result` callback of `run()`.
+    """
+    def __init__(self, client, directory: str, concurrency: int = 4, result_timeout: float = 60):
+        """Create an `Ingest` object
+
+        Arguments:
+            client {SimpleClient} -- Client providing the credentials, URLs and measurement settings
+            directory {str} -- Directory of chunk files
+
+        Keyword Arguments:
+            concurrency {int} -- Number of measurements uploaded at the same time (default: {4})
+            result_timeout {float} -- Seconds to wait for each measurement's results (default: {60})
+        """
+        self.client = client
+        self.directory = directory
+        self.uploader = BulkUploader(client, concurrency=concurrency, result_timeout=result_timeout)
+        self.concurrency = concurrency
+        self.checkpoint_path = os.path.join(directory, CHECKPOINT_FILE)
+        self.checkpoint = self.load_checkpoint()
+
+    def load_checkpoint(self) -> dict:
+        if os.path.isfile(self.checkpoint_path):
+            with open(self.checkpoint_path) as f:
+                return json.load(f)
+        return {"done": {}, "measurements": []}
+
+    def save_checkpoint(self):
+        # Write to a temporary file and rename, so that a crash never
+        # leaves a truncated checkpoint behind.
+        tmp = self.checkpoint_path + ".tmp"
+        with open(tmp, 'w') as f:
+            json.dump(self.checkpoint, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.checkpoint_path)
+
+    def pending(self) -> list:
+        """Chunk names not yet uploaded"""
+        return [name for name in scan(self.directory) if name not in self.checkpoint["done"]]
+
+    async def run(self, on_measurement=None, on_result=None) -> list:
+        """Upload all pending chunks.
+
+        Keyword Arguments:
+            on_measurement {callable} -- Called with each completed measurement's report (default: {None})
+            on_result {callable} -- Called with the measurement ID and each result (bytes) as it arrives
+                (default: {None})
+
+        Returns:
+            list -- One report per measurement uploaded in this run (see `BulkUploader.upload_split`), without
+                the results
+        """
+        loop = asyncio.get_running_loop()
+        numbers = {name: i for i, name in enumerate(scan(self.directory))}
+        names = self.pending()
+        size = max(1, self.client.max_chunks)
+        groups = [names[i:i + size] for i in range(0, len(names), size)]
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def upload(group):
+            async with semaphore:
+                chunks = [ChunkFile(self.directory, name, numbers[name], len(numbers)) for name in group]
+                try:
+                    report = await self.uploader.upload_split(chunks, on_result=on_result or _discard)
+                finally:
+                    for chunk in chunks:
+                        chunk.close()
+
+            report["files"] = group
+            if not report["errors"]:
+                for name in group:
+                    self.checkpoint["done"][name] = report["measurement_id"]
+                self.checkpoint["measurements"].append(report["measurement_id"])
+                await loop.run_in_executor(None, self.save_checkpoint)
+            if on_measurement:
+                on_measurement(report)
+            return report
+
+        return await asyncio.gather(*(upload(group) for group in groups))
+
+
+def _discard(measurement_id: str, result: bytes):
+    pass
+
+
+def main():
+    """Entry point for the `dfx-ingest` console script."""
+    from .simpleclient import SimpleClient
+
+    parser = argparse.ArgumentParser(description="Upload a directory of archived DFX SDK payload chunks")
+    parser.add_argument("directory", help="directory of <name>.payload (+ .meta, .json) chunk files")
+    parser.add_argument("--license-key", required=True)
+    parser.add_argument("--study-id", required=True)
+    parser.add_argument("--email", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--server", default="prod")
+    parser.add_argument("--server-url", help="custom REST URL for --server")
+    parser.add_argument("--websocket-url", help="custom websocket URL for --server")
+    parser.add_argument("--config-file", help="SimpleClient config file")
+    parser.add_argument("--add-method", default="websocket", choices=["REST", "websocket"])
+    parser.add_argument("--measurement-mode", default="BATCH", choices=["DISCRETE", "BATCH", "VIDEO", "STREAMING"])
+    parser.add_argument("--chunk-length", type=float, default=5, help="chunk duration in seconds")
+    parser.add_argument("--concurrency", type=int, default=4, help="measurements uploaded at the same time")
+    parser.add_argument("--result-timeout", type=float, default=60, help="seconds")
+    parser.add_argument("--results", help="append the results to this JSONL file as they arrive")
+    args = parser.parse_args()
+
+    client = SimpleClient(args.license_key,
+                          args.study_id,
+                          args.email,
+                          args.password,
+                          server=args.server,
+                          config_file=args.config_file,
+                          add_method=args.add_method,
+                          measurement_mode=args.measurement_mode,
+                          chunk_length=args.chunk_length,
+                          server_url=args.server_url,
+                          websocket_url=args.websocket_url)
+    ingest = Ingest(client, args.directory, concurrency=args.concurrency, result_timeout=args.result_timeout)
+    print(f"{len(ingest.pending())} chunk(s) to upload, {len(ingest.checkpoint['done'])} already done")
+
+    counts = {}
+    results_file = open(args.results, 'a') if args.results else None
+
+    def result(measurement_id, data):
+        counts[measurement_id] = counts.get(measurement_id, 0) + 1
+        if results_file:
+            results_file.write(json.dumps({"measurement_id": measurement_id, "result": data.decode()}) + "\n")
+
+    def report(r):
+        status = "; ".join(r["errors"]) or "ok"
+        print(f"{r['measurement_id'] or '-'}: {r['chunks']}/{len(r['files'])} chunks, "
+              f"{counts.pop(r['measurement_id'], 0)} results, {status}")
+
+    try:
+        reports = asyncio.run(ingest.run(on_measurement=report, on_result=result))
+    finally:
+        if results_file:
+            results_file.close()
+    if any(r["errors"] for r in reports):
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
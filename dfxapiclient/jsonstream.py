@@ -0,0 +1,180 @@
+import codecs
+import json
+import re
+from collections import namedtuple
+
+from .resilience import parse_json
+
+RetrieveRecord = namedtuple("RetrieveRecord", ["signal", "entry"])
+RetrieveRecord.__doc__ = "One entry of a signal in a retrieve response, e.g. a chunk's `Data` and `Multiplier`"
+
+_decoder = json.JSONDecoder()
+_END_OF_TOKEN = re.compile(r'[\s,}\]]')
+
+
+class _Reader():
+    """Text buffer over an iterable of byte chunks, holding only what has
+    not been parsed yet."""
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self, size: int = 0) -> bool:
+        """Append at least one more chunk to the buffer, and more until it
+        holds `size` unparsed characters, dropping what was parsed. Returns
+        False at the end of the body."""
+        if self.eof:
+            return False
+        texts = [self.buf[self.pos:]]
+        unparsed = length = len(texts[0])
+        for chunk in self.chunks:
+            text = self.decoder.decode(chunk)
+            if text:
+                texts.append(text)
+                length += len(text)
+                if length >= size:
+                    break
+        else:
+            texts.append(self.decoder.decode(b'', final=True))
+            self.eof = True
+        # Joined once, rather than appending chunk by chunk
+        self.buf = ''.join(texts)
+        self.pos = 0
+        return length > unparsed
+
+    def peek(self) -> str:
+        """The next character that is not whitespace, or '' at the end"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, chars: str) -> str:
+        """Consume the next character, which must be one of `chars`"""
+        c = self.peek()
+        if not c or c not in chars:
+            raise ValueError(f"Expected one of {chars!r} at {c!r} in the retrieve response")
+        self.pos += 1
+        return c
+
+    def value(self):
+        """Decode the next complete JSON value"""
+        self.peek()
+        while True:
+            # A number or literal is only complete once followed by a
+            # delimiter (`1.` may be the start of `1.5`); strings, objects and
+            # arrays end with their own
+            if (self.buf[self.pos:self.pos + 1] not in ('"', '{', '[') and not _END_OF_TOKEN.search(self.buf, self.pos)
+                    and self.fill()):
+                continue
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                # Each attempt decodes the value from its start, so only try
+                # again once the buffer has doubled: a large entry is then
+                # decoded a few times, not once per chunk
+                if not self.fill(2 * (len(self.buf) - self.pos)):
+                    raise
+                continue
+            self.pos = end
+            return value
+
+
+def parse_retrieve(chunks, fields: dict):
+    """Parse a retrieve response incrementally.
+
+    Every entry of every signal under `Results` is yielded as soon as it has
+    been read, and then dropped; the other fields of the measurement (`ID`,
+    `Status`, ...) are put into `fields`. Memory use is bounded by about
+    twice the largest single entry, not by the size of the response.
+
+    Arguments:
+        chunks {Iterable[bytes]} -- The response body, in pieces
+        fields {dict} -- Receives the fields other than `Results`
+
+    Raises:
+        ValueError: If the body is not a JSON object
+
+    Yields:
+        RetrieveRecord -- Signal name and entry, in the order of the response
+    """
+    reader = _Reader(chunks)
+    reader.expect('{')
+    if reader.peek() == '}':
+        return
+    while True:
+        key = reader.value()
+        reader.expect(':')
+        if key == "Results" and reader.peek() == '{':
+            reader.expect('{')
+            while reader.peek() != '}':
+                signal = reader.value()
+                reader.expect(':')
+                if reader.peek() != '[':
+                    yield RetrieveRecord(signal, reader.value())
+                else:
+                    reader.expect('[')
+                    while reader.peek() != ']':
+                        yield RetrieveRecord(signal, reader.value())
+                        if reader.peek() == ',':
+                            reader.expect(',')
+                    reader.expect(']')
+                if reader.peek() == ',':
+                    reader.expect(',')
+            reader.expect('}')
+        else:
+            fields[key] = reader.value()
+        if reader.expect(',}') == '}':
+            return
+
+
+class RetrieveStream():
+    """`RetrieveStream` iterates over the results of a retrieve response
+    while it is being downloaded (see `Measurement.retrieve_stream`).
+
+    Iterating yields a `RetrieveRecord` per signal entry. `fields` holds the
+    other fields of the measurement as far as they have been read; for an
+    error response it holds the decoded error (with its `Code`) and nothing
+    is yielded. The connection is released when the iteration ends or
+    `close()` is called; use it as a context manager to stop early.
+    """
+    def __init__(self, response, chunk_size: int = 65536):
+        """Create a `RetrieveStream` object
+
+        Arguments:
+            response {requests.Response} -- Response requested with `stream=True`
+
+        Keyword Arguments:
+            chunk_size {int} -- Bytes read from the connection at a time (default: {65536})
+        """
+        self.response = response
+        self.chunk_size = chunk_size
+        self.fields = {}
+        self.records = 0
+
+    def __iter__(self):
+        try:
+            if self.response.status_code >= 400:
+                self.fields.update(parse_json(self.response))
+                return
+            for record in parse_retrieve(self.response.iter_content(self.chunk_size), self.fields):
+                self.records += 1
+                yield record
+        finally:
+            self.close()
+
+    def close(self):
+        """Release the connection; an unread rest of the body is discarded"""
+        self.response.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
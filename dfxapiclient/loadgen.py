@@ -0,0 +1,283 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+
+from .mockserver import MockServer, synthetic_chunks
+from .simpleclient import SimpleClient
+
+
+def percentile(values: list, p: float) -> float:
+    """Nearest-rank percentile of `values` (0 if empty)."""
+    values = sorted(values)
+    if not values:
+        return 0.0
+    k = min(len(values) - 1, max(0, int(round(p / 100 * (len(values) - 1)))))
+    return values[k]
+
+
+class VirtualDevice():
+    """One simulated device, driving its own `SimpleClient` through
+    `add_chunk` and `subscribe_to_results` with synthetic payloads.
+    """
+    def __init__(self, device_no: int, options: dict, config_dir: str):
+        """Create a `VirtualDevice` object
+
+        Arguments:
+            device_no {int} -- Device number, used in the device name and email
+            options {dict} -- Load generator options (see `main()`)
+            config_dir {str} -- Directory for the device's config file
+        """
+        self.device_no = device_no
+        self.options = options
+        self.config_file = os.path.join(config_dir, f"device-{device_no}.config")
+
+        self.chunks_sent = 0
+        self.results_received = 0
+        self.errors = []
+        self.ack_latencies = []
+        self.result_latencies = []
+
+    def __construct(self, loop):
+        # Queues created by the client belong to the devices' loop
+        asyncio.set_event_loop(loop)
+        o = self.options
+        chunk_length = o["cadence"] or 1
+        try:
+            return SimpleClient(o["license_key"],
+                                o["study_id"],
+                                o["email"].format(device=self.device_no),
+                                o["password"],
+                                server=o["server"],
+                                device_name=f"loadgen-{self.device_no}",
+                                config_file=self.config_file,
+                                add_method=o["add_method"],
+                                chunk_length=chunk_length,
+                                video_length=chunk_length * o["chunks"],
+                                server_url=o["server_url"],
+                                websocket_url=o["websocket_url"])
+        finally:
+            asyncio.set_event_loop(None)
+
+    async def run(self):
+        """Run one measurement on this device."""
+        o = self.options
+        loop = asyncio.get_running_loop()
+        try:
+            # Registering, logging in and creating the measurement are
+            # blocking REST calls, run off the loop so that they don't stall
+            # the devices already uploading
+            client = await loop.run_in_executor(None, self.__construct, loop)
+            await loop.run_in_executor(None, client.create_new_measurement)
+        except Exception as e:
+            self.errors.append(f"setup: {e!r}")
+            return
+
+        sent_at = []
+        subscriber = asyncio.ensure_future(client.subscribe_to_results())
+
+        async def collect():
+            while self.results_received < o["chunks"]:
+                await client.received_data.get()
+                self.result_latencies.append(time.perf_counter() - sent_at[self.results_received])
+                self.results_received += 1
+
+        collector = asyncio.ensure_future(collect())
+
+        for chunk in synthetic_chunks(o["chunks"], o["payload_size"], duration_s=o["cadence"]):
+            t0 = time.perf_counter()
+            sent_at.append(t0)
+            try:
+                status = await client.add_chunk(chunk)
+            except Exception as e:
+                self.errors.append(f"add_chunk {chunk.chunk_number}: {e!r}")
+                continue
+            if status != 200:
+                self.errors.append(f"add_chunk {chunk.chunk_number}: status {status}")
+                continue
+            # `add_chunk` sleeps for the chunk duration after the data is sent
+            self.ack_latencies.append(time.perf_counter() - t0 - chunk.duration_s)
+            self.chunks_sent += 1
+
+        try:
+            await asyncio.wait_for(asyncio.gather(collector, subscriber), timeout=o["result_timeout"])
+        except asyncio.TimeoutError:
+            self.errors.append(f"timed out with {self.results_received}/{o['chunks']} results")
+        except Exception as e:
+            self.errors.append(f"subscribe: {e!r}")
+        collector.cancel()
+        subscriber.cancel()
+
+        try:
+            await client.shutdown()
+        except Exception:
+            pass
+
+    def stats(self) -> dict:
+        return {
+            "device": self.device_no,
+            "chunks_sent": self.chunks_sent,
+            "results_received": self.results_received,
+            "errors": self.errors,
+            "ack_latencies": self.ack_latencies,
+            "result_latencies": self.result_latencies,
+        }
+
+
+def run_worker(device_numbers: list, options: dict) -> dict:
+    """Run a group of virtual devices concurrently in this process.
+
+    Returns the per-device statistics together with the CPU time and peak
+    memory of the process, which are shared out evenly between its devices.
+    """
+    async def run_all(devices):
+        await asyncio.gather(*(d.run() for d in devices))
+
+    with tempfile.TemporaryDirectory() as config_dir:
+        devices = [VirtualDevice(n, options, config_dir) for n in device_numbers]
+        start = time.perf_counter()
+        asyncio.run(run_all(devices))
+        elapsed = time.perf_counter() - start
+
+    # `resource` is Unix-only; elsewhere the CPU time is taken from `os.times` and the peak memory is unknown
+    try:
+        import resource
+    except ImportError:
+        times = os.times()
+        cpu_s, max_rss_kib = times.user + times.system, 0
+    else:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        cpu_s, max_rss_kib = usage.ru_utime + usage.ru_stime, usage.ru_maxrss  # KiB on Linux
+    return {
+        "elapsed": elapsed,
+        "cpu_s": cpu_s,
+        "max_rss_kib": max_rss_kib,
+        "devices": [d.stats() for d in devices],
+    }
+
+
+def run_load(options: dict, devices: int, workers: int = 1) -> dict:
+    """Run `devices` virtual devices spread over `workers` processes and
+    aggregate the results.
+
+    Arguments:
+        options {dict} -- Load generator options (see `main()`)
+        devices {int} -- Number of virtual devices
+
+    Keyword Arguments:
+        workers {int} -- Number of worker processes (default: {1})
+
+    Returns:
+        dict -- Aggregate statistics
+    """
+    workers = max(1, min(workers, devices))
+    groups = [list(range(w, devices, workers)) for w in range(workers)]
+
+    start = time.perf_counter()
+    if workers == 1:
+        reports = [run_worker(groups[0], options)]
+    else:
+        with multiprocessing.get_context("spawn").Pool(workers) as pool:
+            reports = pool.starmap(run_worker, [(g, options) for g in groups])
+    elapsed = time.perf_counter() - start
+
+    per_device = []
+    for report in reports:
+        n = len(report["devices"])
+        for d in report["devices"]:
+            d["cpu_s"] = report["cpu_s"] / n
+            d["rss_kib"] = report["max_rss_kib"] / n
+            per_device.append(d)
+
+    ack = [x for d in per_device for x in d["ack_latencies"]]
+    res = [x for d in per_device for x in d["result_latencies"]]
+    sent = sum(d["chunks_sent"] for d in per_device)
+    attempted = devices * options["chunks"]
+    failed_devices = sum(1 for d in per_device if d["errors"])
+
+    return {
+        "devices": devices,
+        "workers": workers,
+        "elapsed_s": elapsed,
+        "chunks_sent": sent,
+        "results_received": sum(d["results_received"] for d in per_device),
+        "throughput_chunks_per_s": sent / elapsed if elapsed else 0.0,
+        "throughput_mib_per_s": sent * options["payload_size"] / elapsed / 2**20 if elapsed else 0.0,
+        "ack_latency_ms": {p: percentile(ack, p) * 1000
+                           for p in (50, 90, 99)},
+        "result_latency_ms": {p: percentile(res, p) * 1000
+                              for p in (50, 90, 99)},
+        "error_rate": 1 - sent / attempted if attempted else 0.0,
+        "failed_devices": failed_devices,
+        "cpu_s_per_device": sum(d["cpu_s"] for d in per_device) / devices,
+        "rss_kib_per_device": sum(d["rss_kib"] for d in per_device) / devices,
+        "errors": [e for d in per_device for e in d["errors"]][:20],
+    }
+
+
+def main():
+    """Entry point for the `dfx-loadgen` console script."""
+    parser = argparse.ArgumentParser(description="Simulate N devices streaming to a DFX API server")
+    parser.add_argument("-n", "--devices", type=int, default=10, help="number of virtual devices")
+    parser.add_argument("-w", "--workers", type=int, default=1, help="number of worker processes")
+    parser.add_argument("--chunks", type=int, default=10, help="chunks per device")
+    parser.add_argument("--payload-size", type=int, default=65536, help="payload size in bytes")
+    parser.add_argument("--cadence", type=float, default=1.0, help="seconds between chunks (chunk duration)")
+    parser.add_argument("--add-method", default="websocket", choices=["REST", "websocket"])
+    parser.add_argument("--server", default="local", help="server name, or a built-in server such as qa")
+    parser.add_argument("--server-url", help="REST URL; a local mock server is started if omitted")
+    parser.add_argument("--websocket-url", help="websocket URL; a local mock server is started if omitted")
+    parser.add_argument("--license-key", default="LOADGEN")
+    parser.add_argument("--study-id", default="LOADGEN")
+    parser.add_argument("--email", default="loadgen-{device}@example.com", help="format string with {device}")
+    parser.add_argument("--password", default="loadgen-password")
+    parser.add_argument("--result-timeout", type=float, default=60.0, help="seconds to wait for results")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    options = {
+        "chunks": args.chunks,
+        "payload_size": args.payload_size,
+        "cadence": args.cadence,
+        "add_method": args.add_method,
+        "server": args.server,
+        "server_url": args.server_url,
+        "websocket_url": args.websocket_url,
+        "license_key": args.license_key,
+        "study_id": args.study_id,
+        "email": args.email,
+        "password": args.password,
+        "result_timeout": args.result_timeout,
+    }
+
+    mock = None
+    if args.server == "local" and not (args.server_url and args.websocket_url):
+        mock = MockServer().start()
+        options["server_url"] = mock.rest_url
+        options["websocket_url"] = mock.websocket_url
+    try:
+        report = run_load(options, args.devices, args.workers)
+    finally:
+        if mock:
+            mock.stop()
+
+    print(f"devices: {report['devices']} in {report['workers']} worker(s), {report['elapsed_s']:.1f} s")
+    print(f"throughput: {report['throughput_chunks_per_s']:.1f} chunks/s, "
+          f"{report['throughput_mib_per_s']:.2f} MiB/s")
+    print("ack latency ms:    " + "  ".join(f"p{p}={v:.1f}" for p, v in report["ack_latency_ms"].items()))
+    print("result latency ms: " + "  ".join(f"p{p}={v:.1f}" for p, v in report["result_latency_ms"].items()))
+    print(f"errors: {report['error_rate']:.2%} of chunks, {report['failed_devices']} device(s) with errors")
+    print(f"per device: {report['cpu_s_per_device']:.3f} CPU s, {report['rss_kib_per_device']:.0f} KiB RSS")
+    for error in report["errors"]:
+        print("  " + error)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
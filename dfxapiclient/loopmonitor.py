@@ -0,0 +1,129 @@
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+
+class LoopLagMonitor():
+    """`LoopLagMonitor` measures how late the event loop runs its callbacks.
+
+    A task sleeps for `interval` seconds at a time; how much later than
+    that it wakes up is the scheduling delay (lag) that every other
+    callback on the loop suffers as well. A lag above `threshold` counts as
+    a stall, i.e. something ran synchronously on the loop for that long.
+
+    In `debug` mode a watchdog thread also notices a stall while it is
+    happening and captures the stack of the loop's thread, showing which
+    call is blocking it. This costs a thread waking up every
+    `threshold / 2` seconds, so it is meant for debugging and canaries.
+    """
+    def __init__(self, interval: float = 0.1, threshold: float = 0.1, debug: bool = False, window: int = 600,
+                 max_stacks: int = 10):
+        """Create a `LoopLagMonitor` object
+
+        Keyword Arguments:
+            interval {float} -- Seconds between lag samples (default: {0.1})
+            threshold {float} -- Lag in seconds that counts as a stall (default: {0.1})
+            debug {bool} -- Capture the stack of the loop's thread during stalls (default: {False})
+            window {int} -- Number of recent samples kept for the percentiles (default: {600})
+            max_stacks {int} -- Number of recent stall stacks kept (default: {10})
+        """
+        self.interval = interval
+        self.threshold = threshold
+        self.debug = debug
+
+        self.samples = deque(maxlen=window)
+        self.total_samples = 0
+        self.max_lag = 0.0
+        self.stalls = 0
+        self.stacks = deque(maxlen=max_stacks)  # Dicts with `at`, `lag_s` and `stack`
+
+        self.task = None
+        self.__heartbeat = None
+        self.__loop_thread = None
+        self.__watchdog = None
+        self.__stopped = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    def start(self):
+        """Start monitoring the running event loop"""
+        if self.running:
+            return
+        self.__loop_thread = threading.get_ident()
+        self.__heartbeat = time.monotonic()
+        self.__stopped.clear()
+        self.task = asyncio.ensure_future(self.__run())
+        if self.debug:
+            self.__watchdog = threading.Thread(target=self.__watch, name="dfxapiclient-loopwatchdog", daemon=True)
+            self.__watchdog.start()
+
+    def stop(self):
+        """Stop monitoring"""
+        self.__stopped.set()
+        if self.task:
+            self.task.cancel()
+            self.task = None
+        if self.__watchdog:
+            self.__watchdog.join()
+            self.__watchdog = None
+
+    async def __run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - start - self.interval)
+            self.__heartbeat = time.monotonic()
+            self.samples.append(lag)
+            self.total_samples += 1
+            self.max_lag = max(self.max_lag, lag)
+            if lag > self.threshold:
+                self.stalls += 1
+
+    def __watch(self):
+        # The loop is stalled when the heartbeat is older than a sample
+        # interval plus the threshold. One stack is captured per stall.
+        captured = None
+        while not self.__stopped.wait(self.threshold / 2):
+            heartbeat = self.__heartbeat
+            lag = time.monotonic() - heartbeat - self.interval
+            if lag <= self.threshold or captured == heartbeat:
+                continue
+            frame = sys._current_frames().get(self.__loop_thread)
+            if frame is None:
+                continue
+            captured = heartbeat
+            self.stacks.append({
+                "at": time.time(),
+                "lag_s": lag,
+                "stack": ''.join(traceback.format_stack(frame)),
+            })
+
+    def stats(self) -> dict:
+        """Scheduling delay of the event loop
+
+        Returns:
+            dict -- Lag percentiles over the recent samples and the maximum in ms, the number of `stalls` above
+                the threshold, and in debug mode the most recent stall `stacks`
+        """
+        samples = sorted(self.samples)
+
+        def percentile(p):
+            if not samples:
+                return None
+            return samples[min(len(samples) - 1, int(p / 100 * len(samples)))] * 1000
+
+        return {
+            "samples": self.total_samples,
+            "lag_p50_ms": percentile(50),
+            "lag_p99_ms": percentile(99),
+            "lag_max_ms": self.max_lag * 1000,
+            "stalls": self.stalls,
+            "threshold_ms": self.threshold * 1000,
+            "stacks": list(self.stacks),
+        }
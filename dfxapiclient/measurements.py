@@ -1,12 +1,45 @@
 import asyncio
 import base64
+import functools
 import json
+import time
 import uuid
 
-import requests
+from dfxapiclient.memory import AccountedQueue
+from dfxapiclient.resilience import default_client, parse_json
 from dfxapiclient.websocketHelper import WebsocketHandler
 
-from .measurements_pb2 import DataRequest
+_PAYLOAD_TAG = bytes([7 << 3 | 2])  # `DataRequest.Payload`: field 7, length-delimited
+
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while value > 0x7f:
+        out.append(value & 0x7f | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def data_frame_head(request_id: str, data, payload_length: int) -> bytes:
+    """The websocket add data frame `[ 0506 ][ request ID:10 ][ DataRequest ]`
+    up to its payload: `data` is serialized without `Payload`, which is
+    appended after the returned bytes as the last field (protobuf fields may
+    come in any order). The payload (e.g. a memory-mapped file) is then
+    copied only once, into the frame.
+
+    Arguments:
+        request_id {str} -- 10-digit request ID
+        data {DataRequest} -- Request without the payload
+        payload_length {int} -- Payload size in bytes
+
+    Returns:
+        bytes -- Frame up to the payload
+    """
+    head = f'{"0506":4}{request_id:10}'.encode() + data.SerializeToString()
+    if payload_length:
+        head += _PAYLOAD_TAG + _varint(payload_length)
+    return head
 
 
 class Measurement:
@@ -27,7 +60,11 @@ class Measurement:
                  max_chunks: int,
                  mode: str = 'DISCRETE',
                  token: str = '',
-                 usrprofileID: str = ''):
+                 usrprofileID: str = '',
+                 preparer=None,
+                 http=None,
+                 budget=None,
+                 results_ws: WebsocketHandler = None):
         """Create a `Measurement` object
 
         Arguments:
@@ -41,6 +78,11 @@ class Measurement:
             mode {str} -- Measurement mode (default: {'DISCRETE'})
             token {str} -- User or device token (default: {''})
             usrprofileID {str} -- Alternate user profile (default: {''})
+            preparer {PayloadPreparer} -- Process pool to prepare add data requests in (default: {None})
+            http {HttpClient} -- Client sending the REST requests, with retries (default: {None}, the shared one)
+            budget {MemoryBudget} -- Account queued results against this budget (default: {None})
+            results_ws {WebsocketHandler} -- Separate websocket handler for subscriptions, so that result frames
+                do not delay add data acknowledgements on `ws_obj` (default: {None}, use `ws_obj`)
         """
         self.study_id = study_id
         self.profile_id = usrprofileID
@@ -48,12 +90,18 @@ class Measurement:
         self.token = token
         self.url = rest_url
         self.ws_obj = ws_obj
+        self.results_ws = results_ws
         self.max_chunks = max_chunks
         self.chunks_rem = num_chunks
         self.recv_timeout = 5
-        self.received_data = asyncio.Queue(30)
+        if budget:
+            self.received_data = AccountedQueue(30, budget, "received_data")
+        else:
+            self.received_data = asyncio.Queue(30)
         self.mode = mode
         self.end = False
+        self.preparer = preparer
+        self.http = http or default_client()
 
         auth = 'Bearer ' + token
         self.header = {'Content-Type': 'application/json', 'Authorization': auth}
@@ -77,9 +125,38 @@ class Measurement:
             measurement_id = self.measurement_id
         if not measurement_id or measurement_id == '':
             raise ValueError("No measurement ID given")
-        uri = self.url + '/measurements/' + self.measurement_id
-        r = requests.get(uri, headers=self.header)
-        return r.json()
+        uri = self.url + '/measurements/' + measurement_id
+        r = self.http.request('GET', uri, hedge=True, headers=self.header)
+        return parse_json(r)
+
+    def retrieve_stream(self, measurement_id: str = None, chunk_size: int = 65536):
+        """Retrieve the results of a measurement like `retrieve`, but parse
+        the response while it is downloaded instead of all at once
+
+        For long measurements the response is large; here only one entry is
+        decoded at a time, and the first entries are available before the
+        download completes.
+
+        Keyword Arguments:
+            measurement_id {str} -- Measurement ID (default: {None})
+            chunk_size {int} -- Bytes read from the connection at a time (default: {65536})
+
+        Raises:
+            ValueError: If invalid `measurement_id`
+
+        Returns:
+            RetrieveStream -- Yields a `RetrieveRecord` (signal, entry) per signal entry; its `fields` hold the
+                other fields of the measurement, or the error
+        """
+        from .jsonstream import RetrieveStream
+
+        if not measurement_id:
+            measurement_id = self.measurement_id
+        if not measurement_id or measurement_id == '':
+            raise ValueError("No measurement ID given")
+        uri = self.url + '/measurements/' + measurement_id
+        r = self.http.request('GET', uri, stream=True, headers=self.header)
+        return RetrieveStream(r, chunk_size=chunk_size)
 
     # 504
     def create(self) -> str:
@@ -97,8 +174,8 @@ class Measurement:
         values = json.dumps(values)
 
         uri = self.url + '/measurements'
-        r = requests.post(uri, data=values, headers=self.header)
-        res = r.json()
+        r = self.http.request('POST', uri, idempotent=False, data=values, headers=self.header)
+        res = parse_json(r)
 
         if 'ID' not in res:
             raise ValueError("Could not create measurement")
@@ -129,17 +206,26 @@ class Measurement:
         # [ 506, "1.0", "POST", "data", "/measurements/:ID/data" ]
         uri = self.url + "/measurements/" + measurement_id + "/data"
 
-        data = {
-            "ChunkOrder": chunkOrder,
-            "Action": action,
-            "StartTime": startTime,
-            "EndTime": endTime,
-            "Duration": duration,
-            "Meta": str(meta),
-            "Payload": base64.b64encode(payload).decode('utf-8')
-        }
-
-        result = requests.post(uri, data=json.dumps(data), headers=self.header)
+        if self.preparer:
+            body = await self.preparer.prepare_rest(chunkOrder, action, startTime, endTime, duration, payload, meta)
+        else:
+            data = {
+                "ChunkOrder": chunkOrder,
+                "Action": action,
+                "StartTime": startTime,
+                "EndTime": endTime,
+                "Duration": duration,
+                "Meta": str(meta),
+                "Payload": base64.b64encode(payload).decode('utf-8')
+            }
+            body = json.dumps(data)
+
+        # Sent from the executor, so that neither the request nor the delays
+        # between retries block the event loop. Add data is retried like an
+        # idempotent request, as the chunk order identifies the chunk.
+        loop = asyncio.get_event_loop()
+        request = functools.partial(self.http.request, 'POST', uri, data=body, headers=self.header)
+        result = await loop.run_in_executor(None, request)
         return result
 
     # Websocket
@@ -166,27 +252,34 @@ class Measurement:
         Returns:
             Union[str, bytes] -- Websocket response
         """
-        data = DataRequest()
-        paramval = data.Params
-        paramval.ID = measurement_id
-
-        data.ChunkOrder = chunkOrder
-        data.Action = action
-        data.StartTime = startTime
-        data.EndTime = endTime
-        data.Duration = duration
-        data.Meta = meta
-        data.Payload = bytes(payload)  # Payload has to be encoded to base 64
-
         # Randomly generated 10-digit hexdecimal request ID
         requestID = uuid.uuid4().hex[:10]  # Or can use requestID = "0000000001"
 
-        actionID = '0506'  # Action ID of the endpoint (see DFX API documentation Section 3.6)
+        if self.preparer:
+            data = await self.preparer.prepare_ws(requestID, measurement_id, chunkOrder, action, startTime, endTime,
+                                                  duration, payload, meta)
+        else:
+            from .measurements_pb2 import DataRequest  # Only needed for the websocket transport
+
+            data = DataRequest()
+            paramval = data.Params
+            paramval.ID = measurement_id
+
+            data.ChunkOrder = chunkOrder
+            data.Action = action
+            data.StartTime = startTime
+            data.EndTime = endTime
+            data.Duration = duration
+            data.Meta = meta
 
-        # Must be in the following format
-        data = f'{actionID:4}{requestID:10}'.encode() + data.SerializeToString()
+            # Must be in the format `[ 0506 ][ requestID:10 ][ DataRequest ]`,
+            # where 0506 is the action ID of the endpoint (see DFX API
+            # documentation Section 3.6). The payload is joined in without
+            # copying it into the `DataRequest` first.
+            data = b''.join((data_frame_head(requestID, data, len(payload)), payload))
 
         response = ""
+        sent = time.perf_counter()
         await self.ws_obj.handle_send(data)
 
         # To receive a response, polling must be done (using a `while` loop),
@@ -195,26 +288,49 @@ class Measurement:
         # By using `await asyncio.wait_for`, it also allows context switching
         # in the asyncio event loop while polling for the result.
 
+        # The acknowledgement may already have been received by a concurrent
+        # `subscribeResults` call, so the list is checked again right before
+        # receiving, in the same step as taking the receive lock.
+
+        # With a `ConnectionHealth` monitor on the websocket, the receive
+        # timeout adapts to the measured RTT, an overdue acknowledgement
+        # triggers a ping, and a dead peer raises instead of polling forever.
+
+        async def receive():
+            if not self.ws_obj.addDataStats:
+                await self.ws_obj.handle_recieve()
+
+        health = self.ws_obj.health
         while True:
             if not self.end:
+                if self.ws_obj.addDataStats:
+                    response = self.ws_obj.addDataStats.popleft()
+                    if health:
+                        health.ack_sample(time.perf_counter() - sent)
+                    break
+                if health and health.dead:
+                    raise ConnectionError("Websocket peer is not responding")
                 try:
-                    await asyncio.wait_for(self.ws_obj.handle_recieve(), timeout=self.recv_timeout)
+                    await asyncio.wait_for(receive(), timeout=health.recv_timeout if health else self.recv_timeout)
                 except Exception:
                     if self.end:
                         break
                     else:
+                        if health and time.perf_counter() - sent > health.ack_timeout:
+                            health.probe()
                         continue
-                if self.ws_obj.addDataStats:
-                    response = self.ws_obj.addDataStats[0]
-                    self.ws_obj.addDataStats = self.ws_obj.addDataStats[1:]
-                    break
             else:
                 return
 
         return response
 
     # 510
-    async def subscribeResults(self, data: bytes, chunk_num: int, result_queue: asyncio.Queue):
+    async def subscribeResults(self,
+                               data: bytes,
+                               chunk_num: int,
+                               result_queue: asyncio.Queue,
+                               sink=None,
+                               measurement_id: str = ''):
         """Creates a websocket connection to receive the results for chunk sent
         for measurement and stop when all the chunks are received.
         https://dfxapiversion10.docs.apiary.io/#reference/0/measurements/subscribe-to-results
@@ -225,6 +341,8 @@ class Measurement:
         Keyword Arguments:
             chunk_num {int} -- Chunk number
             result_queue {asyncio.Queue} -- Queue where results will be store
+            sink {ResultSink} -- Sink the results are also persisted to (default: {None})
+            measurement_id {str} -- Measurement the results are recorded under in `sink` (default: {''})
 
         Raises:
             ValueError: [description]
@@ -237,7 +355,7 @@ class Measurement:
         # [ 510, "1.0", "CONNECT", "subscribeResults", "/measurements/:ID/results/" ]
 
         # All the websocket interaction is done with a `WebsocketHandler` object
-        # `self.ws_obj`.
+        # `self.ws_obj` (or `self.results_ws`).
         # It first sends the `data` buffer to the websocket to make the initial
         # subscribe request. Then, to determine when to stop subscribing, the
         # number of chunks need to be calculated. This takes into consideration
@@ -245,9 +363,11 @@ class Measurement:
         # time. The limit can therefore be calculated given the chunk duration,
         # and is stored in `self.max_chunks`. `self.chunks_rem` keeps track of
         # the number of remaining chunks
-        if not self.ws_obj.ws:
-            await self.ws_obj.connect_ws()
-        await self.ws_obj.handle_send(data)
+        # With split connections, results arrive on their own websocket
+        ws_obj = self.results_ws or self.ws_obj
+        if not ws_obj.ws or ws_obj.ws.closed:  # Reopen after an idle close
+            await ws_obj.connect_ws()
+        await ws_obj.handle_send(data)
 
         done = False
         counter = chunk_num
@@ -266,26 +386,30 @@ class Measurement:
         # `ws_obj.handle_recieve()` into two stacks, `ws_obj.subscribeStats` for
         # statuses, and `ws_obj.chunks` for payload chunks.
 
+        # As in `add_data_ws`, a message may already have been received and
+        # sorted by the other reader, in which case it is handled first.
+
         while counter < num_limit:
             if not self.end:  # For handling early exit
-                try:
-                    await self.ws_obj.handle_recieve()
-                except Exception:
-                    if self.end:
-                        break
-                    else:
-                        continue
-
-                if self.ws_obj.subscribeStats:  # If response is a confirmation status
-                    response = self.ws_obj.subscribeStats[0]
-                    self.ws_obj.subscribeStats = self.ws_obj.subscribeStats[1:]
+                if not ws_obj.subscribeStats and not ws_obj.chunks:
+                    try:
+                        await ws_obj.handle_recieve()
+                    except Exception:
+                        if self.end:
+                            break
+                        elif ws_obj.health and ws_obj.health.dead:
+                            raise ConnectionError("Websocket peer is not responding")
+                        else:
+                            continue
+
+                if ws_obj.subscribeStats:  # If response is a confirmation status
+                    response = ws_obj.subscribeStats.popleft()
                     statusCode = response[10:13].decode('utf-8')
                     if statusCode != '200':
                         raise ValueError(f"Status Code{statusCode}: Subscribe failed. (Check measurement ID)")
-                elif self.ws_obj.chunks:  # If response is a payload chunk
+                elif ws_obj.chunks:  # If response is a payload chunk
                     counter += 1
-                    response = self.ws_obj.chunks[0]
-                    self.ws_obj.chunks = self.ws_obj.chunks[1:]
+                    response = ws_obj.chunks.popleft()
 
                     # Store results in queue
                     if result_queue:
@@ -293,6 +417,10 @@ class Measurement:
 
                     if len(response[13:]) < 1000:
                         raise ValueError(f"Status Code{response[13:]}: Subscribe failed. (Check measurement ID)")
+
+                    # Only queued here; the sink writes on its own thread
+                    if sink:
+                        sink.write(measurement_id or self.measurement_id, counter - 1, response[13:])
             else:
                 done = True
                 return done, counter
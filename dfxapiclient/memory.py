@@ -0,0 +1,208 @@
+import asyncio
+import threading
+from collections import OrderedDict, deque
+
+
+class MemoryBudget():
+    """`MemoryBudget` accounts for the bytes held in the client's buffers.
+
+    Every buffer charges the bytes it takes in and releases them when they
+    leave, under its own name, so that `stats()` reports usage per buffer.
+    Buffers registered as diagnostics (such as websocket frames with an
+    unknown ID) are evicted, oldest first, whenever the total exceeds
+    `limit`. Producers call `acquire`, which waits until there is room,
+    so that a full budget slows down adding data instead of growing the
+    buffers further. Receive buffers are charged without waiting: a frame
+    that was already received cannot be refused, and blocking the reader
+    would stall the acknowledgements the producers wait for.
+
+    With `limit=None` usage is only accounted, never limited.
+    """
+    def __init__(self, limit: int = None):
+        """Create a `MemoryBudget` object
+
+        Keyword Arguments:
+            limit {int} -- Bytes all buffers together may hold (default: {None}, unlimited)
+        """
+        self.limit = limit
+        self.used = 0
+        self.peak = 0
+        self.buffers = {}  # Buffer name -> bytes held
+        self.evicted = 0  # Diagnostic entries evicted
+        self.evicted_bytes = 0
+        self.waits = 0  # `acquire` calls that had to wait
+
+        self.__lock = threading.Lock()
+        self.__evictors = {}  # Callable evicting the oldest entry of a diagnostic buffer -> buffer name
+        self.__waiters = []  # (loop, future) of `acquire` calls waiting for room
+
+    def register_diagnostics(self, name: str, evict):
+        """Register a buffer whose entries may be dropped to make room
+
+        Arguments:
+            name {str} -- Buffer name
+            evict {callable} -- Drops the buffer's oldest entry and returns its size in bytes, or 0 if empty
+        """
+        with self.__lock:
+            self.__evictors[evict] = name
+
+    def unregister_diagnostics(self, evict):
+        """Stop evicting from a buffer that is no longer used"""
+        with self.__lock:
+            self.__evictors.pop(evict, None)
+
+    def charge(self, name: str, nbytes: int):
+        """Account `nbytes` taken in by buffer `name`, evicting diagnostics if over the limit"""
+        with self.__lock:
+            self.buffers[name] = self.buffers.get(name, 0) + nbytes
+            self.used += nbytes
+            self.peak = max(self.peak, self.used)
+        if self.limit is not None and self.used > self.limit:
+            self.__evict()
+
+    def release(self, name: str, nbytes: int):
+        """Account `nbytes` leaving buffer `name`; may be called from any thread"""
+        with self.__lock:
+            self.buffers[name] = self.buffers.get(name, 0) - nbytes
+            self.used -= nbytes
+            waiters, self.__waiters = self.__waiters, []
+        for loop, future in waiters:
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(_wake, future)
+
+    def room(self, nbytes: int) -> bool:
+        """Whether `nbytes` fit into the budget. An empty budget always has room, so that an item larger than
+        the whole budget can still pass on its own."""
+        return self.limit is None or self.used == 0 or self.used + nbytes <= self.limit
+
+    async def acquire(self, name: str, nbytes: int):
+        """Wait until `nbytes` fit into the budget, then charge them to buffer `name`
+
+        Arguments:
+            name {str} -- Buffer name
+            nbytes {int} -- Bytes to hold
+        """
+        if not self.room(nbytes):
+            self.__evict()
+        if not self.room(nbytes):
+            self.waits += 1
+            loop = asyncio.get_running_loop()
+            while not self.room(nbytes):
+                future = loop.create_future()
+                with self.__lock:
+                    self.__waiters.append((loop, future))
+                if self.room(nbytes):  # Released before the waiter was registered
+                    break
+                await future
+        self.charge(name, nbytes)
+
+    def __evict(self):
+        with self.__lock:
+            evictors = list(self.__evictors.items())
+        for evict, name in evictors:
+            while self.used > self.limit:
+                nbytes = evict()
+                if not nbytes:
+                    break
+                self.evicted += 1
+                self.evicted_bytes += nbytes
+                self.release(name, nbytes)
+
+    def stats(self) -> dict:
+        """Current memory usage
+
+        Returns:
+            dict -- `limit`, `used` and `peak` bytes, bytes per buffer, and `evicted`, `evicted_bytes` and `waits`
+                counters
+        """
+        with self.__lock:
+            buffers = dict(self.buffers)
+        return {
+            "limit": self.limit,
+            "used": self.used,
+            "peak": self.peak,
+            "buffers": buffers,
+            "evicted": self.evicted,
+            "evicted_bytes": self.evicted_bytes,
+            "waits": self.waits,
+        }
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class FrameBuffer(deque):
+    """A FIFO of received frames, charged to a `MemoryBudget` under `name`"""
+    def __init__(self, budget: MemoryBudget, name: str):
+        super().__init__()
+        self.budget = budget
+        self.name = name
+
+    def append(self, frame: bytes):
+        super().append(frame)
+        self.budget.charge(self.name, len(frame))
+
+    def popleft(self) -> bytes:
+        frame = super().popleft()
+        self.budget.release(self.name, len(frame))
+        return frame
+
+    def clear(self):
+        self.budget.release(self.name, sum(len(frame) for frame in self))
+        super().clear()
+
+
+class DiagnosticBuffer(OrderedDict):
+    """Frames with an unknown websocket ID, by ID. Charged to a `MemoryBudget`
+    as diagnostics, so the oldest are evicted when the budget is exceeded,
+    and never more than `max_frames` are kept even without a limit."""
+    def __init__(self, budget: MemoryBudget, name: str, max_frames: int = 100):
+        super().__init__()
+        self.budget = budget
+        self.name = name
+        self.max_frames = max_frames
+
+    def __setitem__(self, key, frame: bytes):
+        self.budget.register_diagnostics(self.name, self.evict_oldest)  # Again after `close`
+        if key in self:
+            self.budget.release(self.name, len(self[key]))
+            self.move_to_end(key)
+        super().__setitem__(key, frame)
+        self.budget.charge(self.name, len(frame))
+        while len(self) > self.max_frames:
+            self.budget.release(self.name, self.evict_oldest())
+
+    def clear(self):
+        self.budget.release(self.name, sum(len(frame) for frame in self.values()))
+        super().clear()
+
+    def close(self):
+        """Release all frames and stop being evicted from"""
+        self.budget.unregister_diagnostics(self.evict_oldest)
+        self.clear()
+
+    def evict_oldest(self) -> int:
+        """Drop the oldest frame, without releasing it (the budget does). Returns its size."""
+        if not self:
+            return 0
+        _, frame = self.popitem(last=False)
+        return len(frame)
+
+
+class AccountedQueue(asyncio.Queue):
+    """An `asyncio.Queue` of bytes whose contents are charged to a `MemoryBudget` under `name`"""
+    def __init__(self, maxsize: int, budget: MemoryBudget, name: str):
+        super().__init__(maxsize)
+        self.budget = budget
+        self.name = name
+
+    def put_nowait(self, item):
+        super().put_nowait(item)
+        self.budget.charge(self.name, len(item))
+
+    def get_nowait(self):
+        item = super().get_nowait()
+        self.budget.release(self.name, len(item))
+        return item
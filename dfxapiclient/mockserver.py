@@ -0,0 +1,561 @@
+import argparse
+import asyncio
+import base64
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import websockets
+
+from .measurements_pb2 import DataRequest, DataResponse, SubscribeResultsRequest
+
+
+class SyntheticChunk():
+    """A stand-in for a `libdfx.Payload` object, with the same attributes
+    that `SimpleClient.add_chunk` reads from the DFX SDK payload.
+    """
+    def __init__(self,
+                 chunk_number: int,
+                 number_chunks: int,
+                 payload_data: bytes,
+                 metadata: bytes = b'',
+                 duration_s: float = 5.0,
+                 first_chunk_start_time_s: int = 0):
+        """Create a `SyntheticChunk` object
+
+        Arguments:
+            chunk_number {int} -- Chunk number
+            number_chunks {int} -- Total number of chunks in the measurement
+            payload_data {bytes} -- Payload bytes
+
+        Keyword Arguments:
+            metadata {bytes} -- Payload metadata (default: {b''})
+            duration_s {float} -- Chunk duration in seconds (default: {5.0})
+            first_chunk_start_time_s {int} -- Start time of the first chunk (default: {0})
+        """
+        self.valid = True
+        self.chunk_number = chunk_number
+        self.number_chunks = number_chunks
+        self.payload_data = payload_data
+        self.metadata = metadata
+        self.duration_s = duration_s
+        self.first_chunk_start_time_s = first_chunk_start_time_s
+        # `DataRequest` carries start and end times as integers
+        self.start_time_s = int(first_chunk_start_time_s + chunk_number * duration_s)
+        self.end_time_s = int(first_chunk_start_time_s + (chunk_number + 1) * duration_s)
+        self.start_frame = int(chunk_number * duration_s * 30)
+        self.end_frame = int((chunk_number + 1) * duration_s * 30) - 1
+
+
+def synthetic_chunks(number_chunks: int, payload_size: int = 16384, duration_s: float = 5.0):
+    """Generate `number_chunks` synthetic payload chunks of `payload_size` bytes.
+
+    Arguments:
+        number_chunks {int} -- Number of chunks to generate
+
+    Keyword Arguments:
+        payload_size {int} -- Size of each payload in bytes (default: {16384})
+        duration_s {float} -- Duration of each chunk in seconds (default: {5.0})
+    """
+    start = int(time.time())
+    for i in range(number_chunks):
+        payload = (i.to_bytes(4, 'big') * (payload_size // 4 + 1))[:payload_size]
+        yield SyntheticChunk(i, number_chunks, payload, b'{"synthetic": true}', duration_s, start)
+
+
+class _MockMeasurement():
+    """State of one measurement held by the `MockServer`."""
+    def __init__(self, measurement_id: str, study_id: str, mode: str, user_token: str):
+        self.measurement_id = measurement_id
+        self.study_id = study_id
+        self.mode = mode
+        self.user_token = user_token
+        self.status = 'CREATED'
+        self.duration = 0.0
+        self.results = []  # Decoded result dicts, in the order they were produced
+        self.subscribers = []  # (websocket, request ID) pairs
+
+
+class MockServer():
+    """`MockServer` is a local stand-in for the DFX API.
+
+    It serves the REST routes used by `User`, `Organization` and `Measurement`
+    and the websocket protocol used by `WebsocketHandler`, so that the client
+    can be exercised and benchmarked offline. Both servers run in a background
+    thread; use it as a context manager or call `start()` and `stop()`.
+
+    Every chunk added (over REST or websocket) produces one result chunk of
+    roughly `result_size` bytes, streamed to all subscribers of the
+    measurement after `result_latency` seconds.
+    """
+
+    mode_limits = {"DISCRETE": 120, "BATCH": 1200, "VIDEO": 1200, "STREAMING": 1200}
+    signals = ("HR_BPM", "SNR", "MSI", "BP_SYSTOLIC", "BP_DIASTOLIC")
+
+    def __init__(self,
+                 host: str = '127.0.0.1',
+                 rest_port: int = 0,
+                 ws_port: int = 0,
+                 ack_latency: float = 0.0,
+                 result_latency: float = 0.0,
+                 result_size: int = 2048,
+                 token_lifetime: float = None,
+                 fault_rate: float = 0.0,
+                 faults: tuple = ("503", "502_html", "reset"),
+                 seed: int = None,
+                 slow_rate: float = 0.0,
+                 slow_latency: float = 0.0,
+                 connect_latency: float = 0.0,
+                 ws_bandwidth: float = None):
+        """Create a `MockServer` object
+
+        Keyword Arguments:
+            host {str} -- Interface to bind to (default: {'127.0.0.1'})
+            rest_port {int} -- REST port, 0 picks a free port (default: {0})
+            ws_port {int} -- Websocket port, 0 picks a free port (default: {0})
+            ack_latency {float} -- Delay before acknowledging added data in seconds (default: {0.0})
+            result_latency {float} -- Delay before a result chunk is streamed in seconds (default: {0.0})
+            result_size {int} -- Approximate size of each result chunk in bytes (default: {2048})
+            token_lifetime {float} -- Seconds until user tokens expire (default: {None}, never)
+            fault_rate {float} -- Fraction of REST requests (other than `/status`) that fail (default: {0.0})
+            faults {tuple} -- Failures to pick from: "503" (JSON error), "502_html" (a proxy's HTML page) and
+                "reset" (connection closed without a response) (default: {("503", "502_html", "reset")})
+            seed {int} -- Seed of the fault and slow response injection (default: {None})
+            slow_rate {float} -- Fraction of REST requests (other than `/status`) answered late (default: {0.0})
+            slow_latency {float} -- Extra delay of those requests in seconds (default: {0.0})
+            connect_latency {float} -- Delay of every new REST connection and websocket handshake in seconds,
+                standing in for DNS, TCP and TLS setup (default: {0.0})
+            ws_bandwidth {float} -- Bytes per second each websocket connection sends at; frames on one connection
+                are sent one after the other, so a large frame delays the ones queued behind it (default: {None},
+                unlimited)
+        """
+        self.host = host
+        self.rest_port = rest_port
+        self.ws_port = ws_port
+        self.ack_latency = ack_latency
+        self.result_latency = result_latency
+        self.result_size = result_size
+        self.token_lifetime = token_lifetime
+        self.fault_rate = fault_rate
+        self.faults = faults
+        self.faults_injected = 0
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.connect_latency = connect_latency
+        self.ws_bandwidth = ws_bandwidth
+        self._send_locks = {}  # Websocket -> lock serializing its frames, with `ws_bandwidth`
+        self._random = random.Random(seed)
+
+        self.licenses = {}  # device token -> device ID
+        self.users = {}  # email -> user data
+        self.tokens = {}  # user token -> (email, expiry time or None)
+        self.measurements = {}  # measurement ID -> `_MockMeasurement`
+        self.lock = threading.Lock()
+
+        self._http = None
+        self._http_thread = None
+        self._loop = None
+        self._ws_server = None
+        self._ws_thread = None
+
+    @property
+    def rest_url(self) -> str:
+        return f"http://{self.host}:{self.rest_port}"
+
+    @property
+    def websocket_url(self) -> str:
+        return f"ws://{self.host}:{self.ws_port}"
+
+    def start(self):
+        """Start the REST and websocket servers in background threads."""
+        self._http = ThreadingHTTPServer((self.host, self.rest_port), _make_rest_handler(self))
+        self._http.daemon_threads = True
+        self.rest_port = self._http.server_address[1]
+        self._http_thread = threading.Thread(target=self._http.serve_forever, daemon=True)
+        self._http_thread.start()
+
+        ready = threading.Event()
+        self._ws_thread = threading.Thread(target=self._run_ws, args=(ready, ), daemon=True)
+        self._ws_thread.start()
+        ready.wait()
+        return self
+
+    def stop(self):
+        """Stop both servers."""
+        if self._http:
+            self._http.shutdown()
+            self._http.server_close()
+            self._http = None
+        if self._loop:
+            asyncio.run_coroutine_threadsafe(self._close_ws(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._ws_thread.join()
+            self._loop = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _run_ws(self, ready: threading.Event):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._ws_server = self._loop.run_until_complete(
+            websockets.serve(self._ws_handler,
+                             self.host,
+                             self.ws_port,
+                             max_size=None,
+                             process_request=self._ws_authorize))
+        self.ws_port = self._ws_server.sockets[0].getsockname()[1]
+        ready.set()
+        self._loop.run_forever()
+        self._loop.close()
+
+    async def _close_ws(self):
+        self._ws_server.close()
+        await self._ws_server.wait_closed()
+
+    # Shared state
+
+    def new_token(self, email: str = '', lifetime: float = None) -> str:
+        """Issue a JWT-shaped token, with an `exp` claim if it has a `lifetime` in seconds."""
+        def encode(value):
+            return base64.urlsafe_b64encode(json.dumps(value).encode()).rstrip(b'=').decode()
+
+        claims = {"sub": email, "jti": uuid.uuid4().hex, "iat": int(time.time())}
+        expiry = None
+        if lifetime is not None:
+            expiry = time.time() + lifetime
+            claims["exp"] = int(expiry)
+        token = f"{encode({'alg': 'none', 'typ': 'JWT'})}.{encode(claims)}.mock"
+        with self.lock:
+            self.tokens[token] = (email, expiry)
+        return token
+
+    def user_for(self, auth: str):
+        """Return the email for a `Bearer` authorization header, or `None` if
+        the token is unknown or expired."""
+        if not auth or not auth.startswith('Bearer '):
+            return None
+        email, expiry = self.tokens.get(auth[len('Bearer '):], (None, None))
+        if expiry is not None and time.time() >= expiry:
+            return None
+        return email
+
+    def add_data(self, measurement_id: str, chunk_order: int, action: str, start: float, end: float,
+                 duration: float):
+        """Record one added chunk. Returns an error code, or `None` if accepted."""
+        with self.lock:
+            measurement = self.measurements.get(measurement_id)
+            if measurement is None:
+                return 'MEASUREMENT_NOT_FOUND'
+            if measurement.status == 'COMPLETE':
+                return 'MEASUREMENT_CLOSED'
+            if measurement.duration + duration > self.mode_limits.get(measurement.mode, 120):
+                measurement.status = 'COMPLETE'
+                return 'MEASUREMENT_CLOSED'
+            measurement.duration += duration
+            measurement.status = 'COMPLETE' if action.startswith('LAST') else 'PROCESSING'
+
+        asyncio.run_coroutine_threadsafe(self._emit_result(measurement, chunk_order, start, end), self._loop)
+        return None
+
+    def make_result(self, measurement_id: str, chunk_order: int, start: float, end: float) -> dict:
+        """Build one result chunk of roughly `self.result_size` bytes."""
+        points = max(1, (self.result_size - 256) // (7 * len(self.signals)))
+        result = {
+            "ID": measurement_id,
+            "ChunkOrder": chunk_order,
+            "StartTime": start,
+            "EndTime": end,
+            "Results": {
+                signal: [{
+                    "Data": [72000 + (chunk_order + i + j) % 1000 for j in range(points)],
+                    "Multiplier": 1000
+                }]
+                for i, signal in enumerate(self.signals)
+            }
+        }
+        size = len(json.dumps(result))
+        if size < self.result_size:
+            result["Padding"] = " " * (self.result_size - size - len(', "Padding": ""'))
+        return result
+
+    async def _emit_result(self, measurement: _MockMeasurement, chunk_order: int, start: float, end: float):
+        if self.result_latency:
+            await asyncio.sleep(self.result_latency)
+        result = self.make_result(measurement.measurement_id, chunk_order, start, end)
+        measurement.results.append(result)
+        body = json.dumps(result).encode()
+        for ws, request_id in list(measurement.subscribers):
+            await self._send(ws, request_id.encode() + b'200' + body)
+
+    async def _send(self, ws, data: bytes):
+        try:
+            if self.ws_bandwidth:
+                lock = self._send_locks.setdefault(ws, asyncio.Lock())
+                async with lock:
+                    await asyncio.sleep(len(data) / self.ws_bandwidth)  # Time on the wire
+                    await ws.send(data)
+            else:
+                await ws.send(data)
+        except websockets.ConnectionClosed:
+            pass
+
+    # Websocket
+
+    async def _ws_authorize(self, path, request_headers):
+        if self.connect_latency:
+            await asyncio.sleep(self.connect_latency)
+        if self.user_for(request_headers.get('Authorization', '')) is None:
+            return 401, [], b'INVALID_TOKEN'
+        return None
+
+    async def _ws_handler(self, ws, path=None):
+        # Requests come in the form `Buffer([ string:4 ][ string:10 ][ proto ])`
+        # and responses go out as `Buffer([ string:10 ][ string:3 ][ body ])`.
+        try:
+            async for message in ws:
+                if isinstance(message, str):
+                    message = message.encode()
+                action_id = message[0:4].decode()
+                request_id = message[4:14].decode()
+                body = message[14:]
+
+                if action_id == '0506':
+                    asyncio.ensure_future(self._ws_add_data(ws, request_id, body))
+                elif action_id == '0510':
+                    await self._ws_subscribe(ws, request_id, body)
+                else:
+                    await self._send(ws, request_id.encode() + b'404' + b'UNKNOWN_ACTION')
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            self._send_locks.pop(ws, None)
+            with self.lock:
+                for measurement in self.measurements.values():
+                    measurement.subscribers = [s for s in measurement.subscribers if s[0] is not ws]
+
+    async def _ws_add_data(self, ws, request_id: str, body: bytes):
+        request = DataRequest()
+        request.ParseFromString(body)
+        if self.ack_latency:
+            await asyncio.sleep(self.ack_latency)
+        error = self.add_data(request.Params.ID, request.ChunkOrder, request.Action, request.StartTime,
+                              request.EndTime, request.Duration)
+        if error:
+            await self._send(ws, request_id.encode() + b'400' + error.encode())
+            return
+        response = DataResponse()
+        response.ID = request.Params.ID
+        response.ChunkOrder = request.ChunkOrder
+        await self._send(ws, request_id.encode() + b'200' + response.SerializeToString())
+
+    async def _ws_subscribe(self, ws, request_id: str, body: bytes):
+        request = SubscribeResultsRequest()
+        request.ParseFromString(body)
+        with self.lock:
+            measurement = self.measurements.get(request.Params.ID)
+            if measurement is not None:
+                measurement.subscribers.append((ws, request_id))
+                backlog = list(measurement.results)
+        if measurement is None:
+            await self._send(ws, request_id.encode() + b'404')
+            return
+        await self._send(ws, request_id.encode() + b'200')
+        # Results produced before the subscription are delivered straight away
+        for result in backlog:
+            await self._send(ws, request_id.encode() + b'200' + json.dumps(result).encode())
+
+
+def _make_rest_handler(server: MockServer):
+    """Create a request handler class bound to `server`."""
+    class RestHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # Headers and body are written separately; without this, a client
+        # keeping the connection alive waits for the delayed ACK of each reply
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def setup(self):
+            if server.connect_latency:
+                time.sleep(server.connect_latency)  # Once per connection, not per request
+            super().setup()
+
+        def _reply(self, status: int, body: dict):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _body(self) -> dict:
+            length = int(self.headers.get('Content-Length', 0))
+            if not length:
+                return {}
+            try:
+                return json.loads(self.rfile.read(length))
+            except ValueError:
+                return {}
+
+        def _fault(self) -> bool:
+            """Fail or delay this request as configured; returns True if it failed."""
+            with server.lock:
+                slow = server.slow_rate and server._random.random() < server.slow_rate
+            if slow:
+                time.sleep(server.slow_latency)
+            with server.lock:
+                if not server.fault_rate or server._random.random() >= server.fault_rate:
+                    return False
+                fault = server._random.choice(server.faults)
+                server.faults_injected += 1
+            if fault == "reset":
+                self.close_connection = True
+            elif fault == "502_html":
+                data = b'<html><body><h1>502 Bad Gateway</h1></body></html>'
+                self.send_response(502)
+                self.send_header('Content-Type', 'text/html')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+            else:
+                self._reply(503, {"Code": "SERVICE_UNAVAILABLE", "Message": "Injected fault"})
+            return True
+
+        def _authorized(self):
+            email = server.user_for(self.headers.get('Authorization', ''))
+            if email is None:
+                self._reply(401, {"Code": "INVALID_TOKEN"})
+            return email
+
+        def do_GET(self):
+            parts = self.path.strip('/').split('/')
+            if parts == ['status']:
+                return self._reply(200, {"StatusID": "ACTIVE"})
+            if self._fault():
+                return
+            email = self._authorized()
+            if email is None:
+                return
+            if parts == ['users']:
+                return self._reply(200, server.users.get(email, {}))
+            if parts == ['users', 'role']:
+                return self._reply(200, {"Role": "USER"})
+            if len(parts) == 2 and parts[0] == 'measurements':
+                measurement = server.measurements.get(parts[1])
+                if measurement is None:
+                    return self._reply(404, {"Code": "MEASUREMENT_NOT_FOUND"})
+                results = {}
+                for result in list(measurement.results):
+                    for signal, values in result["Results"].items():
+                        for value in values:
+                            results.setdefault(signal, []).append(dict(value, ChunkOrder=result["ChunkOrder"]))
+                return self._reply(
+                    200, {
+                        "ID": measurement.measurement_id,
+                        "StudyID": measurement.study_id,
+                        "Mode": measurement.mode,
+                        "Status": measurement.status,
+                        "Results": results
+                    })
+            self._reply(404, {"Code": "NOT_FOUND"})
+
+        def do_DELETE(self):
+            if self._fault():
+                return
+            email = self._authorized()
+            if email is None:
+                return
+            if self.path.strip('/') == 'users':
+                with server.lock:
+                    server.users.pop(email, None)
+                return self._reply(200, {})
+            self._reply(404, {"Code": "NOT_FOUND"})
+
+        def do_POST(self):
+            parts = self.path.strip('/').split('/')
+            body = self._body()
+            if self._fault():
+                return
+
+            if parts == ['organizations', 'licenses']:
+                token = server.new_token()
+                server.licenses[token] = uuid.uuid4().hex
+                return self._reply(200, {"Token": token, "DeviceID": server.licenses[token]})
+
+            if parts == ['users', 'auth']:
+                user = server.users.get(body.get("Email"))
+                if user is None:
+                    return self._reply(400, {"Code": "INVALID_USER"})
+                if user.get("Password") != body.get("Password"):
+                    return self._reply(400, {"Code": "INVALID_PASSWORD"})
+                return self._reply(200, {"Token": server.new_token(body["Email"], server.token_lifetime)})
+
+            if parts == ['organizations', 'auth']:
+                return self._reply(200, {"Token": server.new_token(str(body.get("Email", '')))})
+
+            if self._authorized() is None:
+                return
+
+            if parts in (['users'], ['organizations', 'users']):
+                if body.get("Email") in server.users:
+                    return self._reply(400, {"Code": "USER_EXISTS"})
+                user_id = uuid.uuid4().hex
+                with server.lock:
+                    server.users[body.get("Email")] = dict(body, ID=user_id)
+                return self._reply(200, {"ID": user_id})
+
+            if parts == ['measurements']:
+                measurement_id = uuid.uuid4().hex
+                token = self.headers['Authorization'][len('Bearer '):]
+                with server.lock:
+                    server.measurements[measurement_id] = _MockMeasurement(measurement_id, body.get("StudyID", ''),
+                                                                           body.get("Mode", "DISCRETE"), token)
+                return self._reply(200, {"ID": measurement_id})
+
+            if len(parts) == 3 and parts[0] == 'measurements' and parts[2] == 'data':
+                if server.ack_latency:
+                    time.sleep(server.ack_latency)
+                error = server.add_data(parts[1], int(body.get("ChunkOrder", 0)), body.get("Action", ''),
+                                        float(body.get("StartTime", 0)), float(body.get("EndTime", 0)),
+                                        float(body.get("Duration", 0)))
+                if error:
+                    return self._reply(400, {"Code": error})
+                return self._reply(200, {"ID": parts[1], "ChunkOrder": body.get("ChunkOrder")})
+
+            self._reply(404, {"Code": "NOT_FOUND"})
+
+    return RestHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local stand-in for the DFX API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--rest-port", type=int, default=9443)
+    parser.add_argument("--ws-port", type=int, default=9080)
+    parser.add_argument("--ack-latency", type=float, default=0.0, help="seconds")
+    parser.add_argument("--result-latency", type=float, default=0.0, help="seconds")
+    parser.add_argument("--result-size", type=int, default=2048, help="bytes")
+    parser.add_argument("--token-lifetime", type=float, help="seconds until user tokens expire")
+    parser.add_argument("--fault-rate", type=float, default=0.0, help="fraction of REST requests that fail")
+    args = parser.parse_args()
+
+    server = MockServer(args.host, args.rest_port, args.ws_port, args.ack_latency, args.result_latency,
+                        args.result_size, args.token_lifetime, args.fault_rate)
+    with server:
+        print(f"REST: {server.rest_url}  websocket: {server.websocket_url}")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,6 @@
 import json
 
-import requests
+from .resilience import default_client, parse_json
 
 
 # 7
@@ -14,15 +14,19 @@ class Organization:
 
     *Currently incomplete and more endpoints will be added in subsequent updates.*
     """
-    def __init__(self, license_key: str, server_url: str):
+    def __init__(self, license_key: str, server_url: str, http=None):
         """[summary]
 
         Arguments:
             license_key {str} -- DFX API license key
             server_url {str} -- DFX API REST server URL
+
+        Keyword Arguments:
+            http {HttpClient} -- Client sending the requests, with retries (default: {None}, the shared one)
         """
         self.license_key = license_key
         self.server_url = server_url
+        self.http = http or default_client()
 
     # 705
     def registerLicense(self, device_name: str):
@@ -50,8 +54,8 @@ class Organization:
         headers = {'Content-Type': 'application/json'}
 
         uri = self.server_url + '/organizations/licenses'
-        r = requests.post(uri, data=values, headers=headers)
-        return r.json()
+        r = self.http.request('POST', uri, idempotent=False, data=values, headers=headers)
+        return parse_json(r)
 
     # 713
     def createUser(self, api_token: str, data: dict):
@@ -79,7 +83,7 @@ class Organization:
         #     "WeightKg": "70"
         # }
         values = {}
-        for key, val in data:
+        for key, val in data.items():
             values[key] = str(val)
 
         values = json.dumps(values)
@@ -88,8 +92,8 @@ class Organization:
         header = {'Content-Type': 'application/json', 'Authorization': auth}
 
         uri = self.server_url + '/organizations/users'
-        r = requests.post(uri, data=values, headers=header)
-        return r.json()
+        r = self.http.request('POST', uri, idempotent=False, data=values, headers=header)
+        return parse_json(r)
 
     # 717
     def login(self, api_token, email, pw, orgID):
@@ -106,11 +110,11 @@ class Organization:
             str -- JSON encoded response
         """
         # [ 717, "1.0", "POST", "login", "/organizations/auth" ],
-        values = {"Email": email, "Password": pw, "Identifier": orgID}
+        values = json.dumps({"Email": email, "Password": pw, "Identifier": orgID})
 
         auth = 'Bearer ' + api_token
         header = {'Content-Type': 'application/json', 'Authorization': auth}
 
         uri = self.server_url + '/organizations/auth'
-        r = requests.post(uri, data=values, headers=header)
-        return r.json()
+        r = self.http.request('POST', uri, data=values, headers=header)
+        return parse_json(r)
@@ -0,0 +1,151 @@
+import asyncio
+import base64
+import json
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context, shared_memory
+
+
+def _share(data) -> tuple:
+    """Copy `data` into a new shared memory block. Returns the block and the data length."""
+    length = len(data)
+    shm = shared_memory.SharedMemory(create=True, size=max(length, 1))
+    shm.buf[:length] = data
+    return shm, length
+
+
+def _take(name: str, length: int) -> bytes:
+    """Read and release a shared memory block created by `_share` in another process."""
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        return bytes(shm.buf[:length])
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def _release(future):
+    """Unlink the output block of a preparation whose caller was cancelled"""
+    if not future.cancelled() and future.exception() is None:
+        name, _ = future.result()
+        shm = shared_memory.SharedMemory(name=name)
+        shm.close()
+        shm.unlink()
+
+
+def _write(head: bytes, body, tail: bytes = b'') -> tuple:
+    """Write `head`, `body` and `tail` into a new shared memory block, copying each only once"""
+    length = len(head) + len(body) + len(tail)
+    out = shared_memory.SharedMemory(create=True, size=max(length, 1))
+    out.buf[:len(head)] = head
+    out.buf[len(head):len(head) + len(body)] = body
+    out.buf[len(head) + len(body):length] = tail
+    out.close()
+    return out.name, length
+
+
+def _prepare_ws(payload_name: str, payload_length: int, meta: bytes, request_id: str, measurement_id: str,
+                chunkOrder: int, action: str, startTime: int, endTime: int, duration: float) -> tuple:
+    """Build a websocket add data frame in a worker process (see `Measurement.add_data_ws`)."""
+    from .measurements import data_frame_head
+    from .measurements_pb2 import DataRequest
+
+    data = DataRequest()
+    data.Params.ID = measurement_id
+    data.ChunkOrder = chunkOrder
+    data.Action = action
+    data.StartTime = startTime
+    data.EndTime = endTime
+    data.Duration = duration
+    data.Meta = meta
+
+    # The payload is copied from the input block straight into the output
+    # block instead of through `DataRequest`
+    shm = shared_memory.SharedMemory(name=payload_name)
+    try:
+        with shm.buf[:payload_length] as payload:
+            return _write(data_frame_head(request_id, data, payload_length), payload)
+    finally:
+        shm.close()
+
+
+def _prepare_rest(payload_name: str, payload_length: int, meta: str, chunkOrder: int, action: str, startTime: int,
+                  endTime: int, duration: float) -> tuple:
+    """Build a REST add data body in a worker process (see `Measurement.add_data_rest`)."""
+    shm = shared_memory.SharedMemory(name=payload_name)
+    try:
+        with shm.buf[:payload_length] as payload:
+            encoded = base64.b64encode(payload)
+    finally:
+        shm.close()
+
+    data = {
+        "ChunkOrder": chunkOrder,
+        "Action": action,
+        "StartTime": startTime,
+        "EndTime": endTime,
+        "Duration": duration,
+        "Meta": str(meta),
+    }
+    # Same as `json.dumps` with "Payload" as the last key. Base64 needs no
+    # escaping, so the encoded payload is not decoded, dumped and encoded.
+    head = json.dumps(data)[:-1].encode('utf-8') + b', "Payload": "'
+    return _write(head, encoded, b'"}')
+
+
+class PayloadPreparer():
+    """`PayloadPreparer` builds wire-ready add data requests in a pool of
+    worker processes, so that protobuf serialization, base64 encoding and
+    JSON encoding of large payloads do not run on the event loop.
+
+    Payloads are handed to the workers, and the prepared requests handed
+    back, through shared memory blocks instead of being pickled. A payload
+    is copied three times: into its block, from there into the output
+    block (base64 encoded for REST), and out of that. Shared memory needs
+    Python 3.8 or newer.
+    """
+    def __init__(self, workers: int = None):
+        """Create a `PayloadPreparer` object
+
+        Keyword Arguments:
+            workers {int} -- Number of worker processes (default: {None}, one per CPU)
+        """
+        self.workers = workers
+        self.executor = ProcessPoolExecutor(workers, mp_context=get_context("spawn"))
+
+    async def _run(self, fn, payload, *args) -> bytes:
+        shm, length = _share(payload)
+        future = self.executor.submit(fn, shm.name, length, *args)
+        try:
+            name, out_length = await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            future.add_done_callback(_release)  # A worker already running still creates its output block
+            raise
+        finally:
+            shm.close()
+            shm.unlink()
+        return _take(name, out_length)
+
+    async def prepare_ws(self, request_id: str, measurement_id: str, chunkOrder: int, action: str, startTime: int,
+                         endTime: int, duration: float, payload: bytes, meta: bytes) -> bytes:
+        """Build the websocket frame `[ string:4 ][ string:10 ][ DataRequest ]`
+        for one chunk (see `Measurement.add_data_ws` for the arguments).
+
+        Returns:
+            bytes -- Frame ready to send
+        """
+        return await self._run(_prepare_ws, payload, bytes(meta), request_id, measurement_id, chunkOrder, action,
+                               startTime, endTime, duration)
+
+    async def prepare_rest(self, chunkOrder: int, action: str, startTime: int, endTime: int, duration: float,
+                           payload: bytes, meta: str) -> bytes:
+        """Build the JSON body for one chunk (see `Measurement.add_data_rest`
+        for the arguments).
+
+        Returns:
+            bytes -- UTF-8 encoded JSON body ready to POST
+        """
+        return await self._run(_prepare_rest, payload, meta, chunkOrder, action, startTime, endTime, duration)
+
+    def shutdown(self):
+        """Stop the worker processes"""
+        self.executor.shutdown()
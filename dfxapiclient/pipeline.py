@@ -0,0 +1,139 @@
+import asyncio
+
+_END = object()  # Marks the end of the payloads
+
+
+class Pipeline():
+    """`Pipeline` streams payloads through a `SimpleClient` and yields the
+    results as they arrive.
+
+    Three stages run concurrently: a producer taking payloads from the
+    caller's (async) iterable, an uploader calling `add_chunk`, and the
+    subscriber from `subscribe_to_results`. The stages are connected by
+    bounded queues (`buffer` payloads, and the client's `received_data`), so
+    a slow consumer of the results slows down the subscriber, whose unread
+    frames count against the client's memory budget, which in turn makes
+    `add_chunk` wait, and a slow upload stops the producer from reading
+    further ahead.
+
+    Measurement creation and rollover into a new measurement after
+    `max_chunks` chunks are handled by the client as for `add_chunk`. Each
+    run is a recording of its own: a client that already uploaded chunks
+    (e.g. in an earlier run with `shutdown=False`) starts a new measurement.
+    The pipeline finishes when every uploaded chunk has its result, when the
+    subscriber is done, or `result_timeout` seconds after the last upload
+    without a new result. An error in any stage stops the others and is
+    raised to the consumer.
+    """
+    def __init__(self, client, buffer: int = 8, result_timeout: float = 60, shutdown: bool = True):
+        """Create a `Pipeline` object
+
+        Arguments:
+            client {SimpleClient} -- Client to upload with
+
+        Keyword Arguments:
+            buffer {int} -- Payloads read ahead of the upload (default: {8})
+            result_timeout {float} -- Seconds to wait for further results after the last upload (default: {60})
+            shutdown {bool} -- Shut the client down when the pipeline finishes (default: {True})
+        """
+        self.client = client
+        self.buffer = buffer
+        self.result_timeout = result_timeout
+        self.shutdown = shutdown
+
+        self.produced = 0
+        self.uploaded = 0
+        self.received = 0
+
+    async def run(self, chunks):
+        """Upload `chunks` and yield their results
+
+        Arguments:
+            chunks {AsyncIterable[libdfx.Payload] or Iterable[libdfx.Payload]} -- DFX SDK Payloads, in order
+
+        Yields:
+            bytes -- Result chunks, as put into `received_data`
+        """
+        client = self.client
+        loop = asyncio.get_running_loop()
+
+        # Flags left behind by an earlier run or by `add_chunk` would make
+        # the stages return at once
+        client.measurement.end = False
+        client.addData_done = True
+        client.subscribe_done = True
+        client.sub_cycle_complete = True
+        if not client.measurement_id or len(client.session_index):
+            await loop.run_in_executor(None, client.create_new_measurement)
+
+        payloads = asyncio.Queue(self.buffer)
+
+        async def produce():
+            if hasattr(chunks, '__aiter__'):
+                async for chunk in chunks:
+                    await payloads.put(chunk)
+                    self.produced += 1
+            else:
+                for chunk in chunks:
+                    await payloads.put(chunk)
+                    self.produced += 1
+            await payloads.put(_END)
+
+        async def upload():
+            while True:
+                chunk = await payloads.get()
+                if chunk is _END:
+                    return
+                await client.add_chunk(chunk)
+                self.uploaded += 1
+
+        producer = asyncio.ensure_future(produce())
+        uploader = asyncio.ensure_future(upload())
+        subscriber = asyncio.ensure_future(client.subscribe_to_results())
+        stages = (producer, uploader, subscriber)
+
+        getter = None
+        last_result = None
+        try:
+            while True:
+                for stage in stages:
+                    if stage.done() and not stage.cancelled() and stage.exception():
+                        raise stage.exception()
+                if uploader.done():
+                    if self.received >= self.uploaded or (subscriber.done() and client.received_data.empty()):
+                        break
+                    last_result = last_result or loop.time()
+                    if loop.time() - last_result > self.result_timeout:
+                        raise asyncio.TimeoutError(
+                            f"Timed out waiting for results ({self.received}/{self.uploaded})")
+
+                if getter is None:
+                    getter = asyncio.ensure_future(client.received_data.get())
+                waiting = [getter] + [stage for stage in stages if not stage.done()]
+                done, _ = await asyncio.wait(waiting,
+                                             timeout=client.subscribe_poll,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if getter in done:
+                    result = getter.result()
+                    getter = None
+                    self.received += 1
+                    last_result = loop.time()
+                    yield result
+        finally:
+            for task in (getter, *stages):
+                if task is not None and not task.done():
+                    task.cancel()
+            client.measurement.end = True  # Lets `subscribeResults` and `add_data_ws` return
+            await asyncio.gather(*(task for task in (getter, *stages) if task is not None), return_exceptions=True)
+            if self.shutdown:
+                await client.shutdown()
+            else:
+                client.measurement.end = False  # The client stays usable
+
+    def stats(self) -> dict:
+        """Progress of the stages
+
+        Returns:
+            dict -- Payloads `produced`, `uploaded`, and results `received`
+        """
+        return {"produced": self.produced, "uploaded": self.uploaded, "received": self.received}
@@ -0,0 +1,277 @@
+import argparse
+import csv
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .organizations import Organization
+from .resilience import CircuitOpenError, HttpClient, RetryPolicy
+
+# Rows whose user exists already count as provisioned, so that a run
+# interrupted between a create and its checkpoint can be resumed
+EXISTS_CODES = ("USER_EXISTS", "USER_ALREADY_EXISTS")
+
+
+def read_users(path: str) -> list:
+    """Read the users to provision from a CSV file with a header row, or a
+    JSONL file (`.jsonl` or `.json`) with one JSON object per line.
+
+    Arguments:
+        path {str} -- File path
+
+    Returns:
+        list -- One dict of user data (`FirstName`, `LastName`, `Email`, `Password`, ...) per row; empty CSV
+            cells are left out
+    """
+    with open(path, newline='') as f:
+        if path.endswith((".jsonl", ".json")):
+            return [json.loads(line) for line in f if line.strip()]
+        return [{key: value for key, value in row.items() if key and value not in (None, '')}
+                for row in csv.DictReader(f)]
+
+
+class RateLimiter():
+    """`RateLimiter` is a thread-safe token bucket: `acquire()` blocks so
+    that at most `rate` calls per second pass on average, with bursts of up
+    to `burst` calls.
+    """
+    def __init__(self, rate: float, burst: int = 1):
+        """Create a `RateLimiter` object
+
+        Arguments:
+            rate {float} -- Calls per second
+
+        Keyword Arguments:
+            burst {int} -- Calls that may pass at once after being idle (default: {1})
+        """
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.waited = 0.0  # Seconds spent waiting in total
+        self.__last = time.monotonic()
+        self.__lock = threading.Lock()
+
+    def acquire(self):
+        """Wait for a token"""
+        with self.__lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.__last) * self.rate)
+            self.__last = now
+            # Take the token now, even if it is only available later, so
+            # that waiting callers are served in order
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+            self.waited += wait
+        if wait:
+            time.sleep(wait)
+
+
+class Provisioner():
+    """`Provisioner` creates many users in an organization concurrently,
+    through `Organization.createUser`.
+
+    Up to `concurrency` requests are in flight at once, over an `HttpClient`
+    whose connection pool holds as many connections, optionally limited to
+    `rate` requests per second. Every row gets a result. Progress is
+    checkpointed to `checkpoint` (if given) every `checkpoint_every` rows and
+    at the end, keyed by email, so a rerun with the same file skips the
+    users already created.
+    """
+    def __init__(self, organization: Organization, api_token: str, concurrency: int = 8, rate: float = None,
+                 checkpoint: str = None, checkpoint_every: int = 20):
+        """Create a `Provisioner` object
+
+        Arguments:
+            organization {Organization} -- Organization to create the users in
+            api_token {str} -- Token of an organization admin
+
+        Keyword Arguments:
+            concurrency {int} -- Users created at the same time (default: {8})
+            rate {float} -- Maximum requests per second (default: {None}, unlimited)
+            checkpoint {str} -- Path of the checkpoint file (default: {None}, not resumable)
+            checkpoint_every {int} -- Rows between checkpoint writes (default: {20})
+        """
+        self.organization = organization
+        self.api_token = api_token
+        self.concurrency = max(1, concurrency)
+        self.limiter = RateLimiter(rate, burst=self.concurrency) if rate else None
+        self.checkpoint_path = checkpoint
+        self.checkpoint_every = max(1, checkpoint_every)
+        self.checkpoint = self.load_checkpoint()
+
+        self.counts = {"created": 0, "exists": 0, "skipped": 0, "failed": 0}
+        self.elapsed = 0.0
+        self.__lock = threading.Lock()
+        self.__unsaved = 0
+
+    def load_checkpoint(self) -> dict:
+        if self.checkpoint_path and os.path.isfile(self.checkpoint_path):
+            with open(self.checkpoint_path) as f:
+                return json.load(f)
+        return {"done": {}}
+
+    def save_checkpoint(self):
+        if not self.checkpoint_path:
+            return
+        # Write to a temporary file and rename, as `Ingest` does
+        tmp = self.checkpoint_path + ".tmp"
+        with open(tmp, 'w') as f:
+            json.dump(self.checkpoint, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.checkpoint_path)
+
+    def create(self, row: int, user: dict) -> dict:
+        """Create one user
+
+        Arguments:
+            row {int} -- Row number, for the result
+            user {dict} -- User data
+
+        Returns:
+            dict -- `row`, `email`, `status` (`created`, `exists`, `skipped` if done in an earlier run, or
+                `failed`), `user_id` and `error`
+        """
+        email = user.get("Email", '')
+        result = {"row": row, "email": email, "status": "failed", "user_id": None, "error": None}
+        if not email:
+            result["error"] = "missing Email"
+            return result
+        if email in self.checkpoint["done"]:
+            result.update(status="skipped", user_id=self.checkpoint["done"][email])
+            return result
+
+        if self.limiter:
+            self.limiter.acquire()
+        try:
+            response = self.organization.createUser(self.api_token, user)
+        except (OSError, CircuitOpenError) as e:  # `requests` exceptions are `OSError`s
+            result["error"] = f"{type(e).__name__}: {e}"
+            return result
+
+        if "ID" in response:
+            result.update(status="created", user_id=response["ID"])
+        elif response.get("Code") in EXISTS_CODES:
+            result["status"] = "exists"
+        else:
+            result["error"] = response.get("Code", "UNKNOWN")
+            return result
+
+        with self.__lock:
+            self.checkpoint["done"][email] = result["user_id"]
+            self.__unsaved += 1
+            if self.__unsaved >= self.checkpoint_every:
+                self.save_checkpoint()
+                self.__unsaved = 0
+        return result
+
+    def run(self, users: list, on_result=None) -> list:
+        """Create all `users`
+
+        Arguments:
+            users {list} -- User data dicts, e.g. from `read_users`
+
+        Keyword Arguments:
+            on_result {callable} -- Called with each row's result as it completes (default: {None})
+
+        Returns:
+            list -- The result of each row, in row order (see `create`)
+        """
+        def create(item):
+            result = self.create(*item)
+            with self.__lock:
+                self.counts[result["status"]] += 1
+            if on_result:
+                on_result(result)
+            return result
+
+        start = time.monotonic()
+        try:
+            with ThreadPoolExecutor(self.concurrency, thread_name_prefix="dfxapiclient-provision") as pool:
+                return list(pool.map(create, enumerate(users)))
+        finally:
+            self.elapsed += time.monotonic() - start
+            with self.__lock:
+                self.save_checkpoint()
+                self.__unsaved = 0
+
+    def stats(self) -> dict:
+        """Row counts by status, throughput and time spent rate limited
+
+        Returns:
+            dict -- The counts, `elapsed_s`, `users_per_s` (created or found existing per second) and
+                `rate_limited_s`
+        """
+        done = self.counts["created"] + self.counts["exists"]
+        return dict(self.counts,
+                    elapsed_s=self.elapsed,
+                    users_per_s=done / self.elapsed if self.elapsed else 0.0,
+                    rate_limited_s=self.limiter.waited if self.limiter else 0.0)
+
+
+def main():
+    """Entry point for the `dfx-provision` console script."""
+    parser = argparse.ArgumentParser(description="Create the users in a CSV or JSONL file in a DFX organization")
+    parser.add_argument("users", help="CSV with a header row, or JSONL (.jsonl/.json), of FirstName, LastName, "
+                        "Email, Password, Gender, DateOfBirth, HeightCm, WeightKg")
+    parser.add_argument("--token", help="organization admin token; or log in with the options below")
+    parser.add_argument("--license-key")
+    parser.add_argument("--email", help="organization admin email")
+    parser.add_argument("--password")
+    parser.add_argument("--org-id", default='', help="organization identifier")
+    parser.add_argument("--server-url", default="https://api.deepaffex.ai:9443", help="REST URL of the DFX API")
+    parser.add_argument("--concurrency", type=int, default=8, help="users created at the same time")
+    parser.add_argument("--rate", type=float, help="maximum requests per second")
+    parser.add_argument("--checkpoint", help="progress file (default: <users>.progress.json)")
+    parser.add_argument("--results", help="write each row's result to this JSONL file")
+    args = parser.parse_args()
+
+    http = HttpClient(RetryPolicy(), pool_size=args.concurrency)
+    organization = Organization(args.license_key or '', args.server_url, http=http)
+
+    token = args.token
+    if not token:
+        if not (args.license_key and args.email and args.password):
+            parser.error("either --token, or --license-key, --email and --password are required")
+        device = organization.registerLicense("dfx-provision")
+        if "Token" not in device:
+            raise SystemExit(f"Could not register the license: {device.get('Code', device)}")
+        admin = organization.login(device["Token"], args.email, args.password, args.org_id)
+        if "Token" not in admin:
+            raise SystemExit(f"Could not log in: {admin.get('Code', admin)}")
+        token = admin["Token"]
+
+    users = read_users(args.users)
+    provisioner = Provisioner(organization,
+                              token,
+                              concurrency=args.concurrency,
+                              rate=args.rate,
+                              checkpoint=args.checkpoint or args.users + ".progress.json")
+    print(f"{len(users)} user(s), {len(provisioner.checkpoint['done'])} already done")
+
+    out = open(args.results, 'w') if args.results else None
+    lock = threading.Lock()
+
+    def report(result):
+        with lock:
+            if result["status"] == "failed":
+                print(f"row {result['row']} {result['email'] or '-'}: {result['error']}")
+            if out:
+                out.write(json.dumps(result) + "\n")
+
+    try:
+        provisioner.run(users, on_result=report)
+    finally:
+        if out:
+            out.close()
+    stats = provisioner.stats()
+    print(f"{stats['created']} created, {stats['exists']} existed, {stats['skipped']} skipped, "
+          f"{stats['failed']} failed in {stats['elapsed_s']:.1f}s ({stats['users_per_s']:.1f} users/s)")
+    if stats["failed"]:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
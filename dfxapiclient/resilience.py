@@ -0,0 +1,412 @@
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlsplit
+
+import requests
+from urllib3.exceptions import NewConnectionError
+
+
+class CircuitOpenError(ConnectionError):
+    """Raised instead of sending a request to a host whose circuit is open"""
+
+
+class RetryPolicy():
+    """`RetryPolicy` decides whether and when a failed request is retried.
+
+    Delays grow exponentially with full jitter (a random delay between 0
+    and `base_delay * 2**attempt`, capped at `max_delay`), so that many
+    devices failing at the same moment do not retry in lockstep.
+
+    Retries are also limited by a budget shared by all requests using the
+    policy: every request adds `budget_ratio` tokens (up to `budget_max`),
+    every retry takes one. When the server is failing most requests, this
+    caps retries at about `budget_ratio` of the traffic instead of
+    multiplying it by `max_attempts`.
+    """
+    def __init__(self, max_attempts: int = 4, base_delay: float = 0.2, max_delay: float = 5, deadline: float = 30,
+                 budget_ratio: float = 0.2, budget_max: float = 10, retry_statuses: tuple = (429, 502, 503, 504)):
+        """Create a `RetryPolicy` object
+
+        Keyword Arguments:
+            max_attempts {int} -- Attempts per call, including the first (default: {4})
+            base_delay {float} -- Delay scale in seconds (default: {0.2})
+            max_delay {float} -- Upper bound of one delay in seconds (default: {5})
+            deadline {float} -- No retry is started this many seconds after the first attempt (default: {30})
+            budget_ratio {float} -- Retry tokens earned per request (default: {0.2})
+            budget_max {float} -- Retry tokens that can be saved up, and the initial budget (default: {10})
+            retry_statuses {tuple} -- HTTP statuses that are retried (default: {(429, 502, 503, 504)})
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.budget_ratio = budget_ratio
+        self.budget_max = budget_max
+        self.retry_statuses = retry_statuses
+
+        self.budget = budget_max
+        self.retries = 0
+        self.budget_exhausted = 0
+        self.__lock = threading.Lock()
+
+    def delay(self, attempt: int) -> float:
+        """Seconds to wait before retry number `attempt` (starting at 0)"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    def record_request(self):
+        """Earn retry budget for one request"""
+        with self.__lock:
+            self.budget = min(self.budget_max, self.budget + self.budget_ratio)
+
+    def take_retry(self) -> bool:
+        """Spend budget on one retry. Returns False if the budget is exhausted."""
+        with self.__lock:
+            if self.budget < 1:
+                self.budget_exhausted += 1
+                return False
+            self.budget -= 1
+            self.retries += 1
+            return True
+
+
+class CircuitBreaker():
+    """`CircuitBreaker` stops requests to a failing host.
+
+    After `failure_threshold` consecutive failures the circuit opens and
+    requests fail immediately with `CircuitOpenError`. After
+    `reset_timeout` seconds one trial request is let through (half open):
+    if it succeeds the circuit closes, otherwise it opens again.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 10):
+        """Create a `CircuitBreaker` object
+
+        Keyword Arguments:
+            failure_threshold {int} -- Consecutive failures that open the circuit (default: {5})
+            reset_timeout {float} -- Seconds before a trial request is allowed (default: {10})
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.rejected = 0
+        self.__lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a request may be sent now"""
+        with self.__lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return True  # The trial request
+            if self.state == self.CLOSED:
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self.__lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self.__lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class HedgePolicy():
+    """`HedgePolicy` decides when a read-only request is hedged.
+
+    If a response has not arrived after the hedge delay, a duplicate request
+    is sent on another pooled connection and whichever response arrives first
+    is used. The delay is the `percentile` of the latencies of recent hedged
+    requests, so that only about the slowest `100 - percentile` percent of
+    requests send a duplicate. Until `min_samples` latencies are known, the
+    fixed `initial_delay` is used.
+    """
+    def __init__(self, percentile: float = 95, initial_delay: float = 1.0, min_delay: float = 0.01,
+                 window: int = 200, min_samples: int = 20):
+        """Create a `HedgePolicy` object
+
+        Keyword Arguments:
+            percentile {float} -- Latency percentile used as the hedge delay (default: {95})
+            initial_delay {float} -- Hedge delay in seconds before enough latencies are known (default: {1.0})
+            min_delay {float} -- Lower bound of the hedge delay in seconds (default: {0.01})
+            window {int} -- Number of recent latencies kept (default: {200})
+            min_samples {int} -- Latencies needed before the percentile is used (default: {20})
+        """
+        self.percentile = percentile
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.latencies = deque(maxlen=window)
+
+        self.requests = 0
+        self.hedges = 0  # Duplicates sent
+        self.hedge_wins = 0  # Duplicates that answered first
+        self.__lock = threading.Lock()
+
+    def delay(self) -> float:
+        """Seconds to wait for a response before sending a duplicate"""
+        with self.__lock:
+            if len(self.latencies) < self.min_samples:
+                return self.initial_delay
+            latencies = sorted(self.latencies)
+        k = min(len(latencies) - 1, int(self.percentile / 100 * len(latencies)))
+        return max(self.min_delay, latencies[k])
+
+    def record(self, latency: float):
+        """Record the latency of one request (original or duplicate), in seconds"""
+        with self.__lock:
+            self.latencies.append(latency)
+
+    def record_outcome(self, hedged: bool, hedge_won: bool):
+        with self.__lock:
+            self.requests += 1
+            self.hedges += hedged
+            self.hedge_wins += hedge_won
+
+    def stats(self) -> dict:
+        """Hedging counters
+
+        Returns:
+            dict -- `requests`, `hedges` fired, `hedge_wins`, and the current `delay_s`
+        """
+        return {"requests": self.requests, "hedges": self.hedges, "hedge_wins": self.hedge_wins,
+                "delay_s": self.delay()}
+
+
+def _not_sent(error: Exception) -> bool:
+    """Whether a request failed before it reached the server, so that even
+    a non-idempotent request can be retried safely."""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = error.args[0] if error.args else None
+    return isinstance(reason, NewConnectionError) or isinstance(getattr(reason, 'reason', None), NewConnectionError)
+
+
+class HttpClient():
+    """`HttpClient` sends the REST requests of `User`, `Organization` and
+    `Measurement` through one `requests.Session` (reusing connections),
+    with a `RetryPolicy` and a `CircuitBreaker` per host.
+
+    Idempotent calls are retried on connection errors, timeouts and the
+    policy's retry statuses. Non-idempotent calls (such as creating a
+    measurement) are only retried when the request provably did not reach
+    the server: the connection could not be opened, or the server answered
+    429 or 503.
+    """
+    def __init__(self, policy: RetryPolicy = None, failure_threshold: int = 5, reset_timeout: float = 10,
+                 timeout: tuple = (5, 60), hedge: HedgePolicy = None, pool_size: int = 10):
+        """Create an `HttpClient` object
+
+        Keyword Arguments:
+            policy {RetryPolicy} -- Retry policy (default: {None}, a `RetryPolicy()` with its defaults)
+            failure_threshold {int} -- Consecutive failures that open a host's circuit (default: {5})
+            reset_timeout {float} -- Seconds an open circuit waits before a trial request (default: {10})
+            timeout {tuple} -- Connect and read timeouts in seconds (default: {(5, 60)})
+            hedge {HedgePolicy} -- Hedge requests made with `hedge=True` (default: {None}, never hedge)
+            pool_size {int} -- Connections kept open per host; more concurrent requests than this open
+                connections that are closed again afterwards (default: {10})
+        """
+        self.policy = policy or RetryPolicy()
+        self.hedge = hedge
+        self.__hedge_pool = None
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.timeout = timeout
+        self.session = requests.Session()
+        if pool_size != 10:  # The `requests` default
+            adapter = requests.adapters.HTTPAdapter(pool_maxsize=pool_size)
+            self.session.mount('http://', adapter)
+            self.session.mount('https://', adapter)
+        self.last_used = time.monotonic()  # Last request, for closing idle connections
+        self.breakers = {}
+        self.__lock = threading.Lock()
+
+    def breaker(self, url: str) -> CircuitBreaker:
+        """The circuit breaker of the host of `url`"""
+        host = urlsplit(url).netloc
+        with self.__lock:
+            if host not in self.breakers:
+                self.breakers[host] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            return self.breakers[host]
+
+    def request(self, method: str, url: str, idempotent: bool = True, hedge: bool = False,
+                **kwargs) -> requests.Response:
+        """Send a request, retrying as the policy allows
+
+        Arguments:
+            method {str} -- HTTP method
+            url {str} -- URL
+
+        Keyword Arguments:
+            idempotent {bool} -- Whether the request may be repeated if it might have been processed
+                (default: {True})
+            hedge {bool} -- Whether the request is read-only and may be hedged, if this client has a
+                `HedgePolicy` (default: {False})
+            kwargs -- Passed on to `requests.Session.request`
+
+        Raises:
+            CircuitOpenError: If the host's circuit is open
+            requests.exceptions.RequestException: If the last attempt failed to connect or timed out
+
+        Returns:
+            requests.Response -- Response of the last attempt, which may be an error status
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        self.last_used = time.monotonic()
+        if hedge and self.hedge and idempotent:
+            return self.__hedged(method, url, **kwargs)
+        return self.__send(method, url, idempotent, **kwargs)
+
+    def __send(self, method: str, url: str, idempotent: bool, **kwargs) -> requests.Response:
+        breaker = self.breaker(url)
+        policy = self.policy
+        policy.record_request()
+        start = time.monotonic()
+
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                raise CircuitOpenError(f"Circuit open for {urlsplit(url).netloc}, not sending {method} {url}")
+
+            error = None
+            response = None
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                    requests.exceptions.ChunkedEncodingError) as e:
+                error = e
+            except BaseException:
+                # Any other error (undecodable body, too many redirects, ...)
+                # still has to be recorded, or a half-open circuit would wait
+                # for the outcome of its trial request forever
+                breaker.record_failure()
+                raise
+
+            if error is not None or response.status_code >= 500:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+
+            if error is not None:
+                retryable = idempotent or _not_sent(error)
+            else:
+                status = response.status_code
+                retryable = status in policy.retry_statuses and (idempotent or status in (429, 503))
+
+            attempt += 1
+            if (not retryable or attempt >= policy.max_attempts or time.monotonic() - start >= policy.deadline
+                    or not policy.take_retry()):
+                if error is not None:
+                    raise error
+                return response
+            time.sleep(policy.delay(attempt - 1))
+
+    def __hedged(self, method: str, url: str, **kwargs) -> requests.Response:
+        hedge = self.hedge
+        with self.__lock:
+            if self.__hedge_pool is None:
+                self.__hedge_pool = ThreadPoolExecutor(8, thread_name_prefix="dfxapiclient-hedge")
+            pool = self.__hedge_pool
+
+        def attempt():
+            start = time.perf_counter()
+            response = self.__send(method, url, True, **kwargs)
+            hedge.record(time.perf_counter() - start)
+            return response
+
+        def discard(future):
+            # The losing request cannot be interrupted once sent, but its
+            # response is closed so its connection goes back to the pool
+            if not future.cancelled() and future.exception() is None:
+                future.result().close()
+
+        futures = [pool.submit(attempt)]
+        done, pending = wait(futures, timeout=hedge.delay())
+        if not done:
+            futures.append(pool.submit(attempt))
+            pending = set(futures)
+
+        error = None
+        winner = None
+        while winner is None and (done or pending):
+            if not done:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            future = done.pop()
+            if future.exception() is None:
+                winner = future
+            else:
+                error = future.exception()
+
+        for future in futures:
+            if future is not winner and not future.cancel():
+                future.add_done_callback(discard)
+        hedged = len(futures) > 1
+        hedge.record_outcome(hedged, hedged and winner is futures[1])
+        if winner is None:
+            raise error
+        return winner.result()
+
+    def stats(self) -> dict:
+        """Retry, circuit breaker and hedging counters
+
+        Returns:
+            dict -- `retries`, `budget`, `budget_exhausted`, per host `circuits` state, and `hedge` counters
+                (see `HedgePolicy.stats`) or None
+        """
+        with self.__lock:
+            breakers = dict(self.breakers)
+        return {
+            "retries": self.policy.retries,
+            "budget": self.policy.budget,
+            "budget_exhausted": self.policy.budget_exhausted,
+            "circuits": {
+                host: {"state": b.state, "failures": b.failures, "rejected": b.rejected}
+                for host, b in breakers.items()
+            },
+            "hedge": self.hedge.stats() if self.hedge else None,
+        }
+
+
+def parse_json(response: requests.Response) -> dict:
+    """Decode a JSON response body. A body that is not a JSON object, such
+    as an HTML error page from a proxy, is returned as an error dict with a
+    `Code` instead of raising.
+
+    Arguments:
+        response {requests.Response} -- Response
+
+    Returns:
+        dict -- Decoded body
+    """
+    try:
+        body = response.json()
+    except ValueError:
+        body = None
+    if isinstance(body, dict):
+        return body
+    return {"Code": f"HTTP_{response.status_code}", "Message": response.text[:200]}
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def default_client() -> HttpClient:
+    """The `HttpClient` shared by all objects not given their own"""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = HttpClient()
+        return _default
@@ -0,0 +1,194 @@
+import os
+import queue
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+# Every record in a results file is a header followed by the result bytes
+# as received from the websocket:
+#   [ chunk order:uint32 ][ received at (ns since epoch):uint64 ][ length:uint32 ][ result:length ]
+RECORD_HEADER = struct.Struct('<IQI')
+
+FSYNC_POLICIES = ("never", "batch", "always")
+
+# Results files kept open at a time; the least recently written one is
+# synced and closed to make room, so a long-lived client does not leak a
+# file descriptor per measurement
+_MAX_OPEN_FILES = 16
+
+
+def result_path(folder: str, measurement_id: str) -> str:
+    """Path of the results file of `measurement_id` in `folder`"""
+    return os.path.join(folder, f"{measurement_id}.results")
+
+
+def read_results(path: str):
+    """Iterate over the records of a results file written by `ResultSink`.
+
+    Yields:
+        tuple -- (chunk order, received at in ns since epoch, result bytes)
+    """
+    with open(path, 'rb') as f:
+        while True:
+            header = f.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return  # End of file, or a record cut short by a crash
+            chunk_order, received_ns, length = RECORD_HEADER.unpack(header)
+            data = f.read(length)
+            if len(data) < length:
+                return
+            yield chunk_order, received_ns, data
+
+
+class ResultSink():
+    """`ResultSink` persists result chunks to `receive_folder` as they arrive.
+
+    `write` only puts the result on an unbounded queue and returns, so disk
+    latency never stalls the websocket reader. A background thread drains
+    the queue in batches and appends each result to a per-measurement
+    results file (see `read_results` for the format). Only the most
+    recently written files are kept open.
+
+    The `fsync` policy decides what survives a crash: `"never"` leaves
+    flushing to the OS, `"batch"` fsyncs each file once per batch written,
+    and `"always"` fsyncs after every result.
+
+    With `archive=True` the folder is an indexed results archive instead
+    (see `dfxapiclient.archive`), for random access to individual chunks.
+    """
+    def __init__(self, folder: str, fsync: str = "batch", archive: bool = False, budget=None):
+        """Create a `ResultSink` object and start its writer thread
+
+        Arguments:
+            folder {str} -- Folder the results files are written to, created if missing
+
+        Keyword Arguments:
+            fsync {str} -- fsync policy, one of `never`, `batch` or `always` (default: {"batch"})
+            archive {bool} -- Write to an indexed archive instead of per-measurement files (default: {False})
+            budget {MemoryBudget} -- Account queued results against this budget (default: {None})
+
+        Raises:
+            ValueError: If the fsync policy is not valid
+        """
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Invalid fsync policy {fsync!r}, must be one of {', '.join(FSYNC_POLICIES)}")
+        os.makedirs(folder, exist_ok=True)
+
+        self.folder = folder
+        self.fsync = fsync
+        self.written = 0  # Number of results written to disk
+        self.error = None  # First error raised by the writer thread
+        self.budget = budget
+
+        self.__queue = queue.SimpleQueue()
+        self.__files = OrderedDict()  # Measurement ID -> file, least recently written first
+        self.__archive = None
+        if archive:
+            from .archive import ArchiveWriter
+            self.__archive = ArchiveWriter(folder)
+        self.__closed = False
+        self.__thread = threading.Thread(target=self.__run, name="dfxapiclient-resultsink", daemon=True)
+        self.__thread.start()
+
+    def write(self, measurement_id: str, chunk_order: int, data: bytes):
+        """Queue one result chunk to be written. Never blocks.
+
+        Arguments:
+            measurement_id {str} -- Measurement the result belongs to
+            chunk_order {int} -- Chunk number of the result
+            data {bytes} -- Result as received
+        """
+        if self.__closed:
+            raise RuntimeError("ResultSink is closed")
+        data = bytes(data)
+        if self.budget:
+            self.budget.charge("result_sink", len(data))
+        self.__queue.put((measurement_id, chunk_order, time.time_ns(), data))
+
+    def close(self):
+        """Write all queued results, close the files and stop the writer thread
+
+        Raises:
+            OSError: If the writer thread failed to write a result
+            ValueError: If a measurement ID was too long for the archive
+        """
+        if not self.__closed:
+            self.__closed = True
+            self.__queue.put(None)
+            self.__thread.join()
+        if self.error:
+            raise self.error
+
+    def __file(self, measurement_id: str, touched: set):
+        f = self.__files.get(measurement_id)
+        if f is not None:
+            self.__files.move_to_end(measurement_id)
+            return f
+        if len(self.__files) >= _MAX_OPEN_FILES:
+            _, oldest = self.__files.popitem(last=False)
+            touched.discard(oldest)
+            try:
+                self.__sync(oldest, self.fsync != "never")
+            finally:
+                oldest.close()
+        f = open(result_path(self.folder, measurement_id), 'ab')
+        self.__files[measurement_id] = f
+        return f
+
+    def __run(self):
+        running = True
+        while running:
+            # Block for the first item, then take whatever else has queued up
+            # in the meantime so that it is written in one batch.
+            batch = [self.__queue.get()]
+            while True:
+                try:
+                    batch.append(self.__queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            touched = set()
+            for item in batch:
+                if item is None:
+                    running = False
+                    continue
+                measurement_id, chunk_order, received_ns, data = item
+                if self.budget:
+                    self.budget.release("result_sink", len(data))
+                if self.error:
+                    continue  # Keep draining so that `close` does not hang
+                try:
+                    if self.__archive:
+                        self.__archive.append(measurement_id, chunk_order, data, received_ns)
+                        f = self.__archive
+                    else:
+                        f = self.__file(measurement_id, touched)
+                        f.write(RECORD_HEADER.pack(chunk_order, received_ns, len(data)))
+                        f.write(data)
+                    if self.fsync == "always":
+                        self.__sync(f, True)
+                    touched.add(f)
+                    self.written += 1
+                except (OSError, ValueError) as e:
+                    self.error = e
+
+            for f in touched:
+                try:
+                    self.__sync(f, self.fsync == "batch")
+                except OSError as e:
+                    self.error = self.error or e
+
+        for f in self.__files.values():
+            f.close()
+        self.__files.clear()
+        if self.__archive:
+            self.__archive.close()
+
+    def __sync(self, f, fsync: bool):
+        if f is self.__archive:
+            f.flush(fsync=fsync)
+        else:
+            f.flush()
+            if fsync:
+                os.fsync(f.fileno())
@@ -0,0 +1,139 @@
+import socket
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+_DEFAULT_PORTS = {"http": 80, "ws": 80, "https": 443, "wss": 443}
+
+
+def eligible_servers(servers: dict, server: str) -> list:
+    """Servers in the same region group as `server`: all `-cn` servers for a
+    `-cn` server, and all other servers otherwise, e.g. `qa`, `dev`, `demo`
+    and `prod` for `prod`, but never `prod-cn` or `demo-cn`.
+
+    Arguments:
+        servers {dict} -- Server name to `server_url` and `websocket_url`
+        server {str} -- Server the license was issued for
+
+    Returns:
+        list -- Eligible server names
+    """
+    china = server.endswith("-cn")
+    return [name for name in servers if name.endswith("-cn") == china]
+
+
+def probe(url: str, timeout: float = 2) -> float:
+    """Time a TCP connect to the host and port of `url`
+
+    Arguments:
+        url {str} -- REST or websocket URL
+
+    Keyword Arguments:
+        timeout {float} -- Seconds to wait for the connection (default: {2})
+
+    Returns:
+        float -- Connect time in seconds, or None if the connection failed
+    """
+    parts = urlsplit(url)
+    port = parts.port or _DEFAULT_PORTS.get(parts.scheme, 443)
+    start = time.perf_counter()
+    try:
+        with socket.create_connection((parts.hostname, port), timeout=timeout):
+            return time.perf_counter() - start
+    except OSError:
+        return None
+
+
+class ServerSelector():
+    """`ServerSelector` picks the lowest-latency server among candidates.
+
+    A server's latency is the median of `attempts` TCP connect times to its
+    REST endpoint and to its websocket endpoint, whichever is slower. All
+    candidates are probed concurrently. A server with any failed probe is
+    unreachable.
+    """
+    def __init__(self, servers: dict, attempts: int = 3, timeout: float = 2, margin: float = 1.5,
+                 min_gain: float = 0.02, prober=probe):
+        """Create a `ServerSelector` object
+
+        Arguments:
+            servers {dict} -- Candidate server name to `server_url` and `websocket_url`
+
+        Keyword Arguments:
+            attempts {int} -- Probes per endpoint (default: {3})
+            timeout {float} -- Seconds to wait for each probe (default: {2})
+            margin {float} -- How many times slower the current server must be to fail over (default: {1.5})
+            min_gain {float} -- Seconds of latency a failover must save at least (default: {0.02})
+            prober {callable} -- `(url, timeout)` -> seconds or None, e.g. to add simulated latency to local
+                stand-in servers (default: {probe})
+        """
+        self.servers = servers
+        self.attempts = attempts
+        self.timeout = timeout
+        self.margin = margin
+        self.min_gain = min_gain
+        self.prober = prober
+        self.latencies = {}  # Server name -> seconds, or None if unreachable
+        self.probed_at = None
+
+    def __latency(self, name: str) -> float:
+        worst = 0
+        for url in (self.servers[name]["server_url"], self.servers[name]["websocket_url"]):
+            samples = [self.prober(url, self.timeout) for _ in range(self.attempts)]
+            if None in samples:
+                return None
+            worst = max(worst, statistics.median(samples))
+        return worst
+
+    def probe_all(self) -> dict:
+        """Probe all candidates
+
+        Returns:
+            dict -- Server name to latency in seconds, or None if unreachable
+        """
+        names = list(self.servers)
+        with ThreadPoolExecutor(max(1, len(names))) as pool:
+            self.latencies = dict(zip(names, pool.map(self.__latency, names)))
+        self.probed_at = time.monotonic()
+        return self.latencies
+
+    def best(self) -> str:
+        """The reachable candidate with the lowest latency, from the last probe
+
+        Raises:
+            ConnectionError: If no candidate is reachable
+        """
+        reachable = {name: latency for name, latency in self.latencies.items() if latency is not None}
+        if not reachable:
+            raise ConnectionError(f"None of the servers {', '.join(self.servers)} is reachable")
+        return min(reachable, key=reachable.get)
+
+    def select(self) -> str:
+        """Probe all candidates and return the best one"""
+        self.probe_all()
+        return self.best()
+
+    def should_fail_over(self, current: str) -> str:
+        """Re-probe and decide whether to leave `current`
+
+        Arguments:
+            current {str} -- Server in use
+
+        Returns:
+            str -- Server to switch to, or None to stay
+        """
+        self.probe_all()
+        try:
+            best = self.best()
+        except ConnectionError:
+            return None  # Nowhere better to go
+        latency = self.latencies.get(current)
+        if best == current:
+            return None
+        if latency is None:
+            return best
+        gain = latency - self.latencies[best]
+        if latency > self.latencies[best] * self.margin and gain > self.min_gain:
+            return best
+        return None
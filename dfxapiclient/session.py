@@ -0,0 +1,198 @@
+import bisect
+import heapq
+import json
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+SessionResult = namedtuple("SessionResult", ["chunk", "measurement_id", "local_chunk", "data"])
+SessionResult.__doc__ = "One result of a long session, by global chunk number"
+
+
+class SessionIndex():
+    """`SessionIndex` maps the global chunk numbers of a long recording to
+    the measurements holding them.
+
+    A recording longer than the mode's limit is split into several
+    measurements (see `SimpleClient.add_chunk`). Every acknowledged chunk is
+    recorded with the measurement it went into; consecutive chunks in the
+    same measurement form one segment, so the index stays small and a lookup
+    is a binary search over the segment starts.
+    """
+    def __init__(self):
+        self.starts = []  # First global chunk of each segment, ascending
+        self.measurement_ids = []  # Measurement of each segment
+        self.ends = []  # One past the last global chunk of each segment
+        self.__lock = threading.Lock()
+
+    def record(self, chunk: int, measurement_id: str):
+        """Record that global chunk `chunk` was acknowledged into `measurement_id`"""
+        with self.__lock:
+            i = bisect.bisect_right(self.starts, chunk) - 1
+            if i >= 0 and self.measurement_ids[i] == measurement_id and chunk <= self.ends[i]:
+                self.ends[i] = max(self.ends[i], chunk + 1)
+                return
+            if i >= 0 and self.starts[i] <= chunk < self.ends[i]:
+                raise ValueError(f"Chunk {chunk} is already in measurement {self.measurement_ids[i]}")
+            self.starts.insert(i + 1, chunk)
+            self.measurement_ids.insert(i + 1, measurement_id)
+            self.ends.insert(i + 1, chunk + 1)
+
+    def locate(self, chunk: int) -> tuple:
+        """Find the measurement holding a global chunk
+
+        Arguments:
+            chunk {int} -- Global chunk number
+
+        Raises:
+            KeyError: If the chunk was not recorded
+
+        Returns:
+            tuple -- Measurement ID and the chunk's position within that measurement
+        """
+        with self.__lock:
+            i = bisect.bisect_right(self.starts, chunk) - 1
+            if i < 0 or chunk >= self.ends[i]:
+                raise KeyError(chunk)
+            # Earlier segments of the same measurement come before this one
+            local = chunk - self.starts[i]
+            for j in range(i):
+                if self.measurement_ids[j] == self.measurement_ids[i]:
+                    local += self.ends[j] - self.starts[j]
+            return self.measurement_ids[i], local
+
+    def measurements(self) -> list:
+        """Measurement IDs of the session, in chunk order"""
+        with self.__lock:
+            return list(dict.fromkeys(self.measurement_ids))
+
+    def segments(self) -> list:
+        """`(first chunk, end chunk, measurement ID)` of each segment, in chunk order"""
+        with self.__lock:
+            return list(zip(self.starts, self.ends, self.measurement_ids))
+
+    def __len__(self):
+        with self.__lock:
+            return sum(end - start for start, end in zip(self.starts, self.ends))
+
+    def to_dict(self) -> dict:
+        """The index as a JSON-serializable dict, e.g. to store with the recording"""
+        return {"segments": [list(segment) for segment in self.segments()]}
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        """Rebuild an index saved with `to_dict`"""
+        index = cls()
+        for start, end, measurement_id in data.get("segments", ()):
+            index.starts.append(start)
+            index.ends.append(end)
+            index.measurement_ids.append(measurement_id)
+        return index
+
+
+class LongSession():
+    """`LongSession` presents the measurements of one long recording as a
+    single logical recording.
+
+    `ordered()` turns the results of all its measurements, which arrive
+    measurement by measurement and not necessarily in order, into one stream
+    ordered by global chunk number. `retrieve()` fetches all measurements in
+    parallel and merges their results.
+    """
+    def __init__(self, client, index: SessionIndex = None):
+        """Create a `LongSession` object
+
+        Arguments:
+            client {SimpleClient} -- Client that uploads (or uploaded) the recording
+
+        Keyword Arguments:
+            index {SessionIndex} -- Index of the recording (default: {None}, the client's `session_index`)
+        """
+        self.client = client
+        self.index = index if index is not None else client.session_index
+
+    def __chunk_of(self, data) -> tuple:
+        """Global chunk number and measurement ID of a result, from its JSON"""
+        try:
+            result = json.loads(bytes(data))
+            return int(result["ChunkOrder"]), result.get("ID", '')
+        except (ValueError, KeyError, TypeError):
+            return None, ''
+
+    async def ordered(self, results=None, first_chunk: int = 0):
+        """Yield results in global chunk order
+
+        Results that arrive ahead of a missing chunk are held back until it
+        arrives. Results without a chunk number are passed through as they
+        arrive. When the source ends, held results are yielded in order
+        despite gaps.
+
+        Keyword Arguments:
+            results {AsyncIterable[bytes]} -- Result chunks, e.g. from `SimpleClient.stream` (default: {None}, the
+                client's `received_data`, until `num_chunks` results were received)
+            first_chunk {int} -- Global number of the first chunk of the recording (default: {0})
+
+        Yields:
+            SessionResult -- Global chunk number, measurement ID, position within the measurement, and result
+        """
+        if results is None:
+            results = self.__received()
+
+        held = []  # Heap of (chunk, arrival, data)
+        expected = first_chunk
+        arrival = 0
+        async for data in results:
+            chunk, measurement_id = self.__chunk_of(data)
+            if chunk is None:
+                yield SessionResult(None, measurement_id, None, data)
+                continue
+            heapq.heappush(held, (chunk, arrival, data))
+            arrival += 1
+            while held and held[0][0] <= expected:
+                chunk, _, data = heapq.heappop(held)
+                expected = max(expected, chunk + 1)
+                yield self.__result(chunk, data)
+        while held:
+            chunk, _, data = heapq.heappop(held)
+            yield self.__result(chunk, data)
+
+    def __result(self, chunk: int, data) -> SessionResult:
+        try:
+            measurement_id, local = self.index.locate(chunk)
+        except KeyError:
+            measurement_id, local = self.__chunk_of(data)[1], None
+        return SessionResult(chunk, measurement_id, local, data)
+
+    async def __received(self):
+        for _ in range(self.client.num_chunks):
+            yield await self.client.received_data.get()
+
+    def retrieve(self, parallel: int = 4) -> dict:
+        """Retrieve the results of all measurements of the session in
+        parallel and merge them
+
+        Keyword Arguments:
+            parallel {int} -- Measurements retrieved at the same time (default: {4})
+
+        Returns:
+            dict -- `Measurements`: the retrieve response of each measurement, in chunk order; `Results`: the
+                results of all measurements per signal, ordered by chunk; `Errors`: measurement ID to error code
+                for measurements that could not be retrieved
+        """
+        measurement_ids = self.index.measurements()
+        measurement = self.client.measurement
+        with ThreadPoolExecutor(max(1, min(parallel, len(measurement_ids)))) as pool:
+            responses = list(pool.map(measurement.retrieve, measurement_ids))
+
+        merged = {"Measurements": [], "Results": {}, "Errors": {}}
+        for measurement_id, response in zip(measurement_ids, responses):
+            if "Results" not in response:
+                merged["Errors"][measurement_id] = response.get("Code", "UNKNOWN")
+                continue
+            merged["Measurements"].append(response)
+            for signal, entries in response["Results"].items():
+                merged["Results"].setdefault(signal, []).extend(
+                    dict(entry, MeasurementID=measurement_id) for entry in entries)
+        for entries in merged["Results"].values():
+            entries.sort(key=lambda entry: int(entry.get("ChunkOrder", 0)))
+        return merged
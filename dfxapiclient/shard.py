@@ -0,0 +1,419 @@
+import asyncio
+import bisect
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import struct
+import tempfile
+import time
+import uuid
+from collections import deque, namedtuple
+from multiprocessing import shared_memory
+
+from .payloadpool import _share, _take
+
+ShardChunk = namedtuple("ShardChunk", ["payload_data", "metadata", "start_time_s", "end_time_s", "duration_s"])
+ShardChunk.__doc__ = "A payload chunk as rebuilt in a worker process, with the attributes `upload_split` reads"
+
+# Frames sent from a worker to the parent with `send_bytes`, so results are
+# not pickled: b'R' + session key length (1 byte) + session key +
+# measurement ID length (1 byte) + measurement ID + result, b'J' + a JSON
+# report of a finished session (with its `session` key), and once at startup
+# b'K' (ready) or b'E' + the error
+_RESULT = b'R'
+_REPORT = b'J'
+_READY = b'K'
+_ERROR = b'E'
+
+
+class HashRing():
+    """`HashRing` assigns keys to nodes by consistent hashing.
+
+    Every node is placed on the ring `replicas` times; a key belongs to the
+    first node at or after its own hash. Removing a node only moves the keys
+    that were on it, spread over the remaining nodes.
+    """
+    def __init__(self, nodes=(), replicas: int = 64):
+        """Create a `HashRing` object
+
+        Keyword Arguments:
+            nodes {Iterable} -- Initial nodes (default: {()})
+            replicas {int} -- Points per node on the ring (default: {64})
+        """
+        self.replicas = replicas
+        self.hashes = []  # Sorted
+        self.owners = {}  # Hash -> node
+        for node in nodes:
+            self.add(node)
+
+    @staticmethod
+    def hash(key: str) -> int:
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'big')
+
+    def add(self, node):
+        for i in range(self.replicas):
+            h = self.hash(f"{node}#{i}")
+            if h not in self.owners:
+                bisect.insort(self.hashes, h)
+            self.owners[h] = node
+
+    def remove(self, node):
+        for i in range(self.replicas):
+            h = self.hash(f"{node}#{i}")
+            if self.owners.get(h) == node:
+                del self.owners[h]
+                self.hashes.pop(bisect.bisect_left(self.hashes, h))
+
+    def node_for(self, key: str):
+        """The node owning `key`
+
+        Raises:
+            LookupError: If the ring is empty
+        """
+        if not self.hashes:
+            raise LookupError("No nodes")
+        i = bisect.bisect_left(self.hashes, self.hash(key)) % len(self.hashes)
+        return self.owners[self.hashes[i]]
+
+    def __len__(self):
+        return len(set(self.owners.values()))
+
+
+def _worker_main(conn, worker_no: int, options: dict, config: str, concurrency: int, result_timeout: float):
+    """Entry point of a worker process: upload the sessions sent by the
+    parent with `BulkUploader.upload_split`, over this process's own
+    websockets and HTTP connection pool."""
+    from .bulkupload import BulkUploader
+    from .simpleclient import SimpleClient
+
+    # A copy of the parent's credential cache: the tokens are reused
+    # without logging in again, and workers never write to the same file
+    with tempfile.TemporaryDirectory() as tmp:
+        config_file = os.path.join(tmp, f"worker-{worker_no}.config")
+        shutil.copyfile(config, config_file)
+        try:
+            client = SimpleClient(**dict(options, config_file=config_file, device_name=f"shard-{worker_no}"))
+        except Exception as e:
+            conn.send_bytes(_ERROR + repr(e).encode())
+            return
+        conn.send_bytes(_READY)
+
+        async def run():
+            try:
+                await _worker_loop(conn, BulkUploader(client, result_timeout=result_timeout), concurrency)
+            finally:
+                await client.shutdown()  # On the loop its websockets belong to
+
+        asyncio.run(run())
+
+
+async def _worker_loop(conn, uploader, concurrency: int):
+    loop = asyncio.get_running_loop()
+    jobs = asyncio.Queue()
+
+    def on_readable():
+        while conn.poll():
+            try:
+                jobs.put_nowait(conn.recv())
+            except EOFError:
+                loop.remove_reader(conn.fileno())
+                jobs.put_nowait(None)
+                return
+
+    loop.add_reader(conn.fileno(), on_readable)
+
+    async def upload(session, measurement_id, chunks):
+        header = _RESULT + struct.pack('B', len(session)) + session.encode()
+
+        def forward(measurement_id, data):
+            try:
+                conn.send_bytes(header + struct.pack('B', len(measurement_id)) + measurement_id.encode() + bytes(data))
+            except OSError:  # The parent is gone
+                pass
+
+        # The measurement is created here if the session has none, so that
+        # creating them is spread over the workers too
+        try:
+            report = await uploader.upload_split(chunks, measurement_id=measurement_id, on_result=forward)
+        except Exception as e:
+            # The parent waits for a report of every session
+            report = {"measurement_id": measurement_id, "chunks": 0, "errors": [str(e) or repr(e)]}
+        report.pop("results", None)
+        report["session"] = session
+        try:
+            conn.send_bytes(_REPORT + json.dumps(report).encode())
+        except OSError:  # The parent is gone
+            pass
+
+    running = set()
+    while True:
+        job = await jobs.get()
+        if job is None:  # Parent closed the pipe
+            break
+        session, measurement_id, chunks = job
+        chunks = [ShardChunk(_take(name, length), meta, start, end, duration)
+                  for name, length, meta, start, end, duration in chunks]
+        while len(running) >= concurrency:
+            _, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+        running.add(asyncio.ensure_future(upload(session, measurement_id, chunks)))
+    if running:
+        await asyncio.wait(running)
+
+
+class ShardedUploader():
+    """`ShardedUploader` spreads measurement sessions over worker processes,
+    so that framing, TLS and serialization use more than one core.
+
+    The parent logs in once; each worker starts from a copy of its
+    credential cache and has its own `SimpleClient`, HTTP connection pool
+    and event loop, and uploads the sessions given to it with
+    `BulkUploader.upload_split` (one websocket per session in flight),
+    creating the measurement of a session that has none. Sessions are
+    assigned to workers by consistent hashing of their key: the measurement
+    ID if given, otherwise a random one (`HashRing`). Payloads are handed to
+    the workers through shared memory, and results come back as raw byte
+    frames over a pipe.
+
+    At most `concurrency` sessions per worker are handed over at a time;
+    the rest wait in the parent, without their payloads in shared memory.
+    If a worker exits, its sessions in flight fail and it is taken off the
+    ring, so later sessions go to the others.
+    """
+    def __init__(self, options: dict, workers: int = None, concurrency: int = 4, result_timeout: float = 60):
+        """Create a `ShardedUploader` object
+
+        Arguments:
+            options {dict} -- `SimpleClient` keyword arguments, including `license_key`, `study_id`, `email`,
+                `password` and `config_file`
+
+        Keyword Arguments:
+            workers {int} -- Worker processes (default: {None}, one per core)
+            concurrency {int} -- Sessions each worker uploads at the same time (default: {4})
+            result_timeout {float} -- Seconds to wait for each session's results (default: {60})
+        """
+        self.options = dict(options)
+        self.workers = workers or os.cpu_count() or 1
+        self.concurrency = concurrency
+        self.result_timeout = result_timeout
+
+        self.client = None
+        self.ring = HashRing()
+        self.processes = {}  # Worker -> process
+        self.conns = {}  # Worker -> pipe
+        self.pending = {}  # Worker -> deque of sessions not yet handed over
+        self.in_flight = {}  # Worker -> {session key: (measurement ID, future of its report)}
+        self.shared = {}  # Session key in flight -> names of its shared memory blocks
+        self.counts = {}  # Worker -> sessions, chunks, results
+        self.on_result = None
+        self.__collected = {}  # Session key -> results, without `on_result`
+
+    def start(self, timeout: float = 60):
+        """Log in and start the workers
+
+        Keyword Arguments:
+            timeout {float} -- Seconds to wait for the workers to be ready (default: {60})
+
+        Raises:
+            ConnectionError: If a worker could not be started
+        """
+        from .simpleclient import SimpleClient
+
+        if self.processes:
+            return
+        self.client = SimpleClient(**self.options)
+        context = multiprocessing.get_context("spawn")
+        for worker in range(self.workers):
+            parent, child = context.Pipe()
+            process = context.Process(target=_worker_main,
+                                      args=(child, worker, self.options, self.client.config_file, self.concurrency,
+                                            self.result_timeout),
+                                      name=f"dfxapiclient-shard-{worker}",
+                                      daemon=True)
+            process.start()
+            child.close()
+            self.processes[worker] = process
+            self.conns[worker] = parent
+            self.pending[worker] = deque()
+            self.in_flight[worker] = {}
+            self.counts[worker] = {"sessions": 0, "chunks": 0, "results": 0}
+            self.ring.add(worker)
+
+        # Workers log in from the copied cache before taking sessions
+        deadline = time.monotonic() + timeout
+        for worker, conn in self.conns.items():
+            try:
+                frame = conn.recv_bytes() if conn.poll(max(0, deadline - time.monotonic())) else b'Etimed out'
+            except EOFError:
+                frame = b'Eexited'
+            if frame != _READY:
+                self.stop(timeout=0)
+                raise ConnectionError(f"Shard worker {worker} failed to start: {frame[1:].decode()}")
+
+    async def upload(self, sessions, on_result=None) -> list:
+        """Upload sessions, each into one measurement
+
+        Arguments:
+            sessions {Iterable} -- Chunk lists (a measurement is created for each), or `(measurement ID, chunks)`
+                tuples for existing measurements; chunks have the attributes of a `libdfx.Payload`
+
+        Keyword Arguments:
+            on_result {callable} -- Called with the measurement ID and each result (bytes) as it arrives, instead
+                of collecting the results in the reports (default: {None})
+
+        Returns:
+            list -- One report per session, in order (see `BulkUploader.upload_split`), with the `worker`
+        """
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.start)  # Logs in and waits for the workers
+        self.on_result = on_result
+        for worker, conn in self.conns.items():
+            loop.add_reader(conn.fileno(), self.__on_readable, worker)
+
+        futures = []
+        try:
+            for session in sessions:
+                if isinstance(session, tuple):
+                    measurement_id, chunks = session
+                    key = measurement_id
+                else:
+                    # The worker creates the measurement
+                    measurement_id, chunks = '', session
+                    key = uuid.uuid4().hex
+                future = loop.create_future()
+                futures.append(future)
+                try:
+                    worker = self.ring.node_for(key)
+                except LookupError:
+                    future.set_result(self.__failed(key, measurement_id, None, "no worker left"))
+                    continue
+                self.pending[worker].append((key, measurement_id, list(chunks), future))
+                self.__dispatch(worker)
+            return list(await asyncio.gather(*futures))
+        finally:
+            for conn in self.conns.values():
+                loop.remove_reader(conn.fileno())
+
+    def __dispatch(self, worker: int):
+        pending = self.pending[worker]
+        while pending and len(self.in_flight[worker]) < self.concurrency:
+            key, measurement_id, chunks, future = pending.popleft()
+            shared = []
+            for chunk in chunks:
+                shm, length = _share(chunk.payload_data)
+                shm.close()  # The worker unlinks it
+                shared.append((shm.name, length, bytes(chunk.metadata or b''), chunk.start_time_s, chunk.end_time_s,
+                               chunk.duration_s))
+            try:
+                self.conns[worker].send((key, measurement_id, shared))
+            except OSError:  # The worker exited
+                for name, length, *_ in shared:
+                    _take(name, length)
+                pending.appendleft((key, measurement_id, chunks, future))
+                self.__lost(worker)
+                return
+            self.in_flight[worker][key] = (measurement_id, future)
+            self.shared[key] = [name for name, *_ in shared]
+            self.__collected[key] = []
+
+    def __on_readable(self, worker: int):
+        conn = self.conns[worker]
+        while True:
+            try:
+                if not conn.poll():
+                    return
+                frame = conn.recv_bytes()
+            except (EOFError, OSError):
+                self.__lost(worker)
+                return
+            if frame[:1] == _RESULT:
+                n = frame[1]
+                key = frame[2:2 + n].decode()
+                m = frame[2 + n]
+                measurement_id = frame[3 + n:3 + n + m].decode()
+                data = frame[3 + n + m:]
+                self.counts[worker]["results"] += 1
+                if self.on_result:
+                    self.on_result(measurement_id, data)
+                else:
+                    self.__collected.setdefault(key, []).append(data)
+            else:
+                report = json.loads(frame[1:])
+                key = report.pop("session")
+                report["worker"] = worker
+                self.shared.pop(key, None)  # The worker unlinked them
+                report["results"] = self.__collected.pop(key, [])
+                self.counts[worker]["sessions"] += 1
+                self.counts[worker]["chunks"] += report["chunks"]
+                _, future = self.in_flight[worker].pop(key, (None, None))
+                if future and not future.done():
+                    future.set_result(report)
+                self.__dispatch(worker)
+
+    def __failed(self, key: str, measurement_id: str, worker, error: str) -> dict:
+        return {"measurement_id": measurement_id, "chunks": 0, "errors": [error], "worker": worker,
+                "results": self.__collected.pop(key, [])}
+
+    def __lost(self, worker: int):
+        """A worker exited: fail its sessions and hand its queued ones to the others"""
+        if worker not in self.ring.owners.values():
+            return
+        asyncio.get_running_loop().remove_reader(self.conns[worker].fileno())
+        self.ring.remove(worker)
+        for key, (measurement_id, future) in self.in_flight.pop(worker).items():
+            self.__unlink(self.shared.pop(key, ()))
+            if not future.done():
+                future.set_result(self.__failed(key, measurement_id, worker, "worker exited"))
+        self.in_flight[worker] = {}
+        pending, self.pending[worker] = self.pending[worker], deque()
+        for key, measurement_id, chunks, future in pending:
+            try:
+                other = self.ring.node_for(key)
+            except LookupError:
+                future.set_result(self.__failed(key, measurement_id, None, "no worker left"))
+                continue
+            self.pending[other].append((key, measurement_id, chunks, future))
+            self.__dispatch(other)
+
+    @staticmethod
+    def __unlink(names):
+        """Release the shared memory blocks of a session the worker may not have taken"""
+        for name in names:
+            try:
+                shm = shared_memory.SharedMemory(name=name)
+            except FileNotFoundError:  # Already taken by the worker
+                continue
+            shm.close()
+            shm.unlink()
+
+    def stop(self, timeout: float = 30):
+        """Let the workers finish and stop them"""
+        for conn in self.conns.values():
+            conn.close()
+        deadline = time.monotonic() + timeout
+        for process in self.processes.values():
+            process.join(max(0, deadline - time.monotonic()))
+            if process.is_alive():
+                process.terminate()
+        self.processes.clear()
+        self.conns.clear()
+
+    def stats(self) -> dict:
+        """Per worker counts
+
+        Returns:
+            dict -- For each worker: `sessions` finished, `chunks` acknowledged, `results` received, and whether
+                it is `alive`
+        """
+        return {
+            worker: dict(counts, alive=worker in self.processes and self.processes[worker].is_alive())
+            for worker, counts in self.counts.items()
+        }
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
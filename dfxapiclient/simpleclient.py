@@ -2,11 +2,16 @@ import asyncio
 import copy
 import json
 import os
+import threading
+import time
 import uuid
 
 from .measurements import Measurement
-from .measurements_pb2 import SubscribeResultsRequest
+from .memory import MemoryBudget
 from .organizations import Organization
+from .resilience import parse_json
+from .session import SessionIndex
+from .tokens import token_expiry
 from .users import User
 from .websocketHelper import WebsocketHandler
 
@@ -39,7 +44,29 @@ class SimpleClient():
                  add_method: str = "REST",
                  measurement_mode: str = "DISCRETE",
                  chunk_length: float = 15,
-                 video_length: float = 60):
+                 video_length: float = 60,
+                 server_url: str = None,
+                 websocket_url: str = None,
+                 prepare_workers: int = 0,
+                 receive_folder: str = None,
+                 receive_fsync: str = "batch",
+                 receive_archive: bool = False,
+                 ping_interval: float = 0,
+                 select_server: bool = False,
+                 candidate_servers=None,
+                 reprobe_interval: float = 300,
+                 refresh_tokens: bool = True,
+                 retry_policy=None,
+                 hedge_policy=None,
+                 memory_limit: int = None,
+                 prewarm: bool = False,
+                 warm_connections: int = 2,
+                 keepalive_interval: float = 30,
+                 idle_timeout: float = 300,
+                 ws_topology: str = "shared",
+                 monitor_loop: bool = True,
+                 loop_lag_threshold: float = 0.1,
+                 loop_debug: bool = False):
         """[summary]
 
         Arguments:
@@ -63,6 +90,41 @@ class SimpleClient():
             measurement_mode {str} -- Measurement mode (only DISCRETE supported for now) (default: {"DISCRETE"})
             chunk_length {float} -- Chunk length in seconds (default: {15})
             video_length {float} -- Video length in seconds (default: {60})
+            server_url {str} -- Custom REST URL for `server`, e.g. a `MockServer` (default: {None})
+            websocket_url {str} -- Custom websocket URL for `server` (default: {None})
+            prepare_workers {int} -- Worker processes for preparing add data requests, 0 to prepare them on the
+                event loop (default: {0})
+            receive_folder {str} -- Folder to record received results in (default: {None})
+            receive_fsync {str} -- fsync policy for recorded results, `never`, `batch` or `always` (default: {"batch"})
+            receive_archive {bool} -- Record results in an indexed archive in `receive_folder` (default: {False})
+            ping_interval {float} -- Seconds between websocket health pings, replacing the keepalive pings of
+                `websockets`; 0 keeps those and disables health monitoring (default: {0})
+            select_server {bool} -- Use the lowest-latency server among the candidates instead of `server`, and
+                fail over between measurements when it degrades (default: {False})
+            candidate_servers {Union[list, dict]} -- Server names, or server names to `server_url` and
+                `websocket_url`, to choose from; required with a custom `server_url` and `websocket_url`
+                (default: {None}, the built-in servers in the same region group as `server`)
+            reprobe_interval {float} -- Seconds after which the servers are probed again (default: {300})
+            refresh_tokens {bool} -- Renew the user token in the background before it expires (default: {True})
+            retry_policy {RetryPolicy} -- Retry policy for REST requests (default: {None}, the shared client's)
+            hedge_policy {HedgePolicy} -- Hedge read-only REST requests such as retrieving results
+                (default: {None}, never hedge)
+            memory_limit {int} -- Bytes the client may buffer in total, see `memory_stats` (default: {None},
+                unlimited)
+            prewarm {bool} -- Open the REST connections (and, inside an event loop, the websocket) in the
+                background at creation, see `warmup` (default: {False})
+            warm_connections {int} -- REST connections opened ahead of use by `warmup` (default: {2})
+            keepalive_interval {float} -- Seconds between keepalive requests on warm connections (default: {30})
+            idle_timeout {float} -- Seconds without use after which warm connections are closed (default: {300})
+            ws_topology {str} -- `shared`: one websocket for add data and results; `split`: a second websocket
+                just for subscriptions, so large result frames cannot delay add data acks (default: {"shared"})
+            monitor_loop {bool} -- Measure the event loop's scheduling delay, see `stats` (default: {True})
+            loop_lag_threshold {float} -- Loop lag in seconds that counts as a stall (default: {0.1})
+            loop_debug {bool} -- Capture the stack of calls blocking the loop longer than the threshold
+                (default: {False})
+
+        Raises:
+            ValueError: If `ws_topology` is not valid, or `select_server` has fewer than two candidates
         """
 
         # License key and study ID needs to be provided by the admin
@@ -75,6 +137,9 @@ class SimpleClient():
         self.chunk_length = chunk_length
         self.measurement_mode = measurement_mode.upper()
         self.config_file = config_file
+        self.receive_folder = receive_folder
+        self.receive_fsync = receive_fsync
+        self.receive_archive = receive_archive
         self.chunks = None
         self.device_token = ''
         self.device_id = ''
@@ -82,14 +147,49 @@ class SimpleClient():
         self.user_token = ''
         self.measurement_id = ''
         self.received_data = asyncio.Queue(30)  # Queue for storing results
+        self.session_index = SessionIndex()  # Which measurement holds which chunk of a long recording
+        self.session_conflicts = 0  # Acknowledged chunks the index could not record
+        self.memory = MemoryBudget(memory_limit)  # Accounts every buffered byte
 
         self.__valid_servers = {}
         self.__measurement_modes = {}
-        self.__get_urls()
+        self.__get_urls(server_url, websocket_url, candidate_servers if select_server else None)
         self.__measurement_mode()
 
-        self.user = User(self.server_url, firstname, lastname, email, password, gender, dateofbirth, height, weight)
-        self.organization = Organization(license_key, self.server_url)
+        # Pick the closest server by probing the candidates
+        self.selector = None
+        self.reprobe_interval = reprobe_interval
+        if select_server:
+            from .serverselect import ServerSelector, eligible_servers
+            if not candidate_servers:
+                if server_url and websocket_url:
+                    raise ValueError("select_server with a custom server_url needs candidate_servers")
+                candidate_servers = eligible_servers(self.__valid_servers, self.server)
+            if len(candidate_servers) < 2:
+                raise ValueError(f"select_server needs at least two candidate servers, got {list(candidate_servers)}")
+            self.selector = ServerSelector({name: self.__valid_servers[name] for name in candidate_servers})
+            self.server = self.selector.select()
+            self.server_url = self.__valid_servers[self.server]["server_url"]
+            self.websocket_url = self.__valid_servers[self.server]["websocket_url"]
+
+        # REST requests are retried and guarded by per-host circuit breakers
+        from .resilience import HttpClient, default_client
+        if retry_policy or hedge_policy:
+            self.http = HttpClient(retry_policy, hedge=hedge_policy)
+        else:
+            self.http = default_client()
+
+        self.user = User(self.server_url,
+                         firstname,
+                         lastname,
+                         email,
+                         password,
+                         gender,
+                         dateofbirth,
+                         height,
+                         weight,
+                         http=self.http)
+        self.organization = Organization(license_key, self.server_url, http=self.http)
 
         # Some boolean variables (flags) and floats (time in seconds) for
         # asynchronous signalling purposes.
@@ -101,9 +201,35 @@ class SimpleClient():
         self.subscribe_poll = 0.2  # Time values for signalling and polling
         self.subscribe_signal = 0.5
 
+        self.__token_lock = threading.RLock()  # Serializes logins, token swaps and config writes
         self.__setup()  # Register license, create user and login user
 
-        self.ws_obj = WebsocketHandler(self.user_token, self.websocket_url)
+        # Pings the websocket to track its RTT, adapt the receive timeouts and
+        # detect a dead peer
+        self.health = None
+        if ping_interval:
+            from .health import ConnectionHealth
+            self.health = ConnectionHealth(ping_interval)
+
+        if ws_topology not in ("shared", "split"):
+            raise ValueError(f"Invalid ws_topology {ws_topology!r}, must be 'shared' or 'split'")
+        self.ws_topology = ws_topology
+        self.ws_obj = WebsocketHandler(self.user_token, self.websocket_url, health=self.health, budget=self.memory)
+        self.results_ws = None
+        if ws_topology == "split":
+            # Subscriptions get their own connection; the health monitor stays
+            # on `ws_obj`, where the acknowledgement latency matters
+            self.results_ws = WebsocketHandler(self.user_token, self.websocket_url, budget=self.memory)
+
+        self.preparer = None
+        if prepare_workers > 0:
+            from .payloadpool import PayloadPreparer
+            self.preparer = PayloadPreparer(prepare_workers)
+
+        self.sink = None
+        if receive_folder:
+            from .resultsink import ResultSink
+            self.sink = ResultSink(receive_folder, fsync=receive_fsync, archive=receive_archive, budget=self.memory)
 
         self.measurement = Measurement(self.study_id,
                                        self.server_url,
@@ -111,12 +237,69 @@ class SimpleClient():
                                        self.num_chunks,
                                        self.max_chunks,
                                        mode=self.measurement_mode,
-                                       token=self.user_token)
+                                       token=self.user_token,
+                                       preparer=self.preparer,
+                                       http=self.http,
+                                       budget=self.memory,
+                                       results_ws=self.results_ws)
         self.received_data = self.measurement.received_data
 
-    def __get_urls(self):
+        # Renews the user token ahead of its JWT `exp` claim, so that requests
+        # do not fail on an expired token first
+        self.refresher = None
+        if refresh_tokens:
+            from .tokens import TokenRefresher
+            self.refresher = TokenRefresher(self.__refresh_token, self.user_token)
+
+        # Measures the event loop lag once the client is used inside a loop
+        self.loop_monitor = None
+        if monitor_loop or loop_debug:
+            from .loopmonitor import LoopLagMonitor
+            self.loop_monitor = LoopLagMonitor(threshold=loop_lag_threshold, debug=loop_debug)
+
+        # Connections opened ahead of use by `warmup`
+        from .warmup import ConnectionWarmer, WebsocketReaper
+        self.warmer = ConnectionWarmer(self.http, self.server_url, warm_connections, keepalive_interval, idle_timeout)
+        self.reaper = WebsocketReaper(self.ws_handlers(), idle_timeout)
+        self.warmup_task = None
+        self.warmup_error = None  # Exception of a failed background `warmup`
+        if prewarm:
+            self.warmer.start()
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                pass  # No event loop yet; the websocket opens on first use or `warmup`
+            else:
+                self.start_warmup()
+
+    def start_warmup(self):
+        """Run `warmup` in the background on the running event loop, as
+        `warmup_task`. If it fails, the connections open on first use and
+        the error is kept in `warmup_error`."""
+        if self.warmup_task is None or self.warmup_task.done():
+            self.warmup_task = asyncio.ensure_future(self.warmup())
+            self.warmup_task.add_done_callback(self.__warmup_done)
+
+    def __warmup_done(self, task):
+        # A failed prewarm is not fatal, the connections open on first use
+        # instead. The error is kept for `stats` (retrieving it also keeps
+        # asyncio from reporting it as never retrieved).
+        if not task.cancelled():
+            self.warmup_error = task.exception()
+
+    def __get_urls(self, server_url: str = None, websocket_url: str = None, candidate_servers=None):
         """`Get the REST, websocket, or gRPC urls.
 
+        If both `server_url` and `websocket_url` are given, they are registered
+        under the `server` name instead, so that a local stand-in server
+        (`MockServer`) can be used.
+
+        Keyword Arguments:
+            server_url {str} -- Custom REST URL (default: {None})
+            websocket_url {str} -- Custom websocket URL (default: {None})
+            candidate_servers {Union[list, dict]} -- Candidates for `select_server`; custom ones given as a dict
+                of URLs are registered too (default: {None})
+
         Raises:
             KeyError: if server key was not in list
         """
@@ -146,6 +329,10 @@ class SimpleClient():
                 "websocket_url": "wss://demo.api.deepaffex.cn:9080"
             }
         }
+        if server_url and websocket_url:
+            self.__valid_servers[self.server] = {"server_url": server_url, "websocket_url": websocket_url}
+        if isinstance(candidate_servers, dict):
+            self.__valid_servers.update(candidate_servers)
         try:
             self.server_url = self.__valid_servers[self.server]["server_url"]
             self.websocket_url = self.__valid_servers[self.server]["websocket_url"]
@@ -230,9 +417,19 @@ class SimpleClient():
                     if copied[server][key][k] == {} or copied[server][key][k] == "":
                         data[server][key].pop(k, None)
 
-        with open(self.config_file, 'w') as f:
-            d = json.dumps(data)
-            f.write(d)
+        # Write to a temporary file and rename, so that a crash or a
+        # concurrent reader never sees a truncated config. The token lock
+        # keeps the token refresh thread of this client from writing the
+        # temporary file at the same time. The process ID in its name keeps
+        # other processes sharing the config file from writing to the same
+        # temporary file; the last rename wins.
+        tmp = f"{self.config_file}.{os.getpid()}.tmp"
+        with self.__token_lock:
+            with open(tmp, 'w') as f:
+                json.dump(data, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.config_file)
 
     def __setup(self):
         """Performs the activities necessary for setting up the client.
@@ -296,9 +493,10 @@ class SimpleClient():
             # The user information and credentials are already handled in the
             # `User` class, so it only needs to pass in the `device_token`.
 
-            # User token
-            if ("user_token" not in data[self.server][self.license_key][self.user.email].keys()
-                    or data[self.server][self.license_key][self.user.email]["user_token"] == ''):
+            # User token (a cached token that has already expired is renewed)
+            cached = data[self.server][self.license_key][self.user.email].get("user_token", '')
+            expiry = token_expiry(cached)
+            if cached == '' or (expiry is not None and expiry <= time.time()):
                 res = self.user.login(self.device_token)
 
                 if res == "INVALID_USER":
@@ -324,25 +522,108 @@ class SimpleClient():
         # Record updated data into the config file.
         self.__record(data=data)
 
-    def create_new_measurement(self) -> str:
+    def __use_token(self, token: str):
+        """Switch all requests over to a new user token.
+
+        Each header is replaced by a new dict in a single assignment, so a
+        request in flight keeps the complete old header and the next one
+        gets the complete new one. The open websocket stays authenticated
+        with the old token; the new headers are used when it reconnects.
+        """
+        self.user_token = token
+        self.measurement.token = token
+        self.measurement.header = {'Content-Type': 'application/json', 'Authorization': 'Bearer ' + token}
+        for ws_obj in self.ws_handlers():
+            ws_obj.token = token
+            ws_obj.headers = dict(Authorization="Bearer {}".format(token))
+
+    def __config_token(self) -> str:
+        """The user token cached in the config file"""
+        with open(self.config_file) as json_file:
+            data = json.load(json_file)
+        return data[self.server][self.license_key][self.user.email]["user_token"]
+
+    def __start_loop_monitor(self):
+        if self.loop_monitor and not self.loop_monitor.running:
+            self.loop_monitor.start()
+
+    def ws_handlers(self) -> list:
+        """The websocket handlers in use: `ws_obj`, and `results_ws` with split connections"""
+        return [self.ws_obj] + ([self.results_ws] if self.results_ws else [])
+
+    def __refresh_token(self) -> str:
+        """Log in again for a new user token and switch over to it (called by
+        the `TokenRefresher` thread).
+
+        Raises:
+            PermissionError: If the login fails
+
+        Returns:
+            str -- New user token
+        """
+        with self.__token_lock:
+            res = self.user.login(self.device_token)
+            if res != self.user.user_token or not res:
+                raise PermissionError(f"Could not refresh the user token: {res}")
+            self.__use_token(res)
+
+            with open(self.config_file) as f:
+                data = json.load(f)
+            user = data.setdefault(self.server, {}).setdefault(self.license_key, {}).setdefault(self.user.email, {})
+            user["user_token"] = res
+            self.__record(data=data)
+        return res
+
+    def create_new_measurement(self, new_recording: bool = True) -> str:
         """Create a new measurement by calling to the `create` endpoint under
         `Measurement`.
 
+        With `select_server`, this is also where the client fails over to
+        a faster server, if the current one is dead or the last probe is
+        older than `reprobe_interval` and a new one finds a better server.
+
+        Keyword Arguments:
+            new_recording {bool} -- Start a new `session_index`; False when a long recording rolls over into
+                another measurement (default: {True})
+
         Returns:
             str -- Measurement ID
         """
+        if self.selector and self.addData_done and self.subscribe_done:
+            dead = self.health is not None and self.health.dead
+            if dead or time.monotonic() - self.selector.probed_at > self.reprobe_interval:
+                self.failover()
+
         try:
             self.measurement.create()
         except ValueError:
-            # Handling if existing token is invalid
-            self.__setup()
+            # Handling if existing token is invalid: renew it and retry once
+            self.__refresh_token()
+            if self.refresher:
+                self.refresher.update(self.user_token)
             self.measurement.create()
 
         self.measurement_id = self.measurement.measurement_id
+        if new_recording:
+            # Chunk numbers start again; `LongSession`s of the previous
+            # recording keep the old index. All of the recording's chunks are
+            # still to be subscribed to, and the websocket closed after them.
+            self.session_index = SessionIndex()
+            self.measurement.chunks_rem = self.num_chunks
+            self.complete = False
         return self.measurement_id
 
+    def __record_chunk(self, chunk: int, measurement_id: str):
+        """Record an acknowledged chunk in `session_index`. The chunk is on
+        the server already, so a conflicting record (e.g. chunk numbers
+        reused without a new measurement) is counted, not raised."""
+        try:
+            self.session_index.record(chunk, measurement_id)
+        except ValueError:
+            self.session_conflicts += 1
+
     #
-    async def subscribe_to_results(self, token='', measurement_id=''):
+    async def subscribe_to_results(self, token='', measurement_id='', receive_folder=''):
         """Subscribe to results to this measurement by call to the
         `measurement.subscribeResults` endpoint, which requests and establishes
         a websocket connection to receive payloads from a measurement.
@@ -354,26 +635,41 @@ class SimpleClient():
         Keyword Arguments:
             token {str} -- User or device token(default: {''})
             measurement_id {str} -- Measurement ID (default: {''})
+            receive_folder {str} -- Folder to record results in, instead of `receive_folder` from
+                `__init__` (default: {''})
 
         Raises:
             ValueError: If token was not passed or in config file
         """
-        # If params are not provided, take the last one stored
-        with open(self.config_file) as json_file:
-            data = json.load(json_file)
-            if token == '':
-                token = data[self.server][self.license_key][self.user.email]["user_token"]
+        # If params are not provided, take the last one stored. The token in
+        # memory is kept in sync with the config file, which is only read
+        # (blocking the event loop) if there is none.
+        self.__start_loop_monitor()
+        if token == '':
+            token = self.user_token or self.__config_token()
 
         if token == '':
             raise ValueError("No user token provided. Please log in.")
         if not measurement_id or measurement_id == '':
             measurement_id = self.measurement_id
 
+        # Results are recorded by a `ResultSink`: the one from `__init__`, or
+        # one just for this subscription if a different folder was given.
+        sink = self.sink
+        if receive_folder and receive_folder != self.receive_folder:
+            from .resultsink import ResultSink
+            sink = ResultSink(receive_folder,
+                              fsync=self.receive_fsync,
+                              archive=self.receive_archive,
+                              budget=self.memory)
+
         # Updates some variables and creates the headers. Also generate a 10-digit
         # request ID and sets the action ID, which are needed to make a websocket request.
         self.subscribe_done = False
         self.sub_cycle_complete = False
 
+        from .measurements_pb2 import SubscribeResultsRequest  # Only needed for the websocket transport
+
         # Randomly generated 10-digit hexdecimal request ID
         requestID = uuid.uuid4().hex[:10]  # Or can use requestID = "0000000001"
         actionID = '0510'  # Action ID of the endpoint (see DFX API documentation Section 3.6)
@@ -400,9 +696,16 @@ class SimpleClient():
                 request.RequestID = requestID
 
                 data = f'{actionID:4}{requestID:10}'.encode() + request.SerializeToString()
-                done, count = await self.measurement.subscribeResults(data,
-                                                                      chunk_num=chunk_no,
-                                                                      result_queue=self.received_data)
+                try:
+                    done, count = await self.measurement.subscribeResults(data,
+                                                                          chunk_num=chunk_no,
+                                                                          result_queue=self.received_data,
+                                                                          sink=sink,
+                                                                          measurement_id=measurement_id)
+                except BaseException:
+                    if sink is not self.sink:
+                        await asyncio.get_running_loop().run_in_executor(None, sink.close)
+                    raise
             else:
                 await asyncio.sleep(self.subscribe_poll)  # For polling
                 if self.measurement_id != measurement_id:
@@ -418,6 +721,9 @@ class SimpleClient():
                 await asyncio.sleep(self.subscribe_signal)  # Need to give time to signal
 
         self.subscribe_done = True  # Signal that the entire process is done
+        if sink is not self.sink:
+            # Waits for the writer thread to flush (and fsync) the results
+            await asyncio.get_running_loop().run_in_executor(None, sink.close)
         await self.__handle_exit()
 
     async def add_chunk(self, chunk, token: str = '', measurement_id: str = ''):
@@ -432,12 +738,15 @@ class SimpleClient():
 
         Raises:
             ValueError: If token was not passed or in config file
+
+        Returns:
+            int -- Status of the add data request (of the resent one after a rollover), 0 without a response
         """
-        # If params are not provided, take the last one stored
-        with open(self.config_file) as json_file:
-            data = json.load(json_file)
-            if token == '':
-                token = data[self.server][self.license_key][self.user.email]["user_token"]
+        # If params are not provided, take the last one stored (see
+        # `subscribe_to_results`)
+        self.__start_loop_monitor()
+        if token == '':
+            token = self.user_token or self.__config_token()
 
         if token == '':
             raise ValueError("No user token provided. Please log in.")
@@ -477,49 +786,61 @@ class SimpleClient():
         endTime = properties['end_time_s']
         duration = properties['duration_s']
 
-        # Websockets
-        status = 0
-        body = {}
-        if self.conn_method == "websocket" or self.conn_method == "ws":
-            if not self.ws_obj.ws:
-                await self.ws_obj.connect_ws()
-            response = await self.measurement.add_data_ws(measurement_id, chunkOrder, action, startTime, endTime,
-                                                          duration, payload, meta)
-            if response:
-                status = int(response[10:13].decode('utf-8'))
-                body = response.decode('utf-8')
-            else:
-                self.addData_done = True
-        # REST
-        else:
-            response = await self.measurement.add_data_rest(measurement_id, chunkOrder, action, startTime, endTime,
-                                                            duration, payload, meta)
-            status = int(response.status_code)
-            body = response.json()
-
-        # Handle several types of errors.
-        # Since `addData` times out after 120s for each measurement, when that
-        # happens, we make a call to an internal method `__handle_ws_timeout`.
-        # If timeout occurs earlier than 120s, or if there is another type of
-        # error, the `addData` process would stop by setting
-        # `self.addData_done = True`.
-        if int(status) != 200:
-            if int(status) == 400 or int(status) == 405:
-                if chunk_num * duration < 120 and chunk_num != 0:  # Timed out earlier than 120s
+        # The payload is held until it is acknowledged (or resent into a new
+        # measurement). A full memory budget makes this wait, which slows the
+        # producer down instead of buffering without bound.
+        held = len(payload) + len(meta or b'')
+        await self.memory.acquire("in_flight", held)
+        try:
+            # Websockets
+            status = 0
+            body = {}
+            if self.conn_method == "websocket" or self.conn_method == "ws":
+                if not self.ws_obj.ws or self.ws_obj.ws.closed:  # Reopen after an idle close
+                    await self.ws_obj.connect_ws()
+                response = await self.measurement.add_data_ws(measurement_id, chunkOrder, action, startTime, endTime,
+                                                              duration, payload, meta)
+                if response:
+                    status = int(response[10:13].decode('utf-8'))
+                    body = response.decode('utf-8', errors='replace')
+                else:
                     self.addData_done = True
+            # REST
+            else:
+                response = await self.measurement.add_data_rest(measurement_id, chunkOrder, action, startTime, endTime,
+                                                                duration, payload, meta)
+                status = int(response.status_code)
+                body = parse_json(response)
+
+            # Handle several types of errors.
+            # Since `addData` times out after 120s for each measurement, when that
+            # happens, we make a call to an internal method `__handle_ws_timeout`.
+            # If timeout occurs earlier than 120s, or if there is another type of
+            # error, the `addData` process would stop by setting
+            # `self.addData_done = True`.
+            if int(status) == 200:
+                self.__record_chunk(chunk_num, measurement_id)
+            else:
+                if int(status) == 400 or int(status) == 405:
+                    if chunk_num * duration < 120 and chunk_num != 0:  # Timed out earlier than 120s
+                        self.addData_done = True
 
-                if self.conn_method == "websocket" or self.conn_method == "ws":
-                    if 'MEASUREMENT_CLOSED' in body:
-                        await self.__handle_ws_timeout(chunkOrder, action, startTime, endTime, duration, payload, meta)
+                    if self.conn_method == "websocket" or self.conn_method == "ws":
+                        if 'MEASUREMENT_CLOSED' in body:
+                            status = await self.__handle_ws_timeout(chunkOrder, action, startTime, endTime, duration,
+                                                                    payload, meta)
+                        else:
+                            self.addData_done = True
                     else:
-                        self.addData_done = True
+                        if body.get('Code') == 'MEASUREMENT_CLOSED':
+                            status = await self.__handle_ws_timeout(chunkOrder, action, startTime, endTime, duration,
+                                                                    payload, meta)
+                        else:
+                            self.addData_done = True
                 else:
-                    if body['Code'] == 'MEASUREMENT_CLOSED':
-                        await self.__handle_ws_timeout(chunkOrder, action, startTime, endTime, duration, payload, meta)
-                    else:
-                        self.addData_done = True
-            else:
-                self.addData_done = True
+                    self.addData_done = True
+        finally:
+            self.memory.release("in_flight", held)
 
         # Sleep for the chunk duration as the data gets sent.
         # (This ensures we don't hit the rate limit)
@@ -527,6 +848,7 @@ class SimpleClient():
 
         # Close the websocket connection if all websocket processes are complete.
         await self.__handle_exit()
+        return int(status)
 
     async def __handle_ws_timeout(self, chunkOrder: str, action: str, startTime: str, endTime: str, duration: str,
                                   payload: bytes, meta: str):
@@ -546,17 +868,22 @@ class SimpleClient():
             duration {str} -- Chunk Duration (from DFX SDK)
             payload {bytes} -- Chunk Payload Data (from DFX SDK)
             meta {bytes} -- Chunk Payload Metadata (from DFX SDK)
+
+        Returns:
+            int -- Status of adding the chunk to the new measurement
         """
         # Need to wait until all previous chunks have been received
         while not self.sub_cycle_complete:  # Poll until subscribe is complete
             await asyncio.sleep(self.subscribe_poll)  # For polling
 
-        # Get results from previous measurement
-        _ = self.retrieve_results()
+        # Get results from previous measurement. Both calls are blocking REST
+        # requests, so they run in the default executor, off the event loop.
+        loop = asyncio.get_running_loop()
+        _ = await loop.run_in_executor(None, self.retrieve_results)
 
         # Creare a new measurement, and the subscribe signal is changed and
         # signalled to allow subscribe to continue on the new measurement.
-        self.measurement_id = self.create_new_measurement()
+        self.measurement_id = await loop.run_in_executor(None, self.create_new_measurement, False)
         self.sub_cycle_complete = False
         await asyncio.sleep(self.subscribe_signal)
 
@@ -566,14 +893,79 @@ class SimpleClient():
             response = await self.measurement.add_data_ws(self.measurement_id, chunkOrder, action, startTime, endTime,
                                                           duration, payload, meta)
             status = int(response[10:13].decode('utf-8'))
-            _ = response.decode('utf-8')
+            _ = response.decode('utf-8', errors='replace')
         else:
             response = await self.measurement.add_data_rest(self.measurement_id, chunkOrder, action, startTime, endTime,
                                                             duration, payload, meta)
             status = int(response.status_code)
-            _ = response.json()
-        if status != 200:
-            pass
+            _ = parse_json(response)
+        if status == 200:
+            self.__record_chunk(int(chunkOrder), self.measurement_id)
+        return status
+
+    def stream(self, chunks, buffer: int = 8, result_timeout: float = 60, shutdown: bool = True):
+        """Upload payloads from an (async) iterable and iterate over the
+        results as they arrive, with measurement creation, subscription and
+        rollover handled for the caller (see `Pipeline`).
+
+        ```python
+        async for result in client.stream(payloads):
+            ...
+        ```
+
+        Arguments:
+            chunks {AsyncIterable[libdfx.Payload] or Iterable[libdfx.Payload]} -- DFX SDK Payloads, in order
+
+        Keyword Arguments:
+            buffer {int} -- Payloads read ahead of the upload (default: {8})
+            result_timeout {float} -- Seconds to wait for further results after the last upload (default: {60})
+            shutdown {bool} -- Shut the client down when all results are in (default: {True})
+
+        Returns:
+            AsyncIterator[bytes] -- Result chunks
+        """
+        from .pipeline import Pipeline
+        return Pipeline(self, buffer, result_timeout, shutdown).run(chunks)
+
+    def long_session(self):
+        """The recording uploaded with this client as one logical recording
+        across all the measurements it was split into (see `LongSession`)
+
+        Returns:
+            LongSession -- Session over `session_index`
+        """
+        from .session import LongSession
+        return LongSession(self)
+
+    async def bulk_upload(self, chunks, concurrency: int = 4, result_timeout: float = 60, on_result=None) -> list:
+        """Upload a whole sequence of prepared chunks from an offline recording
+        as fast as possible, e.g. to reprocess `BATCH` or `VIDEO` archives.
+
+        Unlike `add_chunk`, uploads are not paced at the chunk duration. The
+        chunks are split into a new measurement at every `max_chunks`
+        boundary, and up to `concurrency` measurements are uploaded and
+        subscribed to at the same time (see `BulkUploader`). `chunks` is
+        read one measurement at a time, so it can be a generator over a
+        recording larger than memory.
+
+        Arguments:
+            chunks {Iterable[libdfx.Payload]} -- DFX SDK Payloads, in order
+
+        Keyword Arguments:
+            concurrency {int} -- Number of measurements uploaded at the same time (default: {4})
+            result_timeout {float} -- Seconds to wait for each measurement's results (default: {60})
+            on_result {callable} -- Called with the measurement ID and each result (bytes) as it arrives, instead
+                of collecting the results in the returned dicts (default: {None})
+
+        Returns:
+            list -- One dict per measurement with `measurement_id`, `chunks`, `results` and `errors`
+        """
+        from .bulkupload import BulkUploader
+        uploader = BulkUploader(self, concurrency=concurrency, result_timeout=result_timeout)
+        reports = await uploader.upload(chunks, on_result=on_result)
+        if reports:
+            self.measurement_id = reports[-1]["measurement_id"]
+        return reports
 
     # Retrieve results from current measurement
     def retrieve_results(self, token: str = '', measurement_id: str = ''):
@@ -606,6 +998,18 @@ class SimpleClient():
             res = self.measurement.retrieve(measurement_id=measurement_id)
         return res
 
+    def retrieve_results_stream(self, measurement_id: str = ''):
+        """Retrieve results like `retrieve_results`, parsing the response
+        incrementally while it is downloaded (see `Measurement.retrieve_stream`).
+
+        Keyword Arguments:
+            measurement_id {str} -- Measurement ID (default: {''}, the current measurement)
+
+        Returns:
+            RetrieveStream -- Iterable of `RetrieveRecord` (signal, entry)
+        """
+        return self.measurement.retrieve_stream(measurement_id=measurement_id or None)
+
     def clear(self):
         """Clear the values in the "default.config" file"""
         with open(self.config_file, mode='w') as f:
@@ -613,6 +1017,123 @@ class SimpleClient():
             d = json.dumps(data)
             f.write(d)
 
+    def failover(self) -> bool:
+        """Probe the candidate servers again (see `select_server`) and switch
+        to the best one if the current server is unreachable or clearly
+        slower. Measurements on the old server cannot be continued; create a
+        new one after switching.
+
+        Returns:
+            bool -- True if the client switched servers
+        """
+        if not self.selector:
+            return False
+        target = self.selector.should_fail_over(self.server)
+        if target is None:
+            return False
+
+        # Tokens are per server; `__setup` takes them from the config file
+        # or registers and logs in again. If that fails (e.g. the license is
+        # not valid there), the client stays on the current server.
+        previous = (self.server, self.server_url, self.websocket_url, self.device_token, self.user_token,
+                    self.user.user_token)
+        with self.__token_lock:
+            self.server = target
+            self.server_url = self.__valid_servers[target]["server_url"]
+            self.websocket_url = self.__valid_servers[target]["websocket_url"]
+            self.user.url = self.organization.server_url = self.server_url
+            self.device_token = self.user_token = self.user.user_token = ''
+            try:
+                self.__setup()
+            except BaseException:
+                (self.server, self.server_url, self.websocket_url, self.device_token, self.user_token,
+                 self.user.user_token) = previous
+                self.user.url = self.organization.server_url = self.server_url
+                raise
+        if self.refresher:
+            self.refresher.update(self.user_token)
+
+        # The old websocket may still be open, so the new server gets a new
+        # handler. The old ones release their frames from the memory budget
+        # now, and are closed on the loop they were opened on.
+        old_handlers = self.ws_handlers()
+        self.ws_obj = WebsocketHandler(self.user_token, self.websocket_url, health=self.health, budget=self.memory)
+        if self.results_ws:
+            self.results_ws = WebsocketHandler(self.user_token, self.websocket_url, budget=self.memory)
+        for old_ws in old_handlers:
+            old_ws.health = None  # Monitors the new handler from now on
+            old_ws.release()
+            if old_ws.ws and not old_ws.ws.closed:
+                try:
+                    asyncio.run_coroutine_threadsafe(old_ws.handle_close(), old_ws.loop)
+                except RuntimeError:
+                    pass  # The loop is closed, and the connection with it
+
+        self.measurement.url = self.server_url
+        self.warmer.url = self.server_url.rstrip('/') + '/status'  # Keep the new server's connections warm
+        self.measurement.ws_obj = self.ws_obj
+        self.measurement.results_ws = self.results_ws
+        if self.reaper:
+            self.reaper.ws_objs = self.ws_handlers()
+        self.__use_token(self.user_token)
+        self.measurement_id = ''
+        return True
+
+    def stats(self) -> dict:
+        """Runtime statistics of this client
+
+        Returns:
+            dict -- `connection`: websocket health (see `ConnectionHealth.stats`), or None if not monitored;
+                `http`: REST retry and circuit breaker counters (see `HttpClient.stats`); `memory`: see `memory_stats`;
+                `warmup`: keepalive counters (see `ConnectionWarmer.stats`), websocket closes for idleness and the
+                `error` of a failed `prewarm`; `loop`: event loop lag (see `LoopLagMonitor.stats`), or None if not
+                monitored; `session`: chunks and measurements in `session_index`, and acknowledged chunks it could not
+                record (`conflicts`)
+        """
+        return {
+            "connection": self.health.stats() if self.health else None,
+            "http": self.http.stats(),
+            "memory": self.memory_stats(),
+            "warmup": dict(self.warmer.stats(),
+                           ws_reaped=self.reaper.reaped,
+                           error=repr(self.warmup_error) if self.warmup_error else None),
+            "loop": self.loop_monitor.stats() if self.loop_monitor else None,
+            "session": {
+                "chunks": len(self.session_index),
+                "measurements": len(self.session_index.measurements()),
+                "conflicts": self.session_conflicts,
+            },
+        }
+
+    def memory_stats(self) -> dict:
+        """Bytes currently held in the client's buffers
+        (see `MemoryBudget.stats`)
+
+        Buffers are `in_flight` (payloads not yet acknowledged), `ws_acks`,
+        `ws_statuses` and `ws_results` (received websocket frames not yet
+        handled), `ws_unknown` (frames with an unknown ID, kept for
+        diagnostics), `received_data` (results not yet taken by the
+        application) and `result_sink` (results not yet written to disk).
+
+        Returns:
+            dict -- `limit`, `used`, `peak`, bytes per buffer in `buffers`, and eviction and wait counters
+        """
+        return self.memory.stats()
+
+    async def warmup(self):
+        """Open the connections the first chunk will need ahead of time:
+        `warm_connections` pooled REST connections and the websocket. They
+        are kept alive while idle and closed after `idle_timeout` seconds
+        without use, to be reopened on the next use.
+        """
+        self.__start_loop_monitor()
+        self.warmer.start(warm_now=False)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.warmer.warm)
+        if self.conn_method == "websocket" or self.conn_method == "ws":
+            await asyncio.gather(*(ws_obj.connect_ws() for ws_obj in self.ws_handlers()))
+            self.reaper.start()
+
     async def shutdown(self):
         """Gracefully shutdown SimpleClient"""
 
@@ -620,13 +1141,35 @@ class SimpleClient():
         # Then it closes the websocket.
         self.measurement.end = True
         self.addData_done = True
+        if self.warmup_task and not self.warmup_task.done():
+            self.warmup_task.cancel()
+            await asyncio.gather(self.warmup_task, return_exceptions=True)
         await asyncio.sleep(self.subscribe_signal)
-        await self.ws_obj.handle_close()
+        # Stopping the preparer, refresher, warmer and sink joins their
+        # processes or threads, which blocks, so it runs in the executor
+        loop = asyncio.get_running_loop()
+        try:
+            for ws_obj in self.ws_handlers():
+                await ws_obj.handle_close()
+            if self.preparer:
+                await loop.run_in_executor(None, self.preparer.shutdown)
+        finally:
+            if self.refresher:
+                await loop.run_in_executor(None, self.refresher.stop)
+            await loop.run_in_executor(None, self.warmer.stop)
+            self.reaper.stop()
+            if self.loop_monitor:
+                self.loop_monitor.stop()
+            # Last, so that an error writing the results cannot keep the
+            # threads and tasks above running
+            if self.sink:
+                await loop.run_in_executor(None, self.sink.close)
 
     # Handle exiting
     async def __handle_exit(self):
         if not self.complete:
             if self.addData_done and self.subscribe_done:
                 if self.conn_method == "websocket" or self.conn_method == "ws":
-                    await self.ws_obj.handle_close()
+                    for ws_obj in self.ws_handlers():
+                        await ws_obj.handle_close()
             self.complete = True
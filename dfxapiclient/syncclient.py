@@ -0,0 +1,154 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+
+from .simpleclient import SimpleClient
+
+
+class SyncClient():
+    """`SyncClient` is a blocking, thread-safe facade over `SimpleClient`
+    for synchronous code such as Flask handlers and worker threads.
+
+    It owns one long-lived event loop running in a background thread, so
+    the websocket connection survives between calls instead of being thrown
+    away by a fresh `asyncio.run` each time. Every method can be called from
+    any thread and returns a `concurrent.futures.Future`; call `.result()`
+    on it to block. Chunks added from several threads are sent one at a
+    time, in the order `add_chunk` was called.
+    """
+    def __init__(self, *args, **kwargs):
+        """Create a `SyncClient` object. The arguments are passed on to
+        `SimpleClient`, which is constructed for the background loop.
+        """
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.__run, name="dfxapiclient-loop", daemon=True)
+        self.thread.start()
+        self.closed = False
+
+        try:
+            self.client = self.__submit(self.__create(args, kwargs)).result()
+        except BaseException:
+            self.__stop()
+            raise
+
+    def __run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+        self.loop.close()
+
+    def __stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+    async def __create(self, args, kwargs):
+        # Registering and logging in are blocking REST calls, so the client
+        # is constructed in the executor, not on the loop
+        client = await self.loop.run_in_executor(None, self.__construct, args, kwargs)
+        self.__add_lock = asyncio.Lock()
+        if kwargs.get("prewarm"):
+            client.start_warmup()  # The executor thread had no running loop to start it on
+        return client
+
+    def __construct(self, args, kwargs):
+        # Queues created by the client belong to the background loop
+        asyncio.set_event_loop(self.loop)
+        try:
+            return SimpleClient(*args, **kwargs)
+        finally:
+            asyncio.set_event_loop(None)
+
+    def __submit(self, coro) -> Future:
+        if self.closed:
+            coro.close()
+            raise RuntimeError("SyncClient is closed")
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    async def __blocking(self, fn, *args):
+        # REST calls block, so they run in the loop's executor rather than
+        # on the loop itself.
+        return await self.loop.run_in_executor(None, fn, *args)
+
+    def create_measurement(self) -> Future:
+        """Create a new measurement (see `SimpleClient.create_new_measurement`)
+
+        Returns:
+            Future -- Resolves to the measurement ID
+        """
+        return self.__submit(self.__blocking(self.client.create_new_measurement))
+
+    def add_chunk(self, chunk, token: str = '', measurement_id: str = '') -> Future:
+        """Add one chunk of data to a measurement (see `SimpleClient.add_chunk`)
+
+        Arguments:
+            chunk {libdfx.Payload} -- DFX SDK Payload
+
+        Keyword Arguments:
+            token {str} -- User or device token(default: {''})
+            measurement_id {str} -- Measurement ID (default: {''})
+
+        Returns:
+            Future -- Resolves to the status of the add data request once the chunk has been sent
+        """
+        return self.__submit(self.__add_chunk(chunk, token, measurement_id))
+
+    async def __add_chunk(self, chunk, token: str, measurement_id: str):
+        # `SimpleClient.add_chunk` expects a single producer
+        async with self.__add_lock:
+            return await self.client.add_chunk(chunk, token=token, measurement_id=measurement_id)
+
+    def subscribe(self, token: str = '', measurement_id: str = '') -> Future:
+        """Subscribe to results (see `SimpleClient.subscribe_to_results`).
+        Results are collected with `get_result()`.
+
+        Keyword Arguments:
+            token {str} -- User or device token(default: {''})
+            measurement_id {str} -- Measurement ID (default: {''})
+
+        Returns:
+            Future -- Resolves once all results have been received
+        """
+        return self.__submit(self.client.subscribe_to_results(token=token, measurement_id=measurement_id))
+
+    def get_result(self, timeout: float = None) -> bytes:
+        """Block until the next result chunk is received and return it
+
+        Keyword Arguments:
+            timeout {float} -- Seconds to wait (default: {None}, wait forever)
+
+        Raises:
+            concurrent.futures.TimeoutError: If no result arrived in time
+        """
+        future = self.__submit(self.client.received_data.get())
+        try:
+            return future.result(timeout)
+        except BaseException:
+            future.cancel()
+            raise
+
+    def retrieve(self, token: str = '', measurement_id: str = '') -> Future:
+        """Retrieve results from a measurement (see `SimpleClient.retrieve_results`)
+
+        Keyword Arguments:
+            token {str} -- User or device token(default: {''})
+            measurement_id {str} -- Measurement ID (default: {''})
+
+        Returns:
+            Future -- Resolves to the JSON decoded results
+        """
+        return self.__submit(self.__blocking(self.client.retrieve_results, token, measurement_id))
+
+    def close(self):
+        """Shut down the client and stop the background loop"""
+        if self.closed:
+            return
+        try:
+            self.__submit(self.client.shutdown()).result()
+        finally:
+            self.closed = True
+            self.__stop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,123 @@
+import base64
+import json
+import threading
+import time
+
+
+def token_claims(token: str) -> dict:
+    """Decode the claims of a JWT without verifying its signature
+
+    Arguments:
+        token {str} -- Token
+
+    Returns:
+        dict -- Claims, or an empty dict if the token is not a JWT
+    """
+    parts = token.split('.') if token else []
+    if len(parts) != 3:
+        return {}
+    try:
+        payload = parts[1] + '=' * (-len(parts[1]) % 4)
+        claims = json.loads(base64.urlsafe_b64decode(payload))
+    except ValueError:
+        return {}
+    return claims if isinstance(claims, dict) else {}
+
+
+def token_expiry(token: str) -> float:
+    """Expiry time of a JWT from its `exp` claim
+
+    Arguments:
+        token {str} -- Token
+
+    Returns:
+        float -- Seconds since the epoch, or None if the token does not expire or is not a JWT
+    """
+    exp = token_claims(token).get("exp")
+    return float(exp) if isinstance(exp, (int, float)) else None
+
+
+class TokenRefresher():
+    """`TokenRefresher` renews a token in a background thread before it expires.
+
+    The token is renewed `lead_time` seconds before its `exp` claim, or
+    half way through its remaining lifetime if that is shorter. Failed
+    refreshes are retried with exponential backoff. Tokens without an
+    expiry are never refreshed.
+    """
+    def __init__(self, refresh, token: str = '', lead_time: float = 300, retry_interval: float = 5,
+                 max_retry_interval: float = 60):
+        """Create a `TokenRefresher` object and start its thread
+
+        Arguments:
+            refresh {callable} -- Called without arguments to obtain and install a new token, which it returns
+
+        Keyword Arguments:
+            token {str} -- Current token (default: {''})
+            lead_time {float} -- Seconds before expiry to refresh (default: {300})
+            retry_interval {float} -- Seconds before retrying a failed refresh, doubling each time (default: {5})
+            max_retry_interval {float} -- Upper bound of the retry interval (default: {60})
+        """
+        self.refresh = refresh
+        self.lead_time = lead_time
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+
+        self.refreshes = 0
+        self.failures = 0
+        self.last_error = None
+
+        self.__lock = threading.Lock()
+        self.__changed = threading.Event()
+        self.__stopped = False
+        self.__expiry = None
+        self.__refresh_at = None
+        self.update(token)
+
+        self.__thread = threading.Thread(target=self.__run, name="dfxapiclient-tokenrefresh", daemon=True)
+        self.__thread.start()
+
+    @property
+    def expiry(self) -> float:
+        """Expiry time of the current token, or None"""
+        return self.__expiry
+
+    def update(self, token: str):
+        """Track a token obtained elsewhere, e.g. by a login"""
+        with self.__lock:
+            self.__expiry = token_expiry(token)
+            if self.__expiry is None:
+                self.__refresh_at = None
+            else:
+                remaining = self.__expiry - time.time()
+                self.__refresh_at = self.__expiry - min(self.lead_time, max(remaining, 0) / 2)
+        self.__changed.set()
+
+    def stop(self):
+        """Stop the refresh thread"""
+        self.__stopped = True
+        self.__changed.set()
+        self.__thread.join()
+
+    def __run(self):
+        delay = self.retry_interval
+        while not self.__stopped:
+            with self.__lock:
+                refresh_at = self.__refresh_at
+            wait = None if refresh_at is None else max(0, refresh_at - time.time())
+            if self.__changed.wait(wait):
+                self.__changed.clear()
+                continue  # A new token or stop; recompute
+            try:
+                token = self.refresh()
+            except Exception as e:
+                self.failures += 1
+                self.last_error = e
+                if self.__changed.wait(delay):
+                    self.__changed.clear()
+                delay = min(delay * 2, self.max_retry_interval)
+                continue
+            delay = self.retry_interval
+            self.refreshes += 1
+            self.update(token)
+            self.__changed.clear()
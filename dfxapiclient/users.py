@@ -1,6 +1,6 @@
 import json
 
-import requests
+from .resilience import default_client, parse_json
 
 
 # 2
@@ -23,7 +23,8 @@ class User:
                  gender: str = '',
                  dateofbirth: str = '',
                  height: str = '',
-                 weight: str = ''):
+                 weight: str = '',
+                 http=None):
         """Create a User object
 
         Arguments:
@@ -39,6 +40,7 @@ class User:
             dateofbirth {str} -- Date of birth (default: {''})
             height {str} -- Height (cm) (default: {''})
             weight {str} -- Weight (kg) (default: {''})
+            http {HttpClient} -- Client sending the requests, with retries (default: {None}, the shared one)
         """
         self.firstname = firstname
         self.lastname = lastname
@@ -65,6 +67,7 @@ class User:
         self.user_token = ''
         self.url = url
         self.header = ''
+        self.http = http or default_client()
 
     def __update_token(self, token):
         self.token = token
@@ -103,10 +106,10 @@ class User:
         header = {'Content-Type': 'application/json', 'Authorization': auth}
 
         uri = self.url + '/users'
-        r = requests.post(uri, data=values, headers=header)
-        res = r.json()
+        r = self.http.request('POST', uri, idempotent=False, data=values, headers=header)
+        res = parse_json(r)
         if 'ID' not in res:
-            return res['Code']
+            return res.get('Code', f"HTTP_{r.status_code}")
 
         self.user_id = res['ID']
         return self.user_id
@@ -135,11 +138,11 @@ class User:
         header = {'Content-Type': 'application/json', 'Authorization': auth}
 
         uri = self.url + '/users/auth'
-        r = requests.post(uri, data=values, headers=header)
-        res = r.json()
+        r = self.http.request('POST', uri, data=values, headers=header)
+        res = parse_json(r)
 
         if 'Token' not in res:
-            return res['Code']
+            return res.get('Code', f"HTTP_{r.status_code}")
 
         self.user_token = res['Token']
         self.__update_token(self.user_token)
@@ -155,8 +158,8 @@ class User:
         """
         # [ 202, "1.0", "GET", "retrieve", "/users" ]
         uri = self.url + '/users'
-        r = requests.get(uri, headers=self.header)
-        return r.json()
+        r = self.http.request('GET', uri, hedge=True, headers=self.header)
+        return parse_json(r)
 
     # 206
     def remove(self):
@@ -168,8 +171,8 @@ class User:
         """
         # [ 206, "1.0", "DELETE", "remove", "/users" ]
         uri = self.url + '/users'
-        r = requests.delete(uri, headers=self.header)
-        return r.json()
+        r = self.http.request('DELETE', uri, headers=self.header)
+        return parse_json(r)
 
     # 211
     def getRole(self):
@@ -181,5 +184,5 @@ class User:
         """
         # [ 211, "1.0", "GET", "getRole", "/users/role" ]
         uri = self.url + '/users/role'
-        r = requests.get(uri, headers=self.header)
-        return r.json()
+        r = self.http.request('GET', uri, hedge=True, headers=self.header)
+        return parse_json(r)
@@ -0,0 +1,151 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ConnectionWarmer():
+    """`ConnectionWarmer` opens pooled REST connections ahead of use and
+    keeps them open while the client is idle.
+
+    `warm()` sends `connections` concurrent `GET /status` requests, so that
+    the `HttpClient`'s pool holds that many connections with DNS, TCP and
+    TLS already done. A background thread then repeats this every
+    `keepalive_interval` seconds, before the server closes them for being
+    idle. Once the client has not sent a request of its own for
+    `idle_timeout` seconds, the pooled connections are closed (reaped) and
+    kept closed until the client is used again.
+
+    The websocket side is `WebsocketReaper`.
+    """
+    def __init__(self, http, url: str, connections: int = 2, keepalive_interval: float = 30,
+                 idle_timeout: float = 300):
+        """Create a `ConnectionWarmer` object
+
+        Arguments:
+            http {HttpClient} -- Client whose connection pool is warmed
+            url {str} -- REST URL of the server
+
+        Keyword Arguments:
+            connections {int} -- Connections to keep open (default: {2})
+            keepalive_interval {float} -- Seconds between keepalive requests (default: {30})
+            idle_timeout {float} -- Seconds without a request after which the connections are closed
+                (default: {300})
+        """
+        self.http = http
+        self.url = url.rstrip('/') + '/status'
+        self.connections = connections
+        self.keepalive_interval = keepalive_interval
+        self.idle_timeout = idle_timeout
+
+        self.warmed = 0  # Keepalive rounds
+        self.reaped = 0  # Times the idle connections were closed
+        self.failures = 0
+
+        self.__pool = ThreadPoolExecutor(connections, thread_name_prefix="dfxapiclient-warmup")
+        self.__stopped = threading.Event()
+        self.__thread = None
+        self.__reaped = False
+
+    def warm(self) -> int:
+        """Open (or refresh) the pooled connections now
+
+        Returns:
+            int -- Number of connections that answered
+        """
+        def ping(_):
+            try:
+                response = self.http.session.get(self.url, timeout=self.http.timeout)
+                response.close()  # Back into the pool
+                return True
+            except OSError:
+                return False
+
+        ok = sum(self.__pool.map(ping, range(self.connections)))
+        self.failures += self.connections - ok
+        self.warmed += 1
+        self.__reaped = False
+        return ok
+
+    def start(self, warm_now: bool = True):
+        """Keep the connections warm in a background thread
+
+        Keyword Arguments:
+            warm_now {bool} -- Warm them right away in the thread, instead of only after `keepalive_interval`
+                (default: {True})
+        """
+        if self.__thread is None:
+            self.__thread = threading.Thread(target=self.__run,
+                                             args=(warm_now, ),
+                                             name="dfxapiclient-keepalive",
+                                             daemon=True)
+            self.__thread.start()
+
+    def stop(self):
+        """Stop the background thread"""
+        self.__stopped.set()
+        if self.__thread:
+            self.__thread.join()
+        self.__pool.shutdown()
+
+    def __run(self, warm_now: bool):
+        if warm_now:
+            self.warm()
+        while not self.__stopped.wait(self.keepalive_interval):
+            idle = time.monotonic() - self.http.last_used
+            if idle < self.idle_timeout:
+                self.warm()
+            elif not self.__reaped:
+                for adapter in self.http.session.adapters.values():
+                    adapter.close()  # Pools are recreated on the next request
+                self.__reaped = True
+                self.reaped += 1
+
+    def stats(self) -> dict:
+        """Keepalive counters
+
+        Returns:
+            dict -- Keepalive rounds `warmed`, times `reaped`, failed `failures`, and whether `idle` (reaped)
+        """
+        return {"warmed": self.warmed, "reaped": self.reaped, "failures": self.failures, "idle": self.__reaped}
+
+
+class WebsocketReaper():
+    """`WebsocketReaper` closes the websocket of each `WebsocketHandler` after
+    it was idle (nothing sent or received, and no receive pending) for
+    `idle_timeout` seconds. It is reopened lazily on the next use.
+    """
+    def __init__(self, ws_objs: list, idle_timeout: float = 300):
+        """Create a `WebsocketReaper` object
+
+        Arguments:
+            ws_objs {list} -- Handlers whose websockets are watched
+
+        Keyword Arguments:
+            idle_timeout {float} -- Seconds of inactivity before the websocket is closed (default: {300})
+        """
+        self.ws_objs = ws_objs
+        self.idle_timeout = idle_timeout
+        self.reaped = 0
+        self.task = None
+
+    def start(self):
+        """Start watching, on the running event loop"""
+        if self.task is None:
+            self.task = asyncio.ensure_future(self.__run())
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+
+    async def __run(self):
+        while True:
+            await asyncio.sleep(min(self.idle_timeout / 4, 30))
+            for ws_obj in list(self.ws_objs):
+                ws = ws_obj.ws
+                if ws is None or ws.closed or not ws_obj.recv:  # Closed already, or a receive is pending
+                    continue
+                if time.monotonic() - ws_obj.last_used > self.idle_timeout:
+                    await ws.close()
+                    self.reaped += 1
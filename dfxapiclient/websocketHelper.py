@@ -1,6 +1,11 @@
+import asyncio
+import time
 import uuid
+from collections import OrderedDict
 
-import websockets
+from .memory import DiagnosticBuffer, FrameBuffer, MemoryBudget
+
+_MAX_REQUEST_IDS = 1024  # Recent request IDs whose replies are expected
 
 
 class WebsocketHandler():
@@ -9,12 +14,17 @@ class WebsocketHandler():
     It handles all the calls and responses. Also, it enables sending and
     receiving all in one WebSocket connection, through asynchronous programming.
     """
-    def __init__(self, token: str, websocket_url: str):
+    def __init__(self, token: str, websocket_url: str, record_file: str = None, health=None, budget=None):
         """Create a `WebsocketHandler` object.
 
         Arguments:
             token {str} -- user token or device token
             websocket_url {str} -- DFX API Websocket URL
+
+        Keyword Arguments:
+            record_file {str} -- Record all frames into this file (default: {None})
+            health {ConnectionHealth} -- Monitor pinging the connection and tracking its RTT (default: {None})
+            budget {MemoryBudget} -- Account received frames against this budget (default: {None}, unlimited)
         """
         # Create the header by formatting the token, and generates a 10-digit
         # WebSocket ID.
@@ -22,28 +32,90 @@ class WebsocketHandler():
         self.ws_url = websocket_url
         self.headers = dict(Authorization="Bearer {}".format(self.token))
         self.ws = None
+        self.loop = None  # Event loop the connection was opened on
+        self.connecting = None  # Lock so that concurrent callers share one connection
         self.ws_ID = uuid.uuid4().hex[:10]  # Use same ws_ID for all connections
+        self.last_used = time.monotonic()  # Last send or receive, for closing an idle connection
 
         # Use this to form a mutual exclusion lock
         self.recv = True
 
-        # Lists for tracking return values
-        self.addDataStats = []
-        self.subscribeStats = []
-        self.chunks = []
-        self.unknown = {}  # For storing messages not coming from a known websocket sender
+        # FIFOs for tracking return values, accounted against the memory
+        # budget. Frames with an unknown ID are only kept for diagnostics and
+        # are evicted, oldest first, when the budget is exceeded.
+        self.budget = budget or MemoryBudget()
+        self.addDataStats = FrameBuffer(self.budget, "ws_acks")
+        self.subscribeStats = FrameBuffer(self.budget, "ws_statuses")
+        self.chunks = FrameBuffer(self.budget, "ws_results")
+        self.unknown = DiagnosticBuffer(self.budget, "ws_unknown")  # Messages not from a known websocket sender
+
+        # Request IDs of the most recent requests sent. Replies echo the
+        # request ID, so only frames matching none of them are unknown.
+        self.request_ids = OrderedDict()
+
+        self.health = health
+
+        self.recorder = None
+        if record_file:
+            self.start_recording(record_file)
+
+    def start_recording(self, path: str):
+        """Record every sent and received frame with timestamps into `path`.
+
+        The recording can be played back with `wsrecord.ReplayWebsocketHandler`.
+
+        Arguments:
+            path {str} -- Path of the recording
+        """
+        from .wsrecord import FrameRecorder
+        self.stop_recording()
+        self.recorder = FrameRecorder(path)
+
+    def stop_recording(self):
+        """Stop recording and close the recording file"""
+        if self.recorder:
+            self.recorder.close()
+            self.recorder = None
 
     async def connect_ws(self):
-        """Connect to the Websocket."""
-        self.ws = await self.handle_connect()
+        """Connect to the Websocket.
+
+        `add_chunk` and `subscribe_to_results` both connect lazily, so when
+        they start together only the first caller opens a connection and the
+        other one waits for it.
+        """
+        if self.connecting is None:
+            self.connecting = asyncio.Lock()
+        async with self.connecting:
+            if self.ws is None or self.ws.closed:
+                self.ws = await self.handle_connect()
+                self.loop = asyncio.get_running_loop()
+                if self.health:
+                    self.health.start(self.ws)
 
     async def handle_connect(self):
         """Return a connected Websocket."""
-        return await websockets.client.connect(self.ws_url, extra_headers=self.headers)
+        import websockets  # Only needed once a websocket is actually used
+
+        # With a `ConnectionHealth` monitor the keepalive pings are its own
+        if self.health:
+            return await websockets.connect(self.ws_url, extra_headers=self.headers, max_size=None, ping_interval=None)
+        return await websockets.connect(self.ws_url, extra_headers=self.headers, max_size=None)
 
     async def handle_close(self):
         """Close the Websocket"""
-        await self.ws.close()
+        if self.health:
+            self.health.stop()
+        if self.ws:  # Never connected when only REST was used
+            await self.ws.close()
+        self.release()
+
+    def release(self):
+        """Stop recording and release all buffered frames from the memory budget"""
+        self.stop_recording()
+        for buffer in (self.addDataStats, self.subscribeStats, self.chunks):
+            buffer.clear()
+        self.unknown.close()
 
     async def handle_send(self, content):
         """Send a message on the Websocket
@@ -51,6 +123,14 @@ class WebsocketHandler():
         Arguments:
             content -- Content to send
         """
+        # Recorded before sending, so that a reply can never be logged ahead
+        # of the request that caused it.
+        if self.recorder:
+            self.recorder.write(self.recorder.SENT, content)
+        self.last_used = time.monotonic()
+        self.request_ids[bytes(content[4:14])] = None  # `[ action:4 ][ request ID:10 ][ body ]`
+        if len(self.request_ids) > _MAX_REQUEST_IDS:
+            self.request_ids.popitem(last=False)
         await self.ws.send(content)
 
     async def handle_recieve(self):
@@ -75,26 +155,37 @@ class WebsocketHandler():
         #         break
         # ```
 
+        # The lock is released in a `finally` so that a caller cancelled by
+        # `asyncio.wait_for` does not leave it held, and a caller that finds
+        # the lock held yields to the event loop so its polling loop cannot
+        # starve the current holder.
+
         if self.recv:
             # Mutual exclusion lock; prevents multiple calls of recv() on the same websocket connection
             self.recv = False
-            response = await self.ws.recv()
-            self.recv = True
+            try:
+                response = await self.ws.recv()
+            finally:
+                self.recv = True
+                self.last_used = time.monotonic()
+            if self.recorder:
+                self.recorder.write(self.recorder.RECEIVED, response)
         else:
+            await asyncio.sleep(0)
             return
 
         # If there is a `response`, it first decodes the `wsID` from the
         # response by calling `wsID = response[0:10].decode('utf-8')`.
         # (Reminder that all DFX API websocket responses come in the form
         # `Buffer( [ string:10 ][ string:3 ][ string/buffer ] )`). If the
-        # `wsID` is not recognized (i.e. not equal to the `self.ws_ID` for the
-        # current connection), we store the wsID and response body into a
-        # dictionary called `self.unknown`.
+        # `wsID` is not recognized (i.e. neither the `self.ws_ID` for the
+        # current connection nor the ID of a recent request), we store the
+        # wsID and response body into a dictionary called `self.unknown`.
 
         if response:
             wsID = response[0:10].decode('utf-8')
             # Sort out response messages by type
-            if wsID != self.ws_ID:
+            if wsID != self.ws_ID and response[0:10] not in self.request_ids:
                 self.unknown[wsID] = response
 
             # Finally, we need to sort the responses by type, to determine
@@ -0,0 +1,226 @@
+import asyncio
+import queue
+import struct
+import threading
+import time
+
+from .websocketHelper import WebsocketHandler
+
+MAGIC = b'DFXWSREC\x01'
+SENT = 0
+RECEIVED = 1
+
+# Frame header: direction (1 byte), microseconds since the recording
+# started (8 bytes) and frame length (4 bytes), followed by the raw frame.
+_HEADER = struct.Struct('<BQI')
+
+# Frames are buffered and handed to the writer thread in blocks of about
+# this many bytes, so the event loop never waits on the file
+_BLOCK_SIZE = 64 * 1024
+
+
+class FrameRecorder():
+    """`FrameRecorder` writes websocket frames with timestamps into a compact
+    binary log, which can be read back with `read_frames()` and replayed with
+    `ReplayWebsocketHandler`.
+
+    Frames are collected in memory and written to the file by a background
+    thread; the log is complete once `close()` returns.
+    """
+    SENT = SENT
+    RECEIVED = RECEIVED
+
+    def __init__(self, path: str):
+        """Create a `FrameRecorder` object and open the log for writing
+
+        Arguments:
+            path {str} -- Path of the recording
+        """
+        self.path = path
+        self.file = open(path, 'wb')
+        self.file.write(MAGIC)
+        self.start = time.perf_counter()
+        self.frames = 0
+
+        self.buffer = []
+        self.buffered = 0
+        self.error = None
+        self.blocks = queue.Queue()
+        self.thread = threading.Thread(target=self.__write_blocks, name="dfxapiclient-recorder", daemon=True)
+        self.thread.start()
+
+    def __write_blocks(self):
+        while True:
+            block = self.blocks.get()
+            if block is None:
+                return
+            if self.error is None:
+                try:
+                    self.file.writelines(block)
+                except OSError as e:
+                    self.error = e
+
+    def write(self, direction: int, frame):
+        """Append one frame to the log
+
+        Arguments:
+            direction {int} -- `SENT` or `RECEIVED`
+            frame {Union[bytes, str]} -- Frame content
+        """
+        if isinstance(frame, str):
+            frame = frame.encode('utf-8')
+        elapsed_us = int((time.perf_counter() - self.start) * 1e6)
+        self.buffer.append(_HEADER.pack(direction, elapsed_us, len(frame)))
+        self.buffer.append(bytes(frame))
+        self.buffered += _HEADER.size + len(frame)
+        self.frames += 1
+        if self.buffered >= _BLOCK_SIZE:
+            self.__flush()
+
+    def __flush(self):
+        if self.buffer:
+            self.blocks.put(self.buffer)
+            self.buffer, self.buffered = [], 0
+
+    def close(self):
+        """Write the remaining frames and close the log
+
+        Raises:
+            OSError: If writing the log failed
+        """
+        if self.file.closed:
+            return
+        self.__flush()
+        self.blocks.put(None)
+        self.thread.join()
+        self.file.close()
+        if self.error is not None:
+            raise self.error
+
+
+def read_frames(path: str) -> list:
+    """Read a recording made by `FrameRecorder`
+
+    Arguments:
+        path {str} -- Path of the recording
+
+    Raises:
+        ValueError: If the file is not a websocket recording
+
+    Returns:
+        list -- `(direction, seconds, frame)` tuples in recorded order
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    if not data.startswith(MAGIC):
+        raise ValueError(f"{path} is not a websocket recording")
+
+    frames = []
+    offset = len(MAGIC)
+    view = memoryview(data)
+    while offset + _HEADER.size <= len(data):
+        direction, elapsed_us, length = _HEADER.unpack_from(data, offset)
+        offset += _HEADER.size
+        frames.append((direction, elapsed_us / 1e6, bytes(view[offset:offset + length])))
+        offset += length
+    return frames
+
+
+class ReplayConnection():
+    """A stand-in for a websocket connection that plays back the received
+    frames of a recording.
+
+    Each received frame is released only after the client has sent as many
+    frames as had been sent before it in the recording, so replies never
+    overtake the requests that caused them. With `speed` > 0 the frame is
+    then held back by its recorded delay after that send, divided by
+    `speed`; with `speed` = 0 frames are delivered as fast as possible.
+    """
+    def __init__(self, frames: list, speed: float = 1.0):
+        """Create a `ReplayConnection` object
+
+        Arguments:
+            frames {list} -- Frames as returned by `read_frames()`
+
+        Keyword Arguments:
+            speed {float} -- Replay speed factor, 0 for as fast as possible (default: {1.0})
+        """
+        self.speed = speed
+        self.closed = False
+        self.sent = []
+
+        # For every received frame, note how many sends preceded it and the
+        # recorded time of the last of those sends.
+        self.received = []
+        sends, gate_time = 0, 0.0
+        for direction, t, frame in frames:
+            if direction == SENT:
+                sends += 1
+                gate_time = t
+            else:
+                self.received.append((sends, t - gate_time, frame))
+
+        self.position = 0
+        self.send_times = [time.perf_counter()]  # Index n: time of the n-th send (0: connect)
+        self.changed = asyncio.Event()
+
+    async def send(self, content):
+        if self.closed:
+            raise ConnectionError("Replay connection is closed")
+        self.sent.append(content)
+        self.send_times.append(time.perf_counter())
+        self.changed.set()
+
+    async def recv(self):
+        if self.position >= len(self.received):
+            # The recording is exhausted; behave like a silent server
+            while not self.closed:
+                self.changed.clear()
+                await self.changed.wait()
+        if self.closed:
+            raise ConnectionError("Replay connection is closed")
+
+        sends, delay, frame = self.received[self.position]
+        while len(self.send_times) <= sends:
+            self.changed.clear()
+            await self.changed.wait()
+            if self.closed:
+                raise ConnectionError("Replay connection is closed")
+
+        if self.speed > 0:
+            wait = self.send_times[sends] + delay / self.speed - time.perf_counter()
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+        self.position += 1
+        return frame
+
+    async def close(self):
+        self.closed = True
+        self.changed.set()
+
+
+class ReplayWebsocketHandler(WebsocketHandler):
+    """A `WebsocketHandler` whose transport is a recording instead of a
+    network connection.
+
+    Pass it to `Measurement` in place of a `WebsocketHandler` to drive
+    `subscribeResults` and `add_data_ws` with recorded production traffic.
+    """
+    def __init__(self, path: str, speed: float = 1.0, token: str = ''):
+        """Create a `ReplayWebsocketHandler` object
+
+        Arguments:
+            path {str} -- Path of a recording made with `WebsocketHandler.start_recording()`
+
+        Keyword Arguments:
+            speed {float} -- Replay speed factor, 0 for as fast as possible (default: {1.0})
+            token {str} -- User or device token (default: {''})
+        """
+        super().__init__(token, 'replay://' + path)
+        self.frames = read_frames(path)
+        self.speed = speed
+
+    async def handle_connect(self):
+        """Return a connection replaying the recording."""
+        return ReplayConnection(self.frames, self.speed)
@@ -5,6 +5,15 @@ setup(
     version='1.2.0',
     packages=['dfxapiclient'],
     install_requires=['protobuf', 'requests', 'websockets'],
+    extras_require={'columnar': ['numpy']},
     setup_requires=['wheel'],
+    entry_points={
+        'console_scripts': [
+            'dfx-loadgen=dfxapiclient.loadgen:main',
+            'dfx-ingest=dfxapiclient.ingest:main',
+            'dfx-archive=dfxapiclient.archive:main',
+            'dfx-provision=dfxapiclient.provision:main',
+        ],
+    },
     description='The DFX API Python SimpleClient is a minimal client for the DeepAffex API.',
 )
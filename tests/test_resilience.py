@@ -0,0 +1,127 @@
+"""Retry and circuit breaker behaviour against a fault-injecting `MockServer`"""
+import time
+
+import pytest
+import requests
+
+from dfxapiclient.mockserver import MockServer
+from dfxapiclient.resilience import CircuitBreaker, CircuitOpenError, HttpClient, RetryPolicy
+from dfxapiclient.users import User
+
+
+@pytest.fixture(scope="module")
+def server():
+    with MockServer(seed=1) as server:
+        yield server
+
+
+@pytest.fixture(scope="module")
+def header(server):
+    http = HttpClient(RetryPolicy(max_attempts=1))
+    device_token = server.new_token()
+    user = User(server.rest_url, '', '', "test@example.com", "password", http=http)
+    user.create(device_token)
+    return {'Authorization': 'Bearer ' + user.login(device_token)}
+
+
+def faulty(server, faults, rate=1.0):
+    server.faults, server.fault_rate, server.faults_injected = faults, rate, 0
+
+
+@pytest.fixture(autouse=True)
+def no_faults(server):
+    yield
+    faulty(server, ("503", ), rate=0.0)
+
+
+def test_get_retried_until_max_attempts(server, header):
+    faulty(server, ("503", ))
+    http = HttpClient(RetryPolicy(max_attempts=3, base_delay=0.001), failure_threshold=100)
+    response = http.request('GET', server.rest_url + '/users', headers=header)
+    assert response.status_code == 503
+    assert http.policy.retries == 2
+    assert server.faults_injected == 3
+
+
+def test_retry_succeeds_after_fault(server, header):
+    faulty(server, ("503", ), rate=0.5)
+    http = HttpClient(RetryPolicy(max_attempts=10, base_delay=0.001, budget_max=100), failure_threshold=100)
+    for _ in range(10):
+        assert http.request('GET', server.rest_url + '/users', headers=header).status_code == 200
+    assert http.policy.retries == server.faults_injected > 0
+
+
+def test_retry_budget_exhausted(server, header):
+    faulty(server, ("503", ))
+    policy = RetryPolicy(max_attempts=5, base_delay=0.001, budget_ratio=0, budget_max=2)
+    http = HttpClient(policy, failure_threshold=100)
+    response = http.request('GET', server.rest_url + '/users', headers=header)
+    assert response.status_code == 503
+    assert policy.retries == 2
+    assert policy.budget_exhausted == 1
+    assert server.faults_injected == 3
+
+
+def test_post_retried_on_503(server, header):
+    # A 503 from the API means the request was not processed
+    faulty(server, ("503", ))
+    http = HttpClient(RetryPolicy(max_attempts=3, base_delay=0.001), failure_threshold=100)
+    http.request('POST', server.rest_url + '/measurements', idempotent=False, headers=header, json={})
+    assert server.faults_injected == 3
+
+
+@pytest.mark.parametrize("fault", ["502_html", "reset"])
+def test_post_not_retried_once_body_may_be_processed(server, header, fault):
+    faulty(server, (fault, ))
+    http = HttpClient(RetryPolicy(max_attempts=3, base_delay=0.001), failure_threshold=100)
+    try:
+        response = http.request('POST', server.rest_url + '/measurements', idempotent=False, headers=header, json={})
+        assert response.status_code == 502
+    except requests.exceptions.ConnectionError:
+        assert fault == "reset"
+    assert http.policy.retries == 0
+    assert server.faults_injected == 1
+
+
+def test_breaker_opens_half_opens_and_closes(server, header):
+    faulty(server, ("503", ))
+    http = HttpClient(RetryPolicy(max_attempts=1), failure_threshold=2, reset_timeout=0.1)
+    breaker = http.breaker(server.rest_url)
+    for _ in range(2):
+        http.request('GET', server.rest_url + '/users', headers=header)
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        http.request('GET', server.rest_url + '/users', headers=header)
+    assert server.faults_injected == 2  # Failed fast, without a request
+
+    # Half open after `reset_timeout`; a failed trial opens it again
+    time.sleep(0.15)
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    # A successful trial closes it
+    time.sleep(0.15)
+    faulty(server, ("503", ), rate=0.0)
+    assert http.request('GET', server.rest_url + '/users', headers=header).status_code == 200
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+class _UndecodableAdapter(requests.adapters.HTTPAdapter):
+    """Fails every request with an error other than a connection error or timeout"""
+    def send(self, request, **kwargs):
+        raise requests.exceptions.ContentDecodingError("undecodable body")
+
+
+def test_breaker_reopens_on_other_errors(server, header):
+    http = HttpClient(RetryPolicy(max_attempts=1), failure_threshold=1, reset_timeout=0.1)
+    http.session.mount(server.rest_url, _UndecodableAdapter())
+    for _ in range(2):
+        with pytest.raises(requests.exceptions.ContentDecodingError):
+            http.request('GET', server.rest_url + '/users', headers=header)
+        assert http.breaker(server.rest_url).state == CircuitBreaker.OPEN
+        time.sleep(0.15)
+    http.session.mount(server.rest_url, requests.adapters.HTTPAdapter())
+    assert http.request('GET', server.rest_url + '/users', headers=header).status_code == 200
+    assert http.breaker(server.rest_url).state == CircuitBreaker.CLOSED